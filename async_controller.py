@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+from control_loop import ControlLoop
+from intersection import Intersection
+from scheduler import Scheduler
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class AsyncController:
+    """
+    A class controlling many intersections from a single asyncio event loop.
+
+    The deadlines of the current phases of all the intersections are kept in one heap, and a single timer
+    of the event loop is armed for the earliest of them. Intersections can be added and removed while running,
+    from the event loop's thread.
+    """
+
+    def __init__(self):
+        """Initialize an AsyncController object."""
+        self.control_loops: Dict[Hashable, ControlLoop] = {}
+        self.deadlines: List[Tuple[float, int, Hashable]] = []
+        self.scheduled: Dict[Hashable, int] = {}
+        self.counter = itertools.count()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stopped: Optional[asyncio.Future] = None
+
+    def add_intersection(self, key: Hashable, intersection: Intersection, scheduler: Scheduler, duration=0):
+        """Add an intersection to control, its first phase is decided right away.
+
+        Args:
+            key (Hashable): A unique key of the intersection.
+            intersection (Intersection): The intersection to control.
+            scheduler (Scheduler): The scheduler of the intersection.
+            duration: The green duration for schedulers that don't decide it.
+        """
+        if key in self.control_loops:
+            raise ValueError(f'Intersection {key} is already controlled.')
+        self.control_loops[key] = ControlLoop(intersection, scheduler, duration)
+        self.schedule(key, self.loop.time() if self.loop else 0)
+
+    def remove_intersection(self, key: Hashable) -> Intersection:
+        """Stop controlling an intersection, its traffic lights are left red.
+
+        Args:
+            key (Hashable): The key of the intersection.
+
+        Returns:
+            Intersection: The removed intersection.
+        """
+        control_loop = self.control_loops.pop(key)
+        # The heap entries of the intersection are skipped when they are due
+        del self.scheduled[key]
+        control_loop.intersection.make_current_lighters_red()
+        return control_loop.intersection
+
+    def get_intersection(self, key: Hashable) -> Intersection:
+        """Get a controlled intersection.
+
+        Args:
+            key (Hashable): The key of the intersection.
+
+        Returns:
+            Intersection: The intersection.
+        """
+        return self.control_loops[key].intersection
+
+    def crosswalk_button(self, key: Hashable, passage_id: int):
+        """Handle a crosswalk button press at an intersection, and move its deadline accordingly.
+
+        Args:
+            key (Hashable): The key of the intersection.
+            passage_id (int): The id of the passage of the crosswalk.
+        """
+        control_loop = self.control_loops[key]
+        control_loop.crosswalk_buttons.press(passage_id)
+        control_loop.tick()
+        remaining_time = control_loop.intersection.get_remaining_time()
+        if self.loop and remaining_time is not None:
+            self.schedule(key, self.loop.time() + max(remaining_time, 0))
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Set the deadline of an intersection, replacing its previous one.
+
+        Args:
+            key (Hashable): The key of the intersection.
+            deadline (float): The event loop time at which the intersection swaps its traffic lights.
+        """
+        seq = next(self.counter)
+        self.scheduled[key] = seq
+        heapq.heappush(self.deadlines, (deadline, seq, key))
+        if self.loop and self.deadlines[0][1] == seq:
+            self.arm()
+
+    def arm(self):
+        """Arm the timer for the earliest deadline."""
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.deadlines and not self.stopped.done():
+            self.timer = self.loop.call_at(self.deadlines[0][0], self.on_timer)
+
+    def on_timer(self):
+        """Swap the traffic lights of all the intersections whose deadline has passed."""
+        self.timer = None
+        now = self.loop.time()
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, seq, key = heapq.heappop(self.deadlines)
+            if self.scheduled.get(key) == seq:
+                due.append(key)
+        try:
+            for key in due:
+                self.control_loops[key].tick()
+                intersection = self.control_loops[key].intersection
+                remaining_time = intersection.get_remaining_time()
+                if not remaining_time or remaining_time <= 0:
+                    self.control_loops[key].step()
+                    remaining_time = intersection.get_remaining_time() or 0
+                # Phases of no duration are swapped again on the next timer, not in this one
+                seq = next(self.counter)
+                self.scheduled[key] = seq
+                heapq.heappush(self.deadlines, (now + max(remaining_time, 0), seq, key))
+        except Exception as e:
+            self.stopped.set_exception(e)
+            return
+        self.arm()
+
+    async def run(self):
+        """Control the intersections until stop is called."""
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        now = self.loop.time()
+        self.deadlines = [(now, seq, key) for key, seq in self.scheduled.items()]
+        heapq.heapify(self.deadlines)
+        self.arm()
+        try:
+            await self.stopped
+        finally:
+            if self.timer:
+                self.timer.cancel()
+            self.loop = None
+
+    def stop(self):
+        """Stop controlling the intersections."""
+        if self.stopped and not self.stopped.done():
+            self.stopped.set_result(None)
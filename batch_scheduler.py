@@ -0,0 +1,159 @@
+import numpy as np
+from intersection import Intersection
+from traffic_light import TrafficLight
+from typing import List, Tuple
+from decision_stats import PhaseTimer, add_count
+from greedy_scheduler import GreedyScheduler
+
+
+class BatchGreedyScheduler:
+    """
+    A class making the GreedyScheduler decision of many intersections at once.
+
+    The jam scores of the traffic lights of all the intersections are computed and sorted in one pass, from the
+    offsets and total rates kept by their JamIndex, and the durations of all the intersections are computed
+    from their passage memberships in one pass too. The decisions are the same as calling
+    GreedyScheduler.decide_next_step on every intersection: the scores and their ties are ordered like
+    JamIndex.sorted_traffic_lights, and the terms of a duration are halves of integers, so they add up exactly
+    in any order. Building the set of lights that can work together is sequential, it stays per intersection.
+
+    An intersection whose passages are not in one passage table is decided by GreedyScheduler.
+    """
+
+    @staticmethod
+    def decide_next_steps(intersections: List[Intersection]) -> List[Tuple[TrafficLight, List[TrafficLight], float]]:
+        """
+        Decide the next traffic lights to turn green at many intersections, like GreedyScheduler.decide_next_step.
+
+        Args:
+            intersections (List[Intersection]): The intersections.
+
+        Returns:
+            List[Tuple[TrafficLight, List[TrafficLight], float]]: The main traffic light, the traffic lights
+            to make green together with it and the duration, for every intersection in order.
+        """
+        results = [None] * len(intersections)
+        batch = []
+        for i, intersection in enumerate(intersections):
+            if intersection.passage_table is not None and intersection.jam_index.clock is not None:
+                batch.append(i)
+            else:
+                results[i] = GreedyScheduler.decide_next_step(intersection)
+        if not batch:
+            return results
+
+        timer = PhaseTimer()
+        members = [intersections[i] for i in batch]
+        orders, counts = BatchGreedyScheduler.sort_by_jam(members)
+        timer.lap('batch_jam_scoring')
+
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        orders = orders.tolist()
+        sorted_lights = []
+        next_lights = []
+        for intersection, first, count in zip(members, starts.tolist(), counts.tolist()):
+            lights = intersection.indexed_traffic_lights
+            traffic_lights_sorted = [lights[position] for position in orders[first:first + count]]
+            sorted_lights.append(traffic_lights_sorted)
+            next_lights.append(GreedyScheduler.max_scheduling(traffic_lights_sorted[:1], traffic_lights_sorted[1:]))
+        timer.lap('batch_max_scheduling')
+        durations = BatchGreedyScheduler.calculate_durations(members, np.array(orders, dtype=np.intp), counts)
+        timer.lap('batch_calculate_duration')
+        add_count('batched_decisions', len(batch))
+        for i, traffic_lights_sorted, lights, duration in zip(batch, sorted_lights, next_lights, durations.tolist()):
+            results[i] = traffic_lights_sorted[0], lights, duration
+        return results
+
+    @staticmethod
+    def sort_by_jam(intersections: List[Intersection]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sort the traffic lights of many intersections by their jam, like JamIndex.sorted_traffic_lights.
+
+        The jam of a light is R * elapsed - C for the total rate R and the offset C its JamIndex keeps,
+        so all the scores are one vectorized expression, and one lexsort orders them per intersection.
+
+        Args:
+            intersections (List[Intersection]): Intersections with at least one indexed traffic light.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The positions of the traffic lights of every intersection in its
+            indexed_traffic_lights, from the highest jam, concatenated, and the number of lights of every intersection.
+        """
+        offsets, positions, rates, elapsed = [], [], [], []
+        for intersection in intersections:
+            jam_index = intersection.jam_index
+            jam_index.refresh_rates()
+            # The index keeps the traffic lights in the order they were indexed by the intersection
+            keys = jam_index.keys.values()
+            offsets.extend([key[0] for key in keys])
+            positions.extend([key[1] for key in keys])
+            rates.extend(jam_index.rates.values())
+            elapsed.append(jam_index.clock.time() - jam_index.origin)
+        counts = np.array([len(intersection.jam_index.keys) for intersection in intersections], dtype=np.intp)
+        owners = np.repeat(np.arange(len(intersections)), counts)
+        offsets, positions, rates = np.array(offsets), np.array(positions), np.array(rates, dtype=np.float64)
+        # The same operations as JamIndex.sorted_traffic_lights, so equal jams stay equal
+        scores = offsets - rates * np.array(elapsed)[owners]
+        order = np.lexsort((positions, scores, owners))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        orders = order - starts[owners]
+
+        # The index merges the lights of every total rate kept by their offsets, which is the order of their
+        # scores unless different offsets round to the same score, then that intersection is sorted by its index
+        grouped = np.lexsort((positions, offsets, rates, owners))
+        first, second = grouped[:-1], grouped[1:]
+        inverted = (owners[first] == owners[second]) & (rates[first] == rates[second]) \
+            & (scores[first] == scores[second]) & (positions[first] > positions[second])
+        for i in np.unique(owners[first[inverted]]).tolist():
+            jam_index = intersections[i].jam_index
+            sorted_positions = [jam_index.keys[tl][1] for tl in jam_index.sorted_traffic_lights()]
+            orders[starts[i]:starts[i] + counts[i]] = sorted_positions
+        return orders, counts
+
+    @staticmethod
+    def calculate_durations(intersections: List[Intersection], orders: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+        Calculate GreedyScheduler.calculate_duration of the traffic lights after the main one, for many intersections.
+
+        A passage counts once, for the first light that allows it, so its term is (n - index) * 0.5 * rate
+        for the n remaining lights and the smallest index among its lights.
+
+        Args:
+            intersections (List[Intersection]): Intersections whose passages are each in one passage table.
+            orders (np.ndarray): The sorted positions of the traffic lights, see sort_by_jam.
+            counts (np.ndarray): The number of traffic lights of every intersection.
+
+        Returns:
+            np.ndarray: The duration of every intersection.
+        """
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        owners = np.repeat(np.arange(len(intersections)), counts)
+        ranks = np.empty(len(orders), dtype=np.intp)
+        ranks[starts[owners] + orders] = np.arange(len(orders)) - starts[owners]
+
+        memberships = [intersection.get_membership() for intersection in intersections]
+        entry_owners = np.repeat(np.arange(len(intersections)), [len(rows) for rows, _ in memberships])
+        entry_rows = np.concatenate([rows for rows, _ in memberships])
+        entry_ranks = ranks[np.concatenate([lights for _, lights in memberships]) + starts[entry_owners]]
+
+        # The main traffic light isn't in the list
+        remaining = entry_ranks > 0
+        entry_owners, entry_rows = entry_owners[remaining], entry_rows[remaining]
+        entry_ranks = entry_ranks[remaining] - 1
+        # The passages of an intersection are rows of one table, the first entry of a row has its smallest index
+        order = np.lexsort((entry_ranks, entry_rows, entry_owners))
+        entry_owners, entry_rows, entry_ranks = entry_owners[order], entry_rows[order], entry_ranks[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (entry_owners[1:] != entry_owners[:-1]) | (entry_rows[1:] != entry_rows[:-1])
+        entry_owners, entry_rows, entry_ranks = entry_owners[first], entry_rows[first], entry_ranks[first]
+
+        # The rates are gathered from every passage table at once
+        table_ids = np.array([id(intersection.passage_table) for intersection in intersections], dtype=np.int64)
+        entry_tables = table_ids[entry_owners]
+        entry_rates = np.empty(len(entry_rows), dtype=np.int8)
+        for table in {id(i.passage_table): i.passage_table for i in intersections}.values():
+            in_table = entry_tables == id(table)
+            entry_rates[in_table] = table.rates[entry_rows[in_table]]
+
+        terms = (counts[entry_owners] - 1 - entry_ranks) * 0.5 * entry_rates
+        return np.bincount(entry_owners, weights=terms, minlength=len(intersections))
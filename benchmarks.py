@@ -0,0 +1,274 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from clock import VirtualClock
+from enums import PassageJam, SchedulerType
+from event_recorder import EventRecorder, NullSink, set_recorder
+from intersection import Intersection
+from passage import Passage
+from passage_table import PassageTable
+from scheduler import Scheduler
+from traffic_light import TrafficLight
+from typing import Callable, Dict, List
+
+SIZES = [4, 8, 16, 32, 64, 128, 250, 500]
+LAYOUTS = ['junction', 'grid']
+# The results of the reference machine, the runs on the same host are compared to it unless another baseline is given
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def junction_intersection(n_lights: int, clock: VirtualClock, seed: int = 0) -> Intersection:
+    """
+    Generate a single junction, its approaches are spread on a circle and every traffic light
+    allows one to three passages from one approach to the others.
+
+    Args:
+        n_lights (int): The number of traffic lights.
+        clock (VirtualClock): The clock of the intersection.
+        seed (int): The random seed.
+
+    Returns:
+        Intersection: The generated intersection.
+    """
+    rnd = random.Random(seed)
+    # Its own table, so the measured memory is the intersection's only
+    table = PassageTable()
+    n_approaches = max(4, n_lights // 2)
+    approaches = [(round(100 * math.cos(2 * math.pi * i / n_approaches), 3),
+                   round(100 * math.sin(2 * math.pi * i / n_approaches), 3)) for i in range(n_approaches)]
+    traffic_lights = []
+    for i in range(n_lights):
+        source = approaches[i % n_approaches]
+        targets = rnd.sample([a for a in approaches if a != source], rnd.randint(1, 3))
+        traffic_lights.append(TrafficLight([Passage(source, target, rnd.choice(list(PassageJam)), clock, table)
+                                            for target in targets], clock))
+    return Intersection(traffic_lights)
+
+
+def grid_intersection(n_lights: int, clock: VirtualClock, seed: int = 0) -> Intersection:
+    """
+    Generate a city grid of four way junctions as one intersection, every junction has four traffic lights
+    (straight and right turn from each approach), and traffic lights of different junctions never conflict.
+
+    Args:
+        n_lights (int): The number of traffic lights, rounded up to whole junctions.
+        clock (VirtualClock): The clock of the intersection.
+        seed (int): The random seed.
+
+    Returns:
+        Intersection: The generated intersection.
+    """
+    rnd = random.Random(seed)
+    table = PassageTable()
+    n_junctions = math.ceil(n_lights / 4)
+    side = math.ceil(math.sqrt(n_junctions))
+    traffic_lights = []
+    for j in range(n_junctions):
+        x, y = 100 * (j % side), 100 * (j // side)
+        north, east, south, west = (x, y + 10), (x + 10, y), (x, y - 10), (x - 10, y)
+        for source, straight, right in [(north, south, west), (east, west, north),
+                                        (south, north, east), (west, east, south)]:
+            traffic_lights.append(TrafficLight([Passage(source, straight, rnd.choice(list(PassageJam)), clock, table),
+                                                Passage(source, right, rnd.choice(list(PassageJam)), clock, table)],
+                                               clock))
+    return Intersection(traffic_lights)
+
+
+GENERATORS: Dict[str, Callable[[int, VirtualClock, int], Intersection]] = {
+    'junction': junction_intersection,
+    'grid': grid_intersection,
+}
+
+
+def measure_rate(function: Callable[[], int], min_time: float) -> float:
+    """
+    Call a function repeatedly for at least a period of time.
+
+    Args:
+        function (Callable[[], int]): The function, it returns the number of operations it made.
+        min_time (float): The minimum time (in seconds) to measure.
+
+    Returns:
+        float: The number of operations per second.
+    """
+    operations = 0
+    start = time.perf_counter()
+    while True:
+        operations += function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return operations / elapsed
+
+
+def benchmark_layout(layout: str, n_lights: int, min_time: float) -> Dict[str, float]:
+    """
+    Benchmark a generated layout.
+
+    Args:
+        layout (str): The layout generator name.
+        n_lights (int): The number of traffic lights.
+        min_time (float): The minimum time (in seconds) of every measurement.
+
+    Returns:
+        Dict[str, float]: The measured metrics by name.
+    """
+    # The first intersection also fills the caches of the process, they aren't the measured intersection's
+    GENERATORS[layout](4, VirtualClock())
+    tracemalloc.start()
+    intersection = GENERATORS[layout](n_lights, VirtualClock())
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    traffic_lights = intersection.get_all_traffic_lights()
+    passages = TrafficLight.passages_from_traffic_lights(traffic_lights)
+    rnd = random.Random(1)
+    passage_pairs = [(rnd.choice(passages), rnd.choice(passages)) for _ in range(1000)]
+    light_pairs = [rnd.sample(traffic_lights, 2) for _ in range(1000)]
+
+    def check_passages() -> int:
+        for p1, p2 in passage_pairs:
+            Passage.can_work_together([p1], [p2])
+        return len(passage_pairs)
+
+    def check_lights() -> int:
+        for lights in light_pairs:
+            TrafficLight.can_work_together(lights)
+        return len(light_pairs)
+
+    results = {
+        'memory_bytes': memory,
+        'passage_checks_per_second': measure_rate(check_passages, min_time),
+        'light_checks_per_second': measure_rate(check_lights, min_time),
+    }
+
+    for scheduler_type in SchedulerType:
+        clock = VirtualClock()
+        intersection = GENERATORS[layout](n_lights, clock)
+        scheduler = Scheduler(scheduler_type)
+
+        def decide() -> int:
+            main_light, next_lights, duration = scheduler.decide_next_light(intersection)
+            intersection.greens_on_for(next_lights, main_light, duration or 1)
+            clock.advance(duration or 1)
+            return 1
+
+        results[f'{scheduler_type.name.lower()}_decisions_per_second'] = measure_rate(decide, min_time)
+    return results
+
+
+def run_benchmarks(sizes: List[int], layouts: List[str], min_time: float) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmark all the layouts in all the sizes.
+
+    Args:
+        sizes (List[int]): The numbers of traffic lights.
+        layouts (List[str]): The layout generator names.
+        min_time (float): The minimum time (in seconds) of every measurement.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The metrics of every case, by '<layout>-<size>'.
+    """
+    previous_recorder = set_recorder(EventRecorder(NullSink()))
+    try:
+        return {f'{layout}-{size}': benchmark_layout(layout, size, min_time) for layout in layouts for size in sizes}
+    finally:
+        set_recorder(previous_recorder)
+
+
+def host_info() -> Dict[str, object]:
+    """
+    Describe the machine and the Python running the benchmarks, rates measured on another host aren't comparable.
+
+    Returns:
+        Dict[str, object]: The CPU architecture and model, the number of CPUs, the system and the Python version.
+    """
+    processor = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as f:
+            processor = next(line.split(':', 1)[1].strip() for line in f if line.startswith('model name'))
+    except (OSError, StopIteration):
+        pass
+    return {'machine': platform.machine(), 'processor': processor, 'cpus': os.cpu_count(), 'system': platform.system(),
+            'python': f'{platform.python_implementation()} {platform.python_version()}'}
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """
+    Find the metrics that regressed from a baseline.
+
+    Args:
+        results (Dict[str, Dict[str, float]]): The current results.
+        baseline (Dict[str, Dict[str, float]]): The baseline results.
+        tolerance (float): The allowed relative regression, e.g. 0.3 allows rates 30% lower and memory 30% higher.
+
+    Returns:
+        List[str]: A description of every regression.
+    """
+    regressions = []
+    for case, metrics in results.items():
+        for name, value in metrics.items():
+            base = baseline.get(case, {}).get(name)
+            if base is None:
+                continue
+            if name == 'memory_bytes':
+                regressed = value > base * (1 + tolerance)
+            else:
+                regressed = value < base * (1 - tolerance)
+            if regressed:
+                regressions.append(f'{case} {name}: {value:.0f} (baseline {base:.0f})')
+    return regressions
+
+
+def format_results(results: Dict[str, Dict[str, float]]) -> str:
+    """
+    Format benchmark results as a table.
+
+    Args:
+        results (Dict[str, Dict[str, float]]): The results by case.
+
+    Returns:
+        str: A table with a line for every case and a column for every metric.
+    """
+    names = list(next(iter(results.values())))
+    lines = ['case'.ljust(14) + ''.join(name.replace('_per_second', '/s').rjust(len(name) - 4) for name in names)]
+    for case, metrics in results.items():
+        lines.append(case.ljust(14) + ''.join(f'{metrics[name]:.0f}'.rjust(len(name) - 4) for name in names))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark conflict checks and scheduler decisions.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of traffic lights')
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=LAYOUTS)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds of every measurement')
+    parser.add_argument('--save', help='save the results and the host as a baseline JSON file')
+    parser.add_argument('--compare', help='compare the results to a baseline JSON file, recorded on any host. '
+                                          'By default they are compared to the committed baseline if it was recorded '
+                                          'on the same host')
+    parser.add_argument('--no-compare', action='store_true', help="don't compare the results to a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed relative regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.layouts, args.min_time)
+    print(format_results(results))
+    host = host_info()
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'host': host, 'results': results}, f, indent=2)
+    if args.compare or not args.no_compare:
+        with open(args.compare or BASELINE_PATH) as f:
+            baseline = json.load(f)
+        if not args.compare and baseline['host'] != host:
+            print(f"Not compared, the baseline was recorded on another host: {baseline['host']}")
+        else:
+            regressions = compare(results, baseline['results'], args.tolerance)
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+            sys.exit(1 if regressions else 0)
@@ -0,0 +1,48 @@
+from intersection import Intersection
+from traffic_light import TrafficLight
+from greedy_scheduler import GreedyScheduler
+from typing import List, Tuple
+from decision_stats import PhaseTimer
+
+
+class CatalogScheduler:
+    """
+    A class that implements a phase catalog traffic light scheduling algorithm.
+
+    The CatalogScheduler class chooses the phase of the intersection's PhaseCatalog with the highest total jam.
+    The maximal sets of traffic lights that can work together are enumerated once, when the catalog is built,
+    so a decision only scores the phases instead of searching the compatibility graph.
+
+    Methods:
+        decide_next_step(intersection: Intersection) -> Tuple[TrafficLight, List[TrafficLight], float]:
+            Decide the traffic lights to turn green and calculate the duration for which they will remain green.
+    """
+
+    @staticmethod
+    def decide_next_step(intersection: Intersection) -> Tuple[TrafficLight, List[TrafficLight], float]:
+        """
+        Decide the traffic lights to turn green and calculate the duration for which they will remain green.
+
+        Args:
+            intersection (Intersection): The intersection where the traffic lights are located.
+
+        Returns:
+            Tuple[TrafficLight, List[TrafficLight], float]:
+                A tuple containing:
+                - The main traffic light to make green, the one with the highest jam in the chosen phase.
+                - The list of traffic lights of the phase.
+                - The duration for which the main traffic light should remain green.
+        """
+        timer = PhaseTimer()
+        jams = intersection.get_traffic_light_jams()
+        traffic_lights_sorted = intersection.get_traffic_lights_by_jam()
+        timer.lap('jam_scoring')
+        next_lights = intersection.get_phase_catalog().best_phase(jams)
+        next_lights.sort(key=lambda tl: jams[tl.bit.bit_length() - 1], reverse=True)
+        timer.lap('best_phase')
+
+        main_traffic_light = next_lights[0]
+        traffic_lights_sorted.remove(main_traffic_light)
+        duration = GreedyScheduler.calculate_duration(traffic_lights_sorted)
+        timer.lap('calculate_duration')
+        return main_traffic_light, next_lights, duration
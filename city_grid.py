@@ -0,0 +1,369 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from clock import VirtualClock
+from control_loop import ControlLoop
+from enums import PassageJam, SchedulerType, TrafficLightState
+from event_recorder import EventRecorder, NullSink, set_recorder
+from intersection import Intersection
+from passage import Passage
+from queue_model import ARRIVAL_RATE_PER_JAM_LEVEL, SATURATION_FLOW
+from scheduler import Scheduler
+from traffic_light import TrafficLight
+from typing import List, NamedTuple, Tuple
+
+# The approaches of a junction, named by the side the vehicles come from, and the exits, named by the side they leave to
+NORTH, EAST, SOUTH, WEST = range(4)
+# The (row, column) step to the neighboring junction on every side, row 0 is the northern one
+NEIGHBOR_STEPS = ((-1, 0), (0, 1), (1, 0), (0, -1))
+
+
+class GridConfig(NamedTuple):
+    """The parameters of a city grid simulation."""
+    rows: int
+    cols: int
+    arrival_rate: float  # Vehicles per second entering the grid at every approach on its border
+    saturation_flow: float  # Vehicles per second leaving a green approach with a queue
+    turn_ratio: float  # The part of the vehicles turning right, the others go straight
+    time_step: float  # Seconds between two handoffs of vehicles to the neighboring junctions
+    min_green: float  # The green duration when the scheduler doesn't decide one
+    seed: int
+
+
+class CityGridReport(NamedTuple):
+    """The results of a city grid simulation."""
+    junctions: int
+    workers: int
+    simulated_time: float
+    arrivals: int  # Vehicles that entered the grid
+    departures: float  # Vehicles that crossed a junction, a vehicle crossing a few junctions counts a few times
+    exits: float  # Vehicles that left the grid
+    vehicles: float  # Vehicles waiting in the grid at the end
+    mean_queue: float  # Vehicles waiting at an approach, averaged over the approaches and the time
+    decisions: int
+    elapsed: float  # Wall time (in seconds)
+
+
+def build_junction(clock: VirtualClock, rate: PassageJam = PassageJam.MEDIUM) -> Intersection:
+    """
+    Build a four way junction, with a traffic light for the straight and right turn passages of every approach.
+
+    Args:
+        clock (VirtualClock): The clock of the junction.
+        rate (PassageJam): The rate of the passages.
+
+    Returns:
+        Intersection: The junction, its traffic lights are in the order of the approaches.
+    """
+    sides = [(0, 10), (10, 0), (0, -10), (-10, 0)]
+    return Intersection([TrafficLight([Passage(sides[d], sides[(d + 2) % 4], rate, clock),
+                                       Passage(sides[d], sides[(d + 3) % 4], rate, clock)], clock)
+                         for d in range(4)])
+
+
+class GridState:
+    """
+    The state of a city grid in one shared memory block, mapped as NumPy arrays by every process.
+
+    Attributes:
+        queues (np.ndarray): (junctions, 4) vehicles waiting at every approach.
+        light_states (np.ndarray): (junctions, 4) TrafficLightState values of every traffic light.
+        last_open (np.ndarray): (junctions, 8) last_open of the straight and right passages of every approach.
+        outflow (np.ndarray): (2, junctions, 4) vehicles leaving every junction to every side during a time step,
+            the even and odd time steps use different buffers.
+        totals (np.ndarray): (workers, 5) arrivals, departures, exits, queue area and decisions of every worker.
+    """
+
+    def __init__(self, n_junctions: int, n_workers: int, name: str = None):
+        """Initialize a GridState object.
+
+        Args:
+            n_junctions (int): The number of junctions.
+            n_workers (int): The number of worker processes.
+            name (str): The name of an existing block to attach to, a new block is created when not given.
+        """
+        fields = [('queues', np.float64, (n_junctions, 4)),
+                  ('light_states', np.int8, (n_junctions, 4)),
+                  ('last_open', np.float64, (n_junctions, 8)),
+                  ('outflow', np.float64, (2, n_junctions, 4)),
+                  ('totals', np.float64, (n_workers, 5))]
+        # Every array starts on an 8 bytes boundary
+        sizes = [-(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8 for _, dtype, shape in fields]
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=max(sum(sizes), 8))
+        self.fields = [field for field, _, _ in fields]
+        offset = 0
+        for (field, dtype, shape), size in zip(fields, sizes):
+            setattr(self, field, np.ndarray(shape, dtype, buffer=self.shm.buf, offset=offset))
+            offset += size
+        if name is None:
+            self.shm.buf[:offset] = bytes(offset)
+
+    def close(self):
+        """Unmap the block from this process, the arrays can't be used anymore."""
+        for field in self.fields:
+            setattr(self, field, None)
+        self.shm.close()
+
+    def unlink(self):
+        """Free the block, after every process closed it."""
+        self.shm.unlink()
+
+
+class GridPartition:
+    """
+    A band of rows of a city grid simulated by one worker process.
+
+    Every junction has its own Intersection and ControlLoop on the partition's virtual clock. On every time step
+    the junctions whose phase ended decide the next one, with the queues of their approaches as the passage counts,
+    the green approaches serve their queues, and the served vehicles are written to the outflow of the step.
+    After all the partitions wrote their outflow, every junction takes the vehicles its neighbors sent it,
+    and the approaches on the border of the grid get Poisson arrivals. Every row draws its arrivals from its
+    own random generator, so the results don't depend on the partitioning.
+    """
+
+    def __init__(self, config: GridConfig, state: GridState, worker: int, first_row: int, last_row: int):
+        """Initialize a GridPartition object.
+
+        Args:
+            config (GridConfig): The parameters of the simulation.
+            state (GridState): The shared state of the grid.
+            worker (int): The index of the worker.
+            first_row (int): The first row of the partition.
+            last_row (int): The row after the last row of the partition.
+        """
+        self.config = config
+        self.state = state
+        self.worker = worker
+        self.first = first_row * config.cols
+        self.last = last_row * config.cols
+        n = self.last - self.first
+
+        self.clock = VirtualClock()
+        self.scheduler = Scheduler(SchedulerType.GREEDY_SCHEDULER)
+        self.control_loops = [ControlLoop(build_junction(self.clock), self.scheduler, config.min_green, self.clock)
+                              for _ in range(n)]
+        self.traffic_lights = [loop.intersection.get_all_traffic_lights() for loop in self.control_loops]
+        self.passages = [[p for tl in lights for p in tl.get_passages()] for lights in self.traffic_lights]
+        self.split = np.tile([1 - config.turn_ratio, config.turn_ratio], 4)
+
+        junctions = np.arange(self.first, self.last)
+        rows, cols = junctions // config.cols, junctions % config.cols
+        neighbor_rows = rows[:, None] + np.array([step[0] for step in NEIGHBOR_STEPS])
+        neighbor_cols = cols[:, None] + np.array([step[1] for step in NEIGHBOR_STEPS])
+        # Whether there is a neighbor on every side, vehicles of an approach come from the neighbor on its side,
+        # and vehicles leaving to a side go to the neighbor there
+        self.inner = ((neighbor_rows >= 0) & (neighbor_rows < config.rows)
+                      & (neighbor_cols >= 0) & (neighbor_cols < config.cols))
+        # The neighbor sends the vehicles of an approach to the opposite side, as positions in the flat outflow
+        self.sources = ((neighbor_rows * config.cols + neighbor_cols) * 4 + (np.arange(4) + 2) % 4)[self.inner]
+        border = np.flatnonzero(~self.inner.reshape(-1))
+        self.row_borders = np.split(border, np.searchsorted(border, np.arange(4 * config.cols, 4 * n, 4 * config.cols)))
+        self.row_generators = [np.random.default_rng(None if config.seed is None else [config.seed, row])
+                               for row in range(first_row, last_row)]
+
+        self.queues = np.zeros((n, 4), dtype=np.float64)
+        self.green = np.zeros((n, 4), dtype=bool)
+        self.deadlines = np.zeros(n, dtype=np.float64)
+        self.arrivals = 0
+        self.departures = 0.0
+        self.exits = 0.0
+        self.queue_area = 0.0
+        self.decisions = 0
+
+    def decide(self, junction: int):
+        """Decide the next phase of a junction whose phase ended.
+
+        Args:
+            junction (int): The position of the junction in the partition.
+        """
+        control_loop = self.control_loops[junction]
+        counts = np.rint(np.repeat(self.queues[junction], 2) * self.split).astype(int).tolist()
+        control_loop.intersection.update_passage_counts({p.id: count for p, count
+                                                         in zip(self.passages[junction], counts)})
+        control_loop.step()
+        self.decisions += 1
+        states = [tl.get_state() for tl in self.traffic_lights[junction]]
+        self.green[junction] = [state == TrafficLightState.GREEN for state in states]
+        self.deadlines[junction] = self.clock.time() + control_loop.intersection.get_remaining_time()
+        g = self.first + junction
+        self.state.light_states[g] = [state.value for state in states]
+        self.state.last_open[g] = [p.last_open for p in self.passages[junction]]
+
+    def step(self, step: int, barrier: multiprocessing.Barrier, timeout: float = None):
+        """Simulate a time step.
+
+        Args:
+            step (int): The number of the time step.
+            barrier (multiprocessing.Barrier): The barrier of all the partitions.
+            timeout (float): The maximum time (in seconds) to wait for the other partitions.
+        """
+        config = self.config
+        dt = config.time_step
+        # A phase ending within the step is switched at its start
+        for junction in np.flatnonzero(self.deadlines < self.clock.time() + dt / 2).tolist():
+            self.decide(junction)
+
+        served = np.minimum(self.queues, config.saturation_flow * dt) * self.green
+        self.queues -= served
+        self.departures += float(served.sum())
+        # Vehicles from an approach go straight to the opposite side, or turn right to the next side counterclockwise
+        outflow = (np.roll(served * (1 - config.turn_ratio), 2, axis=1)
+                   + np.roll(served * config.turn_ratio, 3, axis=1))
+        self.exits += float(outflow[~self.inner].sum())
+        buffer = self.state.outflow[step % 2]
+        buffer[self.first:self.last] = outflow
+        # The other buffer is written on the next step, a partition can't get to the step after it before
+        # all the partitions passed this barrier and read this step's buffer
+        barrier.wait(timeout)
+
+        self.queues[self.inner] += buffer.reshape(-1)[self.sources]
+        flat_queues = self.queues.reshape(-1)
+        for generator, border in zip(self.row_generators, self.row_borders):
+            arrivals = generator.poisson(config.arrival_rate * dt, len(border))
+            flat_queues[border] += arrivals
+            self.arrivals += int(arrivals.sum())
+        self.queue_area += float(self.queues.sum()) * dt
+        self.state.queues[self.first:self.last] = self.queues
+        self.clock.advance(dt)
+
+    def run(self, total_time: float, barrier: multiprocessing.Barrier, timeout: float = None):
+        """Simulate a period of time, in lockstep with the other partitions.
+
+        Args:
+            total_time (float): The time to simulate (in seconds).
+            barrier (multiprocessing.Barrier): The barrier of all the partitions.
+            timeout (float): The maximum time (in seconds) to wait for the other partitions on every step.
+        """
+        for step in range(math.ceil(total_time / self.config.time_step)):
+            self.step(step, barrier, timeout)
+        self.state.totals[self.worker] = [self.arrivals, self.departures, self.exits, self.queue_area,
+                                          self.decisions]
+
+
+def run_partition(config: GridConfig, state_name: str, n_workers: int, worker: int, first_row: int, last_row: int,
+                  total_time: float, barrier: multiprocessing.Barrier, timeout: float):
+    """The main function of a worker process, see GridPartition."""
+    set_recorder(EventRecorder(NullSink()))
+    state = GridState(config.rows * config.cols, n_workers, state_name)
+    try:
+        GridPartition(config, state, worker, first_row, last_row).run(total_time, barrier, timeout)
+    except BaseException:
+        # Release the other partitions instead of leaving them waiting
+        barrier.abort()
+        raise
+    finally:
+        state.close()
+
+
+class CityGrid:
+    """
+    A class simulating a city grid of four way junctions on all the cores of a machine.
+
+    The grid is split into bands of rows, each one simulated by a worker process, see GridPartition.
+    The queues, the traffic light states and the last_open of the passages of all the junctions live in
+    a shared memory block, and the vehicles are handed off between neighboring junctions through it once
+    every time step, after all the workers reach a barrier.
+    """
+
+    def __init__(self, rows: int, cols: int,
+                 arrival_rate: float = ARRIVAL_RATE_PER_JAM_LEVEL * PassageJam.MEDIUM.value,
+                 saturation_flow: float = SATURATION_FLOW, turn_ratio: float = 0.25, time_step: float = 1.0,
+                 min_green: float = 5, seed: int = None):
+        """Initialize a CityGrid object.
+
+        Args:
+            rows (int): The number of rows of junctions.
+            cols (int): The number of columns of junctions.
+            arrival_rate (float): The vehicles per second entering the grid at every approach on its border.
+            saturation_flow (float): The vehicles per second leaving a green approach with a queue.
+            turn_ratio (float): The part of the vehicles turning right.
+            time_step (float): The time (in seconds) between two handoffs.
+            min_green (float): The green duration when the scheduler doesn't decide one.
+            seed (int): The seed of the random arrivals.
+        """
+        self.config = GridConfig(rows, cols, arrival_rate, saturation_flow, turn_ratio, time_step, min_green, seed)
+        self.queues = np.zeros((rows * cols, 4), dtype=np.float64)
+        self.light_states = np.zeros((rows * cols, 4), dtype=np.int8)
+
+    def partitions(self, n_workers: int) -> List[Tuple[int, int]]:
+        """
+        Split the rows of the grid into bands of about the same size.
+
+        Args:
+            n_workers (int): The number of bands.
+
+        Returns:
+            List[Tuple[int, int]]: The first row and the row after the last row of every band.
+        """
+        bounds = np.linspace(0, self.config.rows, min(n_workers, self.config.rows) + 1).round().astype(int).tolist()
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def simulate(self, total_time: float, workers: int = None, timeout: float = 60) -> CityGridReport:
+        """
+        Simulate the grid for a period of time.
+
+        Args:
+            total_time (float): The time to simulate (in seconds).
+            workers (int): The number of worker processes, the number of CPUs by default.
+            timeout (float): The maximum time (in seconds) a worker waits for the others on a time step.
+
+        Returns:
+            CityGridReport: The results of the simulation, the final queues and traffic light states are kept
+            in the queues and light_states attributes.
+        """
+        partitions = self.partitions(workers or os.cpu_count())
+        n_junctions = self.config.rows * self.config.cols
+        state = GridState(n_junctions, len(partitions))
+        try:
+            context = multiprocessing.get_context()
+            barrier = context.Barrier(len(partitions))
+            processes = [context.Process(target=run_partition, name=f'city-grid-{worker}', daemon=True,
+                                         args=(self.config, state.shm.name, len(partitions), worker, first_row,
+                                               last_row, total_time, barrier, timeout))
+                         for worker, (first_row, last_row) in enumerate(partitions)]
+            start = time.perf_counter()
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - start
+            if any(process.exitcode != 0 for process in processes):
+                raise RuntimeError('A city grid worker failed.')
+
+            self.queues = state.queues.copy()
+            self.light_states = state.light_states.copy()
+            arrivals, departures, exits, queue_area, decisions = state.totals.sum(axis=0).tolist()
+        finally:
+            state.close()
+            state.unlink()
+        simulated_time = math.ceil(total_time / self.config.time_step) * self.config.time_step
+        return CityGridReport(
+            junctions=n_junctions,
+            workers=len(partitions),
+            simulated_time=simulated_time,
+            arrivals=int(arrivals),
+            departures=departures,
+            exits=exits,
+            vehicles=float(self.queues.sum()),
+            mean_queue=queue_area / (simulated_time * 4 * n_junctions) if simulated_time else 0.0,
+            decisions=int(decisions),
+            elapsed=elapsed,
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate a city grid of junctions on all the cores.')
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--cols', type=int, default=100)
+    parser.add_argument('--time', type=float, default=600, help='seconds to simulate')
+    parser.add_argument('--workers', type=int, help='worker processes, the number of CPUs by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = CityGrid(args.rows, args.cols, seed=args.seed).simulate(args.time, args.workers)
+    for field, value in report._asdict().items():
+        print(f'{field:<16}{value}')
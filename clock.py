@@ -0,0 +1,81 @@
+import math
+import threading
+import time
+
+
+class Clock:
+    """
+    A class representing the clock used for all the timing of the traffic lights.
+
+    The default clock follows the real time, a VirtualClock can be used instead to run simulations."""
+
+    def __deepcopy__(self, memo):
+        # Copies of passages and traffic lights must keep following the same clock
+        return self
+
+    def time(self) -> float:
+        """Get the current time.
+
+        Returns:
+            float: The current time (in seconds).
+        """
+        return time.time()
+
+    def sleep(self, seconds: float):
+        """Wait for a number of seconds.
+
+        Args:
+            seconds (float): The time to wait (in seconds).
+        """
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        """Wait until an event is set or the timeout passes.
+
+        Args:
+            event (threading.Event): The event to wait for.
+            timeout (float): The maximum time to wait (in seconds).
+
+        Returns:
+            bool: True if the event is set, False otherwise.
+        """
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """
+    A class representing a simulated clock.
+
+    The time of a VirtualClock only moves when it is advanced, so waiting for a deadline jumps right to it."""
+
+    def __init__(self, start: float = 0.0):
+        """Initialize a VirtualClock object.
+
+        Args:
+            start (float): The initial time (in seconds).
+        """
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        """Move the clock forward.
+
+        Args:
+            seconds (float): The time to move forward (in seconds).
+        """
+        if seconds > 0:
+            # Always move at least to the next float, otherwise a tiny remaining time would never pass
+            self.now = max(self.now + seconds, math.nextafter(self.now, math.inf))
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        if not event.is_set():
+            self.advance(timeout)
+        return event.is_set()
+
+
+SYSTEM_CLOCK = Clock()
@@ -0,0 +1,111 @@
+import numpy as np
+from spatial_index import SpatialIndex
+from typing import Tuple
+
+
+def passages_to_coordinates(passages) -> np.ndarray:
+    """
+    Convert passages to a coordinates array.
+
+    Args:
+        passages (List[Passage]): The passages to convert.
+
+    Returns:
+        np.ndarray: An (N, 4) float array, each row holds source x, source y, target x and target y of a passage.
+    """
+    if passages and all(p.table is passages[0].table for p in passages):
+        # Gather the rows of the passages from their table at once
+        return passages[0].table.coordinates[[p.row for p in passages]]
+    coordinates = np.empty((len(passages), 4), dtype=np.float64)
+    for i, p in enumerate(passages):
+        coordinates[i] = (p.source[0], p.source[1], p.target[0], p.target[1])
+    return coordinates
+
+
+def _orientation(px, py, qx, qy, rx, ry) -> np.ndarray:
+    """Sign of the cross product (q - p) x (r - p), positive when p, q, r turn counter-clockwise."""
+    return np.sign((qx - px) * (ry - py) - (qy - py) * (rx - px))
+
+
+def segments_intersect(coordinates1: np.ndarray, coordinates2: np.ndarray) -> np.ndarray:
+    """
+    Check which segments of the first array intersect which segments of the second array.
+
+    Segments are closed, so touching at an end point or overlapping on the same line counts as an intersection.
+    Zero length segments never intersect, like an empty shapely LineString.
+
+    Args:
+        coordinates1 (np.ndarray): An (N, 4) array of segments (x1, y1, x2, y2).
+        coordinates2 (np.ndarray): An (M, 4) array of segments (x1, y1, x2, y2).
+
+    Returns:
+        np.ndarray: An (N, M) boolean matrix, True where the two segments intersect.
+    """
+    return _intersect(*(coordinates1[:, i, None] for i in range(4)), *(coordinates2[None, :, i] for i in range(4)))
+
+
+def _intersect(ax, ay, bx, by, cx, cy, dx, dy) -> np.ndarray:
+    """Element-wise check if the segments ab and cd intersect, the arguments broadcast against each other."""
+    o1 = _orientation(ax, ay, bx, by, cx, cy)
+    o2 = _orientation(ax, ay, bx, by, dx, dy)
+    o3 = _orientation(cx, cy, dx, dy, ax, ay)
+    o4 = _orientation(cx, cy, dx, dy, bx, by)
+    straddle = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+
+    # Collinear segments intersect only when their bounding boxes overlap
+    collinear = (o1 == 0) & (o2 == 0) & (o3 == 0) & (o4 == 0)
+    boxes_overlap = (np.minimum(ax, bx) <= np.maximum(cx, dx)) & (np.minimum(cx, dx) <= np.maximum(ax, bx)) \
+        & (np.minimum(ay, by) <= np.maximum(cy, dy)) & (np.minimum(cy, dy) <= np.maximum(ay, by))
+
+    degenerate = ((ax == bx) & (ay == by)) | ((cx == dx) & (cy == dy))
+    return straddle & ~(collinear & ~boxes_overlap) & ~degenerate
+
+
+def conflict_pairs(coordinates1: np.ndarray, coordinates2: np.ndarray,
+                   spatial_index: SpatialIndex = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the passages of the first array that can't be opened together with passages of the second array.
+
+    This is the vectorized version of the Passage.is_action_valid rule: two passages conflict when they don't have
+    the same source, their x ranges overlap and their lines intersect (identical lines always share the source).
+    Only the pairs whose bounding boxes overlap, found by a spatial index, go through the orientation tests.
+
+    Args:
+        coordinates1 (np.ndarray): An (N, 4) array of passages (source x, source y, target x, target y).
+        coordinates2 (np.ndarray): An (M, 4) array of passages (source x, source y, target x, target y).
+        spatial_index (SpatialIndex): An index holding the passages of the second array in their order,
+            built when not given.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The conflicting pairs, as rows of the first array and rows of the second one.
+    """
+    coordinates1 = np.asarray(coordinates1, dtype=np.float64).reshape(-1, 4)
+    coordinates2 = np.asarray(coordinates2, dtype=np.float64).reshape(-1, 4)
+    if spatial_index is None:
+        spatial_index = SpatialIndex()
+        spatial_index.insert(coordinates2)
+    rows, columns = spatial_index.query(coordinates1)
+    first, second = coordinates1[rows], coordinates2[columns]
+    different_sources = (first[:, 0] != second[:, 0]) | (first[:, 1] != second[:, 1])
+    rows, columns, first, second = (rows[different_sources], columns[different_sources],
+                                    first[different_sources], second[different_sources])
+    intersect = _intersect(*(first[:, i] for i in range(4)), *(second[:, i] for i in range(4)))
+    return rows[intersect], columns[intersect]
+
+
+def conflict_matrix(coordinates1: np.ndarray, coordinates2: np.ndarray) -> np.ndarray:
+    """
+    Calculate which passages of the first array can't be opened together with passages of the second array.
+
+    Args:
+        coordinates1 (np.ndarray): An (N, 4) array of passages (source x, source y, target x, target y).
+        coordinates2 (np.ndarray): An (M, 4) array of passages (source x, source y, target x, target y).
+
+    Returns:
+        np.ndarray: An (N, M) boolean matrix, True where the two passages conflict, see conflict_pairs.
+    """
+    coordinates1 = np.asarray(coordinates1, dtype=np.float64).reshape(-1, 4)
+    coordinates2 = np.asarray(coordinates2, dtype=np.float64).reshape(-1, 4)
+    result = np.zeros((len(coordinates1), len(coordinates2)), dtype=bool)
+    result[conflict_pairs(coordinates1, coordinates2)] = True
+    return result
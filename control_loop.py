@@ -1,6 +1,12 @@
 from intersection import Intersection  # Importing Intersection for type hinting
 from scheduler import Scheduler  # Importing Scheduler for type hinting
-import time
+from clock import Clock, SYSTEM_CLOCK
+from crosswalk_buttons import CrosswalkButtons
+from enums import EventType
+from event_recorder import get_recorder
+from state_export import StatePublisher
+from typing import Callable, List
+import threading
 
 
 # import platform
@@ -12,16 +18,24 @@ import time
 
 
 class ControlLoop:
-    def __init__(self, intersection: Intersection, scheduler: Scheduler, duration=0):
+    def __init__(self, intersection: Intersection, scheduler: Scheduler, duration=0, clock: Clock = SYSTEM_CLOCK):
         """Initialize a MainRunning object.
 
         Args:
             intersection (Intersection): The intersection object to control the traffic lights.
             scheduler (Scheduler): The scheduler to decide the next traffic light.
+            duration: The green duration for schedulers that don't decide it.
+            clock (Clock): The clock of the intersection's traffic lights.
         """
         self.intersection = intersection
         self.scheduler = scheduler
         self.duration = duration
+        self.clock = clock
+        self.wake_event = threading.Event()
+        self.running = False
+        self.crosswalk_buttons = CrosswalkButtons(clock)
+        self.tick_handlers: List[Callable[[], None]] = [lambda: self.crosswalk_buttons.apply(self.intersection)]
+        self.state_publisher = None
 
     #
     #
@@ -51,13 +65,106 @@ class ControlLoop:
     #     print(f"Calling function with passage ID: {passage_id}")
 
     def run(self):
-        """Start the traffic light control loop."""
-        while True:
-            # if self.intersection.passage_interupt():
-            # self.handle_user_input()
-            if Scheduler.time_to_swap(self.intersection):
-                self.intersection.make_current_lighters_red()
-                next_lights = self.scheduler.decide_next_light(self.intersection)
-                print(f"*******iteration number {self.scheduler.get_step_number()} in time: {int(time.time())}********")
-                duration = self.duration if next_lights[2] == 0 else next_lights[2]
-                self.intersection.greens_on_for(next_lights[1], next_lights[0], duration)
+        """Start the traffic light control loop.
+
+        The loop sleeps until the deadline of the current main traffic light, or until it is woken up by an
+        external event, so an idle controller doesn't use the CPU.
+        """
+        self.running = True
+        while self.running:
+            # Clear before checking, so an event that arrives while swapping is not lost
+            self.wake_event.clear()
+            self.tick()
+            remaining_time = self.intersection.get_remaining_time()
+            if not remaining_time or remaining_time <= 0:
+                self.step()
+            else:
+                self.clock.wait(self.wake_event, remaining_time)
+
+    def simulate(self, total_time: float, on_step: Callable[[], None] = None) -> int:
+        """Run the control loop for a period of time on a virtual clock.
+
+        Instead of waiting for the deadline of every phase the clock jumps right to it, so a day of operation
+        is replayed in seconds. The intersection's traffic lights must use the same clock as the control loop.
+
+        Args:
+            total_time (float): The time to simulate (in seconds).
+            on_step (Callable[[], None]): A function called after every decision, e.g. to collect metrics.
+
+        Returns:
+            int: The number of decisions made during the simulation.
+        """
+        end_time = self.clock.time() + total_time
+        decisions = 0
+        while self.clock.time() < end_time:
+            self.tick()
+            remaining_time = self.intersection.get_remaining_time()
+            if not remaining_time or remaining_time <= 0:
+                self.step()
+                decisions += 1
+                if on_step:
+                    on_step()
+                remaining_time = self.intersection.get_remaining_time()
+                if not remaining_time or remaining_time <= 0:
+                    raise ValueError('A phase must have a positive duration to be simulated.')
+            else:
+                self.clock.sleep(min(remaining_time, end_time - self.clock.time()))
+        return decisions
+
+    def add_tick_handler(self, handler: Callable[[], None]):
+        """Add a function called on every tick of the loop, e.g. to apply the sensor updates received since
+        the last tick.
+
+        Args:
+            handler (Callable[[], None]): The function to call.
+        """
+        self.tick_handlers.append(handler)
+
+    def tick(self):
+        """Apply the external events queued since the last tick, the loop ticks before every decision
+        and whenever it is woken up."""
+        for handler in self.tick_handlers:
+            handler()
+
+    def step(self):
+        """Make the current traffic lights red and turn on the next traffic lights decided by the scheduler."""
+        self.intersection.make_current_lighters_red()
+        next_lights = self.scheduler.decide_next_light(self.intersection)
+        get_recorder().record(EventType.DECISION, self.scheduler.get_step_number(), None, self.clock.time())
+        duration = self.duration if next_lights[2] == 0 else next_lights[2]
+        self.intersection.greens_on_for(next_lights[1], next_lights[0], duration)
+        if self.state_publisher is not None:
+            self.state_publisher.publish()
+
+    def publish_state(self, name: str = None) -> StatePublisher:
+        """Publish the state of the intersection to shared memory after every decision, for monitors
+        in other processes.
+
+        Args:
+            name (str): The name of the shared memory block, a unique name is chosen by default.
+
+        Returns:
+            StatePublisher: The publisher, its name is the one to give StateReader.
+        """
+        if self.state_publisher is None:
+            self.state_publisher = StatePublisher(self.intersection, name)
+        return self.state_publisher
+
+    def wake(self):
+        """Wake up the control loop to check the intersection again, after an external event such as
+        a crosswalk button or a sensor update."""
+        self.wake_event.set()
+
+    def stop(self):
+        """Stop the traffic light control loop."""
+        self.running = False
+        self.wake()
+
+    def crosswalk_button(self, passage_id: int):
+        """Queue a crosswalk button press and wake up the control loop to apply it, safe to call from any thread.
+
+        Args:
+            passage_id (int): The id of the passage of the crosswalk.
+        """
+        if self.crosswalk_buttons.press(passage_id):
+            self.wake()
@@ -0,0 +1,70 @@
+import threading
+from clock import Clock, SYSTEM_CLOCK
+from intersection import Intersection
+from typing import Dict, List
+
+
+class CrosswalkButtons:
+    """
+    A class queuing crosswalk button presses until the control loop applies them.
+
+    Presses can come from any thread, each one is registered in O(1) under a lock. A button pressed again
+    within the debounce time of its last registered press, or while its press is still queued, is ignored.
+    The queued presses are applied to the intersection at the next tick of the control loop.
+    """
+
+    def __init__(self, clock: Clock = SYSTEM_CLOCK, debounce_time: float = 0.5):
+        """Initialize a CrosswalkButtons object.
+
+        Args:
+            clock (Clock): The clock measuring the debounce time.
+            debounce_time (float): The time (in seconds) presses of the same button are ignored after a press.
+        """
+        self.clock = clock
+        self.debounce_time = debounce_time
+        self.pending: Dict[int, None] = {}  # The passage ids of the queued presses, in the order they were pressed
+        self.last_press: Dict[int, float] = {}
+        self.lock = threading.Lock()
+        self.presses = 0  # The number of registered presses
+        self.ignored = 0  # The number of debounced presses
+
+    def press(self, passage_id: int) -> bool:
+        """Register a press of the crosswalk button of a passage.
+
+        Args:
+            passage_id (int): The id of the passage of the crosswalk.
+
+        Returns:
+            bool: True if the press was queued, False if it was debounced.
+        """
+        now = self.clock.time()
+        with self.lock:
+            last_press = self.last_press.get(passage_id)
+            if passage_id in self.pending or (last_press is not None and now - last_press < self.debounce_time):
+                self.ignored += 1
+                return False
+            self.last_press[passage_id] = now
+            self.pending[passage_id] = None
+            self.presses += 1
+            return True
+
+    def take(self) -> List[int]:
+        """Take the queued presses.
+
+        Returns:
+            List[int]: The passage ids of the presses, in the order they were pressed.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return list(pending)
+
+    def apply(self, intersection: Intersection) -> int:
+        """Apply the queued presses to an intersection.
+
+        Args:
+            intersection (Intersection): The intersection of the crosswalks.
+
+        Returns:
+            int: The number of presses that shortened the current phase.
+        """
+        return sum(1 for passage_id in self.take() if intersection.crosswalk_button(passage_id))
@@ -0,0 +1,189 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class LatencyHistogram:
+    """
+    A histogram of latencies in power of two buckets of nanoseconds.
+
+    A latency of t nanoseconds is counted in the bucket t.bit_length(), so adding one is a few integer operations,
+    and a percentile is known within a factor of two.
+    """
+
+    def __init__(self):
+        """Initialize a LatencyHistogram object."""
+        self.buckets = [0] * 65
+        self.count = 0
+        self.total = 0  # Nanoseconds
+        self.max = 0  # Nanoseconds
+
+    def add(self, nanoseconds: int):
+        """Add a latency.
+
+        Args:
+            nanoseconds (int): The latency (in nanoseconds).
+        """
+        self.buckets[nanoseconds.bit_length()] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def percentile(self, q: float) -> float:
+        """
+        Get a percentile of the latencies.
+
+        Args:
+            q (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The upper bound (in seconds) of the bucket of the percentile, 0 when there are no latencies.
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                # The latencies of a bucket are below 2 ** bucket, and never above the maximum
+                return min(2 ** bucket - 1, self.max) / 1e9
+        return self.max / 1e9
+
+    def summary(self) -> Dict[str, float]:
+        """Summarize the latencies.
+
+        Returns:
+            Dict[str, float]: The count, and the mean, p50, p90, p99 and max latencies (in seconds).
+        """
+        return {
+            'count': self.count,
+            'mean': self.total / self.count / 1e9 if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max / 1e9,
+        }
+
+
+class DecisionStats:
+    """
+    A class collecting the latency of every phase of the decisions of a scheduler, and counters of their work.
+
+    The Scheduler activates its stats for the current thread during a decision, and the schedulers report
+    the time of their phases (e.g. jam scoring, max_scheduling, calculate_duration) and their counters
+    (e.g. conflict checks, cache hits) to the active stats. Nothing is reported outside of a Scheduler decision.
+    """
+
+    def __init__(self):
+        """Initialize a DecisionStats object."""
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, int] = {}
+
+    def add_time(self, phase: str, nanoseconds: int):
+        """Add the latency of a phase.
+
+        Args:
+            phase (str): The name of the phase.
+            nanoseconds (int): The latency (in nanoseconds).
+        """
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = LatencyHistogram()
+        histogram.add(nanoseconds)
+
+    def count(self, counter: str, n: int = 1):
+        """Increase a counter.
+
+        Args:
+            counter (str): The name of the counter.
+            n (int): The amount to add.
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Summarize the stats.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The summary of the latencies of every phase, see LatencyHistogram.summary,
+            and the counters under 'counters'.
+        """
+        summary = {phase: histogram.summary() for phase, histogram in list(self.histograms.items())}
+        summary['counters'] = dict(self.counters)
+        return summary
+
+    def reset(self):
+        """Clear all the latencies and counters."""
+        self.histograms = {}
+        self.counters = {}
+
+
+local = threading.local()
+
+
+def get_active_stats() -> Optional[DecisionStats]:
+    """Get the stats of the decision running in the current thread.
+
+    Returns:
+        Optional[DecisionStats]: The stats the phases of the decision are reported to, None outside of a decision.
+    """
+    return getattr(local, 'stats', None)
+
+
+def set_active_stats(stats: Optional[DecisionStats]) -> Optional[DecisionStats]:
+    """Set the stats of the decision running in the current thread.
+
+    Args:
+        stats (Optional[DecisionStats]): The stats to report to, None to stop reporting.
+
+    Returns:
+        Optional[DecisionStats]: The previously active stats.
+    """
+    previous = getattr(local, 'stats', None)
+    local.stats = stats
+    return previous
+
+
+def add_count(counter: str, n: int = 1):
+    """Increase a counter of the decision running in the current thread, nothing outside of a decision.
+
+    Args:
+        counter (str): The name of the counter.
+        n (int): The amount to add.
+    """
+    stats = getattr(local, 'stats', None)
+    if stats is not None:
+        stats.count(counter, n)
+
+
+class PhaseTimer:
+    """
+    A class timing the consecutive phases of a decision, e.g.
+
+        timer = PhaseTimer()
+        ... score the jams ...
+        timer.lap('jam_scoring')
+        ... schedule ...
+        timer.lap('max_scheduling')
+
+    Every lap reports the time since the previous one (or since the timer was created) to the stats of the
+    decision running in the current thread. Outside of a decision the clock is not even read.
+    """
+    __slots__ = ('stats', 'last')
+
+    def __init__(self):
+        """Initialize a PhaseTimer object, the first phase starts now."""
+        self.stats = getattr(local, 'stats', None)
+        self.last = time.perf_counter_ns() if self.stats is not None else 0
+
+    def lap(self, phase: str):
+        """End a phase, the next one starts now.
+
+        Args:
+            phase (str): The name of the phase that ended.
+        """
+        if self.stats is not None:
+            now = time.perf_counter_ns()
+            self.stats.add_time(phase, now - self.last)
+            self.last = now
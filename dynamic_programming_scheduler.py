@@ -1,45 +0,0 @@
-#
-#
-# def initialize_dp_array(N, W):
-#     dp = [[False] * (W + 1) for _ in range(N + 1)]
-#     for i in range(N + 1):
-#         dp[i][0] = True
-#     return dp
-#
-#
-# def fill_dp_array(dp, N, subsets, weights):
-#     for i in range(1, N + 1):
-#         subset = subsets[i - 1]
-#         weight = weights[i - 1]
-#         for j in range(1, len(dp[i])):
-#             dp[i][j] = dp[i - 1][j]
-#             if j >= weight and dp[i - 1][j - weight]:
-#                 dp[i][j] = True
-#
-#
-# def find_max_weight(dp, N, is_valid):
-#     max_weight = 0
-#     for j in range(1, len(dp[N])):
-#         if dp[N][j] and is_valid(dp[N][:j]):
-#             max_weight = j
-#     return max_weight
-#
-#
-# def reconstruct_optimal_collection(dp, N, subsets, weights, max_weight):
-#     optimal_collection = []
-#     j = max_weight
-#     for i in range(N, 0, -1):
-#         if dp[i][j] and dp[i][:j] != dp[i - 1][:j]:
-#             optimal_collection.append(subsets[i - 1])
-#             j -= weights[i - 1]
-#     return optimal_collection
-#
-#
-# def dynamic_programming_algorithm(A, subsets, weights, is_valid):
-#     N = len(subsets)
-#     W = max(weights)
-#     dp = initialize_dp_array(N, W)
-#     fill_dp_array(dp, N, subsets, weights)
-#     max_weight = find_max_weight(dp, N, is_valid)
-#     optimal_collection = reconstruct_optimal_collection(dp, N, subsets, weights, max_weight)
-#     return optimal_collection
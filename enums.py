@@ -11,6 +11,9 @@ class SchedulerType(Enum):
     SINGLE_RANDOM_SCHEDULER = 1
     RANDOM_SCHEDULER = 2
     GREEDY_SCHEDULER = 3
+    EXACT_SCHEDULER = 4
+    LOOKAHEAD_SCHEDULER = 5
+    CATALOG_SCHEDULER = 6
 
 
 class PassageJam(Enum):
@@ -19,3 +22,9 @@ class PassageJam(Enum):
     MEDIUM = 3
     HIGH = 4
     EXTREME_HIGH = 5
+
+
+class EventType(Enum):
+    GREEN = 1
+    RED = 2
+    DECISION = 3
@@ -0,0 +1,225 @@
+import atexit
+import os
+import sys
+import threading
+from enums import EventType
+from typing import List, NamedTuple, Optional
+
+
+class Event(NamedTuple):
+    """A recorded transition or decision."""
+    event_type: EventType
+    subject_id: int  # The traffic light id, or the scheduler step of a decision
+    value: Optional[float]  # The green duration of a GREEN event
+    time: float
+
+
+def format_event(event: Event) -> str:
+    """
+    Format an event as the line printed for it.
+
+    Args:
+        event (Event): The event to format.
+
+    Returns:
+        str: The line of the event.
+    """
+    if event.event_type == EventType.GREEN:
+        return f"traffic light number: {event.subject_id} being green for: {event.value}"
+    if event.event_type == EventType.RED:
+        return f"traffic light number: {event.subject_id} being red"
+    return f"*******iteration number {event.subject_id} in time: {int(event.time)}********"
+
+
+class StdoutSink:
+    """A sink printing the events to the standard output."""
+
+    def write(self, events: List[Event]):
+        sys.stdout.write(''.join(format_event(e) + '\n' for e in events))
+        sys.stdout.flush()
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """A sink appending the events to a file."""
+
+    def __init__(self, path: str):
+        """Initialize a FileSink object.
+
+        Args:
+            path (str): The path of the file.
+        """
+        self.file = open(path, 'a')
+
+    def write(self, events: List[Event]):
+        self.file.write(''.join(format_event(e) + '\n' for e in events))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NullSink:
+    """A sink dropping the events, recording to it costs nothing."""
+
+    def write(self, events: List[Event]):
+        pass
+
+    def close(self):
+        pass
+
+
+class EventRecorder:
+    """
+    A class recording traffic light transitions and decisions into a preallocated ring buffer.
+
+    Recording an event only stores its fields, a background thread writes them to the sink in batches,
+    so phase switches never wait for I/O. When the sink falls behind a full buffer, the oldest events are dropped.
+    """
+
+    def __init__(self, sink=None, capacity: int = 4096, flush_interval: float = 0.5):
+        """Initialize an EventRecorder object.
+
+        Args:
+            sink: The sink to write the events to, a StdoutSink by default.
+            capacity (int): The number of events the buffer holds.
+            flush_interval (float): The maximum time (in seconds) between two writes to the sink.
+        """
+        self.sink = sink if sink is not None else StdoutSink()
+        self.enabled = not isinstance(self.sink, NullSink)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.event_types = [None] * capacity
+        self.subject_ids = [0] * capacity
+        self.values = [None] * capacity
+        self.times = [0.0] * capacity
+        self.head = 0  # The number of events recorded
+        self.tail = 0  # The number of events taken from the buffer
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.sink_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.thread = None
+        self.closed = False
+
+    def record(self, event_type: EventType, subject_id: int, value: Optional[float], time: float):
+        """Record an event.
+
+        Args:
+            event_type (EventType): The type of the event.
+            subject_id (int): The traffic light id, or the scheduler step of a decision.
+            value (Optional[float]): The green duration of a GREEN event.
+            time (float): The time of the event.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            i = self.head % self.capacity
+            self.event_types[i] = event_type
+            self.subject_ids[i] = subject_id
+            self.values[i] = value
+            self.times[i] = time
+            self.head += 1
+            if self.head - self.tail > self.capacity:
+                self.tail += 1
+                self.dropped += 1
+            pending = self.head - self.tail
+        if self.thread is None:
+            self.start()
+        if pending >= self.capacity // 2:
+            self.flush_event.set()
+
+    def take(self) -> List[Event]:
+        """Take all the events out of the buffer.
+
+        Returns:
+            List[Event]: The events, from the oldest.
+        """
+        with self.lock:
+            events = [Event(self.event_types[i % self.capacity], self.subject_ids[i % self.capacity],
+                            self.values[i % self.capacity], self.times[i % self.capacity])
+                      for i in range(self.tail, self.head)]
+            self.tail = self.head
+        return events
+
+    def flush(self):
+        """Write all the recorded events to the sink."""
+        with self.sink_lock:
+            events = self.take()
+            if events:
+                self.sink.write(events)
+
+    def start(self):
+        """Start the background thread writing to the sink."""
+        with self.lock:
+            if self.thread is not None or self.closed:
+                return
+            self.thread = threading.Thread(target=self.run, name='event-recorder', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        # A stopped thread is no longer the recorder's thread
+        while not self.closed and self.thread is threading.current_thread():
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            self.flush()
+
+    def stop(self):
+        """Stop the background thread and write the remaining events, recording again restarts the thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        self.flush_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
+    def close(self):
+        """Stop the background thread, write the remaining events and close the sink."""
+        self.closed = True
+        self.stop()
+        self.sink.close()
+
+    def after_fork(self):
+        # The background thread doesn't exist in a forked child process
+        self.lock = threading.Lock()
+        self.sink_lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.thread = None
+        # The parent writes the events it recorded before the fork, the child must not write them again
+        self.tail = self.head
+
+
+recorder = EventRecorder()
+
+
+def get_recorder() -> EventRecorder:
+    """Get the event recorder of the process.
+
+    Returns:
+        EventRecorder: The recorder all the transitions and decisions are recorded to.
+    """
+    return recorder
+
+
+def set_recorder(new_recorder: EventRecorder) -> EventRecorder:
+    """Replace the event recorder of the process, the previous one is stopped and its events are written.
+
+    The previous recorder's sink stays open, so it can be set again.
+
+    Args:
+        new_recorder (EventRecorder): The new recorder.
+
+    Returns:
+        EventRecorder: The previous recorder.
+    """
+    global recorder
+    previous, recorder = recorder, new_recorder
+    previous.stop()
+    return previous
+
+
+atexit.register(lambda: recorder.flush())
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: recorder.after_fork())
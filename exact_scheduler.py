@@ -0,0 +1,138 @@
+import time
+from intersection import Intersection
+from traffic_light import TrafficLight
+from greedy_scheduler import GreedyScheduler
+from typing import Dict, List, Tuple
+from decision_stats import PhaseTimer, add_count
+
+
+class ExactScheduler:
+    """
+    A class that implements an exact traffic light scheduling algorithm.
+
+    The ExactScheduler class finds the set of traffic lights that can work together with the maximum total jam,
+    using a branch and bound maximum weight clique search on the traffic lights compatibility graph.
+    The search starts from the greedy answer and is stopped after a time budget, so a decision is never worse
+    than the one of the GreedyScheduler and never takes much longer than the budget.
+
+    Attributes:
+        time_budget (float): The maximum time (in seconds) of a search.
+
+    Methods:
+        decide_next_step(intersection: Intersection) -> Tuple[TrafficLight, List[TrafficLight], float]:
+            Decide the traffic lights to turn green and calculate the duration for which they will remain green.
+
+        max_weight_clique(traffic_lights: List[TrafficLight], weights: Dict[TrafficLight, float],
+                          initial: List[TrafficLight], deadline: float) -> List[TrafficLight]:
+            Find the set of traffic lights that can work together with the maximum total weight.
+    """
+    time_budget = 0.05
+
+    @staticmethod
+    def decide_next_step(intersection: Intersection) -> Tuple[TrafficLight, List[TrafficLight], float]:
+        """
+        Decide the traffic lights to turn green and calculate the duration for which they will remain green.
+
+        Args:
+            intersection (Intersection): The intersection where the traffic lights are located.
+
+        Returns:
+            Tuple[TrafficLight, List[TrafficLight], float]:
+                A tuple containing:
+                - The main traffic light to make green, the one with the highest jam in the chosen set.
+                - The list of traffic lights that can work together without conflicts.
+                - The duration for which the main traffic light should remain green.
+        """
+        deadline = time.perf_counter() + ExactScheduler.time_budget
+        timer = PhaseTimer()
+        # In the order of the jams array
+        traffic_lights = intersection.indexed_traffic_lights
+        weights = dict(zip(traffic_lights, intersection.get_traffic_light_jams().tolist()))
+        traffic_lights_sorted = sorted(traffic_lights, key=lambda tl: weights[tl], reverse=True)
+        timer.lap('jam_scoring')
+
+        greedy_lights = GreedyScheduler.max_scheduling(traffic_lights_sorted[:1], traffic_lights_sorted[1:])
+        next_lights = ExactScheduler.max_weight_clique(traffic_lights_sorted, weights, greedy_lights, deadline)
+        # Lights with no jam don't change the weight, still there is no reason to leave them red
+        next_lights = GreedyScheduler.max_scheduling(next_lights, [tl for tl in traffic_lights_sorted
+                                                                   if tl not in next_lights])
+        next_lights.sort(key=lambda tl: weights[tl], reverse=True)
+        timer.lap('max_weight_clique')
+
+        main_traffic_light = next_lights[0]
+        traffic_lights_sorted.remove(main_traffic_light)
+        duration = GreedyScheduler.calculate_duration(traffic_lights_sorted)
+        timer.lap('calculate_duration')
+        return main_traffic_light, next_lights, duration
+
+    @staticmethod
+    def max_weight_clique(traffic_lights: List[TrafficLight], weights: Dict[TrafficLight, float],
+                          initial: List[TrafficLight], deadline: float) -> List[TrafficLight]:
+        """
+        Find the set of traffic lights that can work together with the maximum total weight.
+
+        The traffic lights are the vertices of a graph with an edge between every two lights that can work together,
+        so a valid set is a clique. The search branches on the vertices and bounds every branch by coloring
+        the candidates into sets of conflicting lights, only one light of each such set can join the clique.
+
+        Args:
+            traffic_lights (List[TrafficLight]): The traffic lights of an intersection.
+            weights (Dict[TrafficLight, float]): The weight of every traffic light.
+            initial (List[TrafficLight]): A valid set of traffic lights to start from.
+            deadline (float): The time.perf_counter() value at which the search stops with the best set found.
+
+        Returns:
+            List[TrafficLight]: The valid set with the maximum total weight, or the best set found until the deadline.
+        """
+        if not TrafficLight.shared_conflict_index(traffic_lights):
+            return initial
+        # A traffic light that conflicts with itself can only be green alone, the initial set covers that case
+        lights = sorted((tl for tl in traffic_lights if tl.can_join(0)), key=lambda tl: weights[tl], reverse=True)
+        n = len(lights)
+        light_weights = [weights[tl] for tl in lights]
+        compatible = [0] * n
+        for i in range(n):
+            for j in range(i + 1, n):
+                if lights[i].can_join(lights[j].bit):
+                    compatible[i] |= 1 << j
+                    compatible[j] |= 1 << i
+
+        best = [sum(weights[tl] for tl in initial), 0]
+
+        def color_sort(candidates: int) -> Tuple[List[int], List[float]]:
+            # Lower bits have higher weights, so the first vertex of every color is its heaviest one
+            order, bounds = [], []
+            bound = 0
+            uncolored = candidates
+            while uncolored:
+                color = uncolored
+                bound += light_weights[(color & -color).bit_length() - 1]
+                while color:
+                    v = (color & -color).bit_length() - 1
+                    uncolored &= ~(1 << v)
+                    color &= ~(1 << v) & ~compatible[v]
+                    order.append(v)
+                    bounds.append(bound)
+            return order, bounds
+
+        def expand(candidates: int, weight: float, chosen: int):
+            if weight > best[0]:
+                best[0], best[1] = weight, chosen
+            if time.perf_counter() > deadline:
+                raise TimeoutError
+            order, bounds = color_sort(candidates)
+            for k in range(len(order) - 1, -1, -1):
+                if weight + bounds[k] <= best[0]:
+                    return
+                v = order[k]
+                expand(candidates & compatible[v], weight + light_weights[v], chosen | 1 << v)
+                candidates &= ~(1 << v)
+
+        add_count('conflict_checks', n * (n - 1) // 2)
+        try:
+            expand((1 << n) - 1, 0, 0)
+        except TimeoutError:
+            add_count('search_timeouts')
+        if not best[1]:
+            return initial
+        return [lights[v] for v in range(n) if best[1] >> v & 1]
@@ -1,6 +1,7 @@
 from intersection import Intersection
 from traffic_light import TrafficLight
 from typing import List, Tuple
+from decision_stats import PhaseTimer, add_count
 
 
 class GreedyScheduler:
@@ -40,12 +41,15 @@ class GreedyScheduler:
                 - A list of other traffic lights that can work together without conflicts.
                 - The duration for which the main traffic light should remain green.
         """
-        traffic_lights = intersection.get_all_traffic_lights()[:]
-        traffic_lights_sorted = sorted(traffic_lights, key=lambda tl: tl.get_traffic_light_jam(), reverse=True)
+        timer = PhaseTimer()
+        traffic_lights_sorted = intersection.get_traffic_lights_by_jam()
         main_traffic_light = traffic_lights_sorted.pop(0)
+        timer.lap('jam_scoring')
 
         next_lights = GreedyScheduler.max_scheduling([main_traffic_light], traffic_lights_sorted)
+        timer.lap('max_scheduling')
         duration = GreedyScheduler.calculate_duration(traffic_lights_sorted)
+        timer.lap('calculate_duration')
         return main_traffic_light, next_lights, duration
 
     @staticmethod
@@ -61,12 +65,12 @@ class GreedyScheduler:
         Returns:
             float: The duration for which the main traffic light should remain green.
         """
-        lst = []
+        seen = set()
         val = 0
         for index, tl in enumerate(traffic_lights):
             for p in tl.passages_allow:
-                if p not in lst:
-                    lst.append(p)
+                if p not in seen:
+                    seen.add(p)
                     val += (len(traffic_lights) - index) * 0.5 * p.rate.value
         return val
 
@@ -85,8 +89,22 @@ class GreedyScheduler:
         Returns:
             List[TrafficLight]: A list of traffic lights that can work together without conflicts.
         """
+        # Every remaining traffic light is checked once against the set
+        add_count('conflict_checks', len(remaining_light_traffics))
+        if not TrafficLight.shared_conflict_index(cur_light_traffics + remaining_light_traffics):
+            for tl in remaining_light_traffics:
+                optional_addition = cur_light_traffics + [tl]
+                if TrafficLight.can_work_together(optional_addition):
+                    cur_light_traffics = optional_addition
+            return cur_light_traffics
+
+        # No traffic light can be added to a set that is not valid by itself
+        if not TrafficLight.can_work_together(cur_light_traffics):
+            return cur_light_traffics
+        cur_light_traffics = cur_light_traffics[:]
+        mask = TrafficLight.lights_mask(cur_light_traffics)
         for tl in remaining_light_traffics:
-            optional_addition = cur_light_traffics + [tl]
-            if TrafficLight.can_work_together(optional_addition):
-                cur_light_traffics = optional_addition
+            if tl.can_join(mask):
+                cur_light_traffics.append(tl)
+                mask |= tl.bit
         return cur_light_traffics
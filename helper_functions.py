@@ -1,5 +1,4 @@
 from passage import Passage
 from typing import List
-from shapely.geometry import LineString
 
 
@@ -1,7 +1,21 @@
 import copy
+import numpy as np
 from traffic_light import TrafficLight  # Importing TrafficLight for type hinting
-from typing import List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 from enums import TrafficLightState
+from passage_conflict_index import PassageConflictIndex
+from jam_index import JamIndex
+from phase_catalog import PhaseCatalog
+from clock import Clock
+
+
+class IntersectionSnapshot(NamedTuple):
+    """A read-only view of the state of an intersection.
+
+    The traffic lights are the intersection's own objects, only the sequences holding them are copied."""
+    traffic_lights: Tuple[TrafficLight, ...]
+    green_traffic_lights: Tuple[TrafficLight, ...]
+    main_traffic_light: Optional[TrafficLight]
 
 
 class Intersection:
@@ -12,16 +26,35 @@ class Intersection:
 
         Attributes:"""
 
-    def __init__(self, traffic_lights: List[TrafficLight]):
+    def __init__(self, traffic_lights: List[TrafficLight], conflict_index: PassageConflictIndex = None):
         """Initialize an Intersection object with a list of traffic lights.
 
         Args:
             traffic_lights (list[TrafficLight]): A list of TrafficLight objects representing the traffic lights at the intersection.
+            conflict_index (PassageConflictIndex): An index already holding the conflicts of the passages,
+                e.g. one loaded from a conflict cache. A new index is built by default.
         """
         self.traffic_lights = traffic_lights
         self.currennt_green_traffic_lighters = []
         self.currennt_main_traffic_light = None
         self.crosswalk_val = 0
+        self.conflict_index = conflict_index if conflict_index is not None else PassageConflictIndex()
+        self.indexed_traffic_lights = []
+        self.passage_lights_masks = {}
+        self.passage_traffic_lights: Dict[int, List[TrafficLight]] = {}
+        self.jam_index = JamIndex()
+        self.phase_catalog = None
+        # The passages of every traffic light, as (passage row, traffic light index) entries of the passage table.
+        # The entries are appended light by light, so they are already in CSR order, but they are kept as COO pairs:
+        # a bincount over the entries is one pass like a reduceat over CSR rows, and reduceat gets lights with no
+        # passages wrong, so an indptr array would only be an extra array to keep up to date.
+        self.passage_table = None  # The table of all the passages, None when there are none or they are in a few
+        self.mixed_tables = False
+        self.membership_rows = []
+        self.membership_lights = []
+        self.membership = None
+        for t in traffic_lights:
+            self.index_traffic_light(t)
 
     def get_current_green_light(self) -> Optional[List[TrafficLight]]:
         """Get the currently active green traffic light.
@@ -85,6 +118,54 @@ class Intersection:
             traffic_light (TrafficLight): The traffic light to add to the intersection.
         """
         self.traffic_lights.append(traffic_light)
+        self.index_traffic_light(traffic_light)
+
+    def index_traffic_light(self, traffic_light: TrafficLight):
+        """Add the passages of a traffic light to the intersection's conflict index,
+        and give the traffic light its bit and the mask of the traffic lights it conflicts with.
+
+        Args:
+            traffic_light (TrafficLight): A traffic light of the intersection.
+        """
+        if traffic_light.conflict_index is self.conflict_index:
+            return
+        passages = traffic_light.get_passages()
+        self.conflict_index.add_passages(passages)
+        traffic_light.conflict_index = self.conflict_index
+        traffic_light.bit = 1 << len(self.indexed_traffic_lights)
+        self.indexed_traffic_lights.append(traffic_light)
+        for p in passages:
+            self.passage_lights_masks[p.id] = self.passage_lights_masks.get(p.id, 0) | traffic_light.bit
+            self.passage_traffic_lights.setdefault(p.id, []).append(traffic_light)
+
+        conflict_mask = 0
+        for p in passages:
+            for passage_id in self.conflict_index.get_conflicts(p):
+                conflict_mask |= self.passage_lights_masks.get(passage_id, 0)
+        traffic_light.conflict_mask = conflict_mask
+        # Visit only the traffic lights in the mask, by their bits
+        others = conflict_mask & ~traffic_light.bit
+        while others:
+            low_bit = others & -others
+            self.indexed_traffic_lights[low_bit.bit_length() - 1].conflict_mask |= traffic_light.bit
+            others ^= low_bit
+
+        self.jam_index.add_traffic_light(traffic_light)
+        traffic_light.jam_index = self.jam_index
+        if self.phase_catalog is not None:
+            self.phase_catalog.add_traffic_light(traffic_light)
+
+        position = len(self.indexed_traffic_lights) - 1
+        for p in passages:
+            if p.table is not self.passage_table and not self.mixed_tables:
+                if self.passage_table is None:
+                    self.passage_table = p.table
+                else:
+                    self.passage_table = None
+                    self.mixed_tables = True
+            self.membership_rows.append(p.row)
+            self.membership_lights.append(position)
+        self.membership = None
 
     def add_traffic_lights(self, traffic_lights: List[TrafficLight]):
         """Add multiple traffic lights to the intersection.
@@ -95,6 +176,16 @@ class Intersection:
         for t in traffic_lights:
             self.add_traffic_light(t)
 
+    def set_clock(self, clock: Clock):
+        """Set the clock of all the traffic lights and passages at the intersection, restarting their timers.
+
+        Args:
+            clock (Clock): The new clock, e.g. a VirtualClock to simulate the intersection.
+        """
+        # The jam index moves to the new clock with the first traffic light
+        for t in self.traffic_lights:
+            t.set_clock(clock)
+
     def get_all_traffic_lights(self) -> List[TrafficLight]:
         """Get a list of all traffic lights at the intersection.
 
@@ -103,6 +194,95 @@ class Intersection:
         """
         return self.traffic_lights
 
+    def get_traffic_light_jams(self) -> np.ndarray:
+        """Calculate the jam of all the traffic lights at the intersection in one vectorized pass.
+
+        Returns:
+            np.ndarray: The get_traffic_light_jam values, in the order of indexed_traffic_lights (of their bits).
+            A traffic light listed twice in get_all_traffic_lights has one value.
+        """
+        if self.passage_table is None:
+            return np.array([t.get_traffic_light_jam() for t in self.indexed_traffic_lights], dtype=np.float64)
+        rows, lights = self.get_membership()
+        return self.passage_table.traffic_light_jams(rows, lights, len(self.indexed_traffic_lights),
+                                                     self.jam_index.clock.time())
+
+    def get_average_jam_times(self) -> np.ndarray:
+        """Calculate the average jam time of all the traffic lights at the intersection in one vectorized pass.
+
+        Returns:
+            np.ndarray: The average_jam_time values, in the order of indexed_traffic_lights (of their bits).
+            A traffic light listed twice in get_all_traffic_lights has one value.
+        """
+        if self.passage_table is None:
+            return np.array([t.average_jam_time() for t in self.indexed_traffic_lights], dtype=np.float64)
+        rows, lights = self.get_membership()
+        rates = self.passage_table.traffic_light_rates(rows, lights, len(self.indexed_traffic_lights))
+        return self.get_traffic_light_jams() / (rates * rates)
+
+    def get_membership(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the passages of the traffic lights at the intersection as arrays.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The passage table row and the traffic light index of every
+            (traffic light, passage) pair.
+        """
+        if self.membership is None:
+            self.membership = (np.array(self.membership_rows, dtype=np.intp),
+                               np.array(self.membership_lights, dtype=np.intp))
+        return self.membership
+
+    def update_passage_counts(self, counts: Dict[int, int]) -> int:
+        """Set the vehicle counts of passages, and the traffic_jam of their traffic lights.
+
+        Args:
+            counts (Dict[int, int]): The number of vehicles waiting at every passage, by passage id.
+                Passages that aren't at the intersection are ignored.
+
+        Returns:
+            int: The number of passages updated.
+        """
+        passages = []
+        for passage_id, count in counts.items():
+            passage = self.conflict_index.passages.get(passage_id)
+            if passage is not None:
+                passage.count = count
+                passages.append(passage)
+        if passages:
+            traffic_lights = {tl for p in passages for tl in self.passage_traffic_lights[p.id]}
+            for tl in traffic_lights:
+                tl.traffic_jam = sum(p.count for p in tl.get_passages())
+            self.jam_index.update_passages(passages)
+        return len(passages)
+
+    def get_phase_catalog(self) -> PhaseCatalog:
+        """Get the catalog of the maximal sets of traffic lights that can be green together, built on the first call
+        and kept up to date when traffic lights are added.
+
+        Returns:
+            PhaseCatalog: The phase catalog of the intersection.
+        """
+        if self.phase_catalog is None:
+            self.phase_catalog = PhaseCatalog(self.indexed_traffic_lights)
+        return self.phase_catalog
+
+    def get_traffic_lights_by_jam(self) -> List[TrafficLight]:
+        """Get all the traffic lights at the intersection sorted by their jam, from the highest.
+
+        Returns:
+            list[TrafficLight]: The traffic lights, sorted like their get_traffic_light_jam values.
+        """
+        return self.jam_index.sorted_traffic_lights()
+
+    def get_snapshot(self) -> IntersectionSnapshot:
+        """Get a read-only view of the intersection's traffic lights, without copying them.
+
+        Returns:
+            IntersectionSnapshot: The traffic lights, the current green traffic lights and the current main one.
+        """
+        return IntersectionSnapshot(tuple(self.traffic_lights), tuple(self.currennt_green_traffic_lighters),
+                                    self.currennt_main_traffic_light)
+
     def get_copy_all_traffic_lights(self) -> List[TrafficLight]:
         """Get a deep copy list of all traffic lights at the intersection.
 
@@ -122,9 +302,28 @@ class Intersection:
             return
         return self.currennt_main_traffic_light.get_remaining_duration() - self.crosswalk_val
 
-    def crosswalk_button(self, id):
-        for t in self.currennt_green_traffic_lighters:
-            for p in t.passages_allow:
-                if p.id == id:
-                    self.crosswalk_val = 1
-                    return
+    def get_passage_traffic_lights(self, passage_id: int) -> List[TrafficLight]:
+        """Get the traffic lights that allow a passage.
+
+        Args:
+            passage_id (int): The id of the passage.
+
+        Returns:
+            list[TrafficLight]: The traffic lights of the intersection allowing the passage.
+        """
+        return self.passage_traffic_lights.get(passage_id, [])
+
+    def crosswalk_button(self, id) -> bool:
+        """Shorten the current phase when the crosswalk button of a green passage is pressed.
+
+        Args:
+            id (int): The id of the passage of the crosswalk.
+
+        Returns:
+            bool: True if the passage is green and the phase was shortened.
+        """
+        for t in self.get_passage_traffic_lights(id):
+            if t.get_state() == TrafficLightState.GREEN:
+                self.crosswalk_val = 1
+                return True
+        return False
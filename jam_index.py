@@ -0,0 +1,159 @@
+import bisect
+import heapq
+from passage_table import COUNT_WEIGHT, PassageTable
+from traffic_light import TrafficLight
+from typing import Dict, List, Optional, Tuple
+
+
+class JamIndex:
+    """
+    A class keeping the traffic lights of an intersection ordered by their jam.
+
+    The jam of a traffic light is sum(rate * (now - last_open) + COUNT_WEIGHT * count) over its passages,
+    which is R * now - C for the light's total rate R and C = sum(rate * last_open - COUNT_WEIGHT * count).
+    C only changes when red_on resets the passages or a sensor updates their counts,
+    and traffic lights with the same total rate keep their order while the time passes, so the traffic lights
+    are kept in a sorted list for every total rate and merged by their current jam when needed.
+
+    All the traffic lights share the index's clock, the index moves to a new clock when set_clock is called on
+    one of them. A passage doesn't know its traffic lights, so a rate change is noticed lazily: the passage tables
+    count their rate changes, and the rates and keys are recomputed when a count moved since the last read.
+    """
+
+    def __init__(self):
+        """Initialize a JamIndex object."""
+        self.clock = None
+        self.origin = 0.0
+        self.groups: Dict[int, List[Tuple[float, int, TrafficLight]]] = {}
+        self.keys: Dict[TrafficLight, Tuple[float, int, TrafficLight]] = {}
+        self.rates: Dict[TrafficLight, int] = {}
+        self.passage_lights: Dict[int, List[TrafficLight]] = {}
+        self.rate_versions: Dict[PassageTable, int] = {}  # The rate_version of every table the rates were read at
+        self.count = 0
+
+    def __deepcopy__(self, memo):
+        # Copies of traffic lights keep reporting the resets of their passages to the intersection's index
+        return self
+
+    def add_traffic_light(self, traffic_light: TrafficLight):
+        """Add a traffic light to the index.
+
+        Args:
+            traffic_light (TrafficLight): The traffic light to add.
+        """
+        if self.clock is None:
+            # Times are kept relative to the first one, to keep the float sums precise
+            self.clock = traffic_light.clock
+            self.origin = self.clock.time()
+        elif traffic_light.clock is not self.clock:
+            raise ValueError('The traffic lights of an intersection must share one clock, see Intersection.set_clock.')
+        self.refresh_rates()
+        rate = sum(p.rate.value for p in traffic_light.get_passages())
+        self.rates[traffic_light] = rate
+        for p in traffic_light.get_passages():
+            self.passage_lights.setdefault(p.id, []).append(traffic_light)
+            self.rate_versions.setdefault(p.table, p.table.rate_version)
+        key = (self.calculate_offset(traffic_light), self.count, traffic_light)
+        self.count += 1
+        self.keys[traffic_light] = key
+        bisect.insort(self.groups.setdefault(rate, []), key)
+
+    def calculate_offset(self, traffic_light: TrafficLight) -> float:
+        """Calculate the sum of rate * last_open - COUNT_WEIGHT * count of the passages of a traffic light,
+        with the times relative to the origin.
+
+        Args:
+            traffic_light (TrafficLight): An indexed traffic light.
+
+        Returns:
+            float: The offset C of the traffic light's jam R * now - C.
+        """
+        return sum(p.rate.value * (p.last_open - self.origin) - COUNT_WEIGHT * p.count
+                   for p in traffic_light.get_passages())
+
+    def set_clock(self, traffic_light: TrafficLight):
+        """Update the index after the clock of one of its traffic lights was set.
+
+        A new clock becomes the clock of the index, with a new origin, and all the keys are recomputed.
+
+        Args:
+            traffic_light (TrafficLight): An indexed traffic light whose passages were reset on its new clock.
+        """
+        if traffic_light.clock is self.clock:
+            self.update_passages(traffic_light.get_passages())
+            return
+        self.clock = traffic_light.clock
+        self.origin = self.clock.time()
+        self.rebuild_keys()
+
+    def refresh_rates(self):
+        """Recompute the total rates and the keys if a rate of a passage changed since they were computed."""
+        if any(table.rate_version != version for table, version in self.rate_versions.items()):
+            self.rate_versions = {table: table.rate_version for table in self.rate_versions}
+            self.rebuild_keys()
+
+    def rebuild_keys(self):
+        """Recompute the total rate and the key of every traffic light, keeping their positions."""
+        self.groups = {}
+        for tl, (_, position, _) in self.keys.items():
+            rate = self.rates[tl] = sum(p.rate.value for p in tl.get_passages())
+            key = self.keys[tl] = (self.calculate_offset(tl), position, tl)
+            self.groups.setdefault(rate, []).append(key)
+        for group in self.groups.values():
+            group.sort()
+
+    def update_passages(self, passages):
+        """Update the traffic lights of passages that were reset or counted.
+
+        Args:
+            passages (List[Passage]): The passages whose last_open or count changed.
+        """
+        self.refresh_rates()
+        traffic_lights = {tl for p in passages for tl in self.passage_lights.get(p.id, ())}
+        for tl in traffic_lights:
+            group = self.groups[self.rates[tl]]
+            old_key = self.keys[tl]
+            del group[bisect.bisect_left(group, old_key)]
+            key = self.keys[tl] = (self.calculate_offset(tl), old_key[1], tl)
+            bisect.insort(group, key)
+
+    def get_jam(self, traffic_light: TrafficLight) -> float:
+        """Get the current jam of an indexed traffic light.
+
+        Args:
+            traffic_light (TrafficLight): An indexed traffic light.
+
+        Returns:
+            float: The jam of the traffic light, like TrafficLight.get_traffic_light_jam.
+        """
+        self.refresh_rates()
+        return self.rates[traffic_light] * (self.clock.time() - self.origin) - self.keys[traffic_light][0]
+
+    def get_max_jam_traffic_light(self) -> Optional[TrafficLight]:
+        """Get the traffic light with the highest jam, the first one added on a tie.
+
+        Returns:
+            TrafficLight or None: The traffic light with the highest jam, None if the index is empty.
+        """
+        self.refresh_rates()
+        elapsed = self.clock.time() - self.origin if self.clock else 0
+        best = None
+        for rate, group in self.groups.items():
+            if group:
+                offset, position, tl = group[0]
+                key = (offset - rate * elapsed, position)
+                if best is None or key < best[0]:
+                    best = key, tl
+        return best[1] if best else None
+
+    def sorted_traffic_lights(self) -> List[TrafficLight]:
+        """Get the traffic lights sorted by their jam from the highest, the first ones added first on ties.
+
+        Returns:
+            List[TrafficLight]: The indexed traffic lights.
+        """
+        self.refresh_rates()
+        elapsed = self.clock.time() - self.origin if self.clock else 0
+        merged = heapq.merge(*[[(offset - rate * elapsed, position, tl) for offset, position, tl in group]
+                               for rate, group in self.groups.items()])
+        return [tl for _, _, tl in merged]
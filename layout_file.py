@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import numpy as np
+from clock import Clock, SYSTEM_CLOCK
+from conflict_kernel import conflict_pairs
+from enums import PassageJam
+from intersection import Intersection
+from passage import Passage
+from passage_conflict_index import PassageConflictIndex
+from traffic_light import TrafficLight
+from typing import List
+
+
+class LayoutFile:
+    """
+    A class loading and saving intersection definitions as JSON layout files.
+
+    A layout file lists the passages of the intersection with their PassageJam rates and optional names,
+    and the traffic lights as lists of passage indexes:
+
+        {"passages": [{"name": "north right", "source": [14, 8], "target": [16, 10], "rate": "MEDIUM"}, ...],
+         "traffic_lights": [[0, 1], [2], ...]}
+
+    The conflicts between the passages are cached next to the layout file in a .npy array of conflicting pairs
+    of passage indexes, named by a hash of the passages geometry, so loading a large layout memory-maps the
+    conflicts instead of recomputing them, and the cache grows with the conflicts, not the square of the passages.
+    A layout whose geometry changed gets a new cache file.
+    """
+
+    @staticmethod
+    def geometry_hash(coordinates: np.ndarray) -> str:
+        """
+        Hash the geometry of the passages of a layout.
+
+        Args:
+            coordinates (np.ndarray): An (N, 4) array of passages (source x, source y, target x, target y).
+
+        Returns:
+            str: A hex digest identifying the passages and their order.
+        """
+        return hashlib.sha256(np.ascontiguousarray(coordinates, dtype='<f8').tobytes()).hexdigest()[:16]
+
+    @staticmethod
+    def cache_path(path: str, coordinates: np.ndarray) -> str:
+        """
+        Get the path of the conflict cache of a layout.
+
+        Args:
+            path (str): The path of the layout file.
+            coordinates (np.ndarray): The coordinates of the passages of the layout.
+
+        Returns:
+            str: The path of the .npy file holding the conflicting pairs of the passages.
+        """
+        return f'{os.path.splitext(path)[0]}.{LayoutFile.geometry_hash(coordinates)}.conflicts.npy'
+
+    @staticmethod
+    def load_conflicts(path: str, coordinates: np.ndarray, use_cache: bool = True) -> np.ndarray:
+        """
+        Get the conflicting pairs of the passages of a layout, from its cache when it exists.
+
+        A missing or invalid cache is calculated and written, a cache that can't be written is skipped.
+
+        Args:
+            path (str): The path of the layout file.
+            coordinates (np.ndarray): The coordinates of the passages of the layout.
+            use_cache (bool): Whether to read and write the cache.
+
+        Returns:
+            np.ndarray: An (M, 2) array of the indexes of two conflicting passages, the smaller one first, for
+            PassageConflictIndex.add_passages (memory-mapped from the cache).
+        """
+        if not use_cache:
+            return LayoutFile.calculate_conflicts(coordinates)
+        cache_path = LayoutFile.cache_path(path, coordinates)
+        try:
+            pairs = np.load(cache_path, mmap_mode='r')
+            if pairs.ndim == 2 and pairs.shape[1] == 2 and pairs.dtype == np.int64 \
+                    and (not len(pairs) or 0 <= pairs.min() and pairs.max() < len(coordinates)):
+                return pairs
+        except (OSError, ValueError):
+            pass
+        pairs = LayoutFile.calculate_conflicts(coordinates)
+        LayoutFile.save_conflicts(cache_path, pairs)
+        return pairs
+
+    @staticmethod
+    def calculate_conflicts(coordinates: np.ndarray) -> np.ndarray:
+        """
+        Calculate the conflicting pairs of the passages of a layout.
+
+        Args:
+            coordinates (np.ndarray): The coordinates of the passages of the layout.
+
+        Returns:
+            np.ndarray: An (M, 2) array of the indexes of two conflicting passages, the smaller one first, sorted.
+        """
+        rows, columns = conflict_pairs(coordinates, coordinates)
+        # Conflicts are symmetric, the index records both directions of a pair
+        first = rows < columns
+        pairs = np.stack((rows[first], columns[first]), axis=1).astype(np.int64)
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    @staticmethod
+    def save_conflicts(cache_path: str, pairs: np.ndarray):
+        """
+        Write a conflict cache, the file is replaced at once so readers never see a partial cache.
+
+        Args:
+            cache_path (str): The path of the cache file.
+            pairs (np.ndarray): The conflicting pairs.
+        """
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                np.save(f, np.asarray(pairs, dtype=np.int64))
+            os.replace(temp_path, cache_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def load(path: str, clock: Clock = SYSTEM_CLOCK, use_cache: bool = True) -> Intersection:
+        """
+        Load an intersection from a layout file.
+
+        Args:
+            path (str): The path of the layout file.
+            clock (Clock): The clock of the passages and traffic lights.
+            use_cache (bool): Whether to read and write the conflict cache.
+
+        Returns:
+            Intersection: The intersection of the layout.
+        """
+        with open(path) as f:
+            layout = json.load(f)
+        passages = [Passage(tuple(p['source']), tuple(p['target']), PassageJam[p.get('rate', 'MEDIUM')], clock,
+                            name=p.get('name')) for p in layout['passages']]
+        for indexes in layout['traffic_lights']:
+            if not indexes or not all(0 <= i < len(passages) for i in indexes):
+                raise ValueError(f'Not a valid traffic light in the layout file: {indexes}')
+        traffic_lights = [TrafficLight([passages[i] for i in indexes], clock) for indexes in layout['traffic_lights']]
+
+        conflict_index = PassageConflictIndex()
+        if passages:
+            coordinates = np.array([p.source + p.target for p in passages], dtype=np.float64)
+            conflict_index.add_passages(passages, LayoutFile.load_conflicts(path, coordinates, use_cache))
+        return Intersection(traffic_lights, conflict_index)
+
+    @staticmethod
+    def save(intersection: Intersection, path: str, use_cache: bool = True):
+        """
+        Save an intersection to a layout file.
+
+        A passage shared by a few traffic lights is saved once. The conflict cache is written too,
+        from the intersection's conflict index.
+
+        Args:
+            intersection (Intersection): The intersection to save.
+            path (str): The path of the layout file.
+            use_cache (bool): Whether to write the conflict cache.
+        """
+        passages: List[Passage] = []
+        indexes = {}
+        traffic_lights = []
+        for tl in intersection.get_all_traffic_lights():
+            light_indexes = []
+            for p in tl.get_passages():
+                if p.id not in indexes:
+                    indexes[p.id] = len(passages)
+                    passages.append(p)
+                light_indexes.append(indexes[p.id])
+            traffic_lights.append(light_indexes)
+
+        layout = {
+            'passages': [({'name': p.name} if p.name is not None else {})
+                         | {'source': list(p.source), 'target': list(p.target), 'rate': p.rate.name} for p in passages],
+            'traffic_lights': traffic_lights,
+        }
+        with open(path, 'w') as f:
+            json.dump(layout, f, indent=2)
+
+        if use_cache and passages:
+            coordinates = np.array([p.source + p.target for p in passages], dtype=np.float64)
+            LayoutFile.save_conflicts(LayoutFile.cache_path(path, coordinates),
+                                      LayoutFile.index_conflicts(intersection.conflict_index, passages))
+
+    @staticmethod
+    def index_conflicts(conflict_index: PassageConflictIndex, passages: List[Passage]) -> np.ndarray:
+        """
+        Get the conflicting pairs of passages from a conflict index.
+
+        Args:
+            conflict_index (PassageConflictIndex): An index holding all the passages.
+            passages (List[Passage]): The passages, in the order of their indexes.
+
+        Returns:
+            np.ndarray: An (M, 2) array of the indexes of two conflicting passages, the smaller one first, sorted.
+        """
+        positions = {p.id: i for i, p in enumerate(passages)}
+        pairs = [(i, j) for i, p in enumerate(passages)
+                 for j in sorted(positions[other_id] for other_id in conflict_index.get_conflicts(p)
+                                 if other_id in positions) if i < j]
+        return np.array(pairs, dtype=np.int64).reshape(-1, 2)
@@ -0,0 +1,229 @@
+import time
+import weakref
+import numpy as np
+from intersection import Intersection
+from traffic_light import TrafficLight
+from greedy_scheduler import GreedyScheduler
+from typing import Dict, List, Optional, Tuple
+from decision_stats import PhaseTimer, add_count
+
+# A plan is a sequence of (phase, duration) steps, a phase is a bitmask of traffic light positions
+Plan = Tuple[Tuple[int, float], ...]
+
+
+class LookaheadState:
+    """The planning state the LookaheadScheduler keeps for an intersection between its decisions."""
+
+    def __init__(self, traffic_lights: List[TrafficLight]):
+        """Initialize a LookaheadState object.
+
+        Args:
+            traffic_lights (List[TrafficLight]): The traffic lights of the intersection.
+        """
+        self.traffic_lights = list(traffic_lights)
+        self.rates = np.array([sum(p.rate.value for p in tl.get_passages()) for tl in traffic_lights],
+                              dtype=np.float64)
+        self.plan: Plan = ()
+        self.memo: Dict[tuple, Tuple[float, Plan]] = {}
+
+
+class LookaheadScheduler:
+    """
+    A class that implements a rolling horizon traffic light scheduling algorithm.
+
+    The LookaheadScheduler plans the next phases and their durations for a horizon of time, and turns on
+    the first phase of the plan. The jam of a red traffic light grows by its rate every second and is reset
+    when the light was green, and the plan minimizes the total jam of the red lights over the horizon,
+    where switching to another phase costs lost_time seconds of all the lights being red.
+
+    The plan is found by dynamic programming over the candidate phases (the greedy sets of traffic lights that
+    can work together, seeded by every light) and the durations. The states are memoized by the candidate phases
+    and their jams rounded to jam_quantum, and the memo is kept between decisions, so every cycle reuses the plans
+    of the previous ones. The search is deepened one phase at a time up to depth phases, and when it runs out of
+    its time budget the plan of the deepest finished search is taken. When not even a one phase plan was found,
+    the rest of the previous plan is followed, or the greedy decision is taken when there is no plan left.
+
+    Attributes:
+        depth (int): The maximum number of phases in a plan.
+        durations (Tuple[float, ...]): The green durations (in seconds) a phase can take.
+        lost_time (float): The time (in seconds) lost when switching to another phase.
+        horizon (float): The time (in seconds) a plan covers.
+        max_phases (int): The maximum number of candidate phases, the ones with the highest jams are kept.
+        jam_quantum (float): The resolution of the jams in the memo keys.
+        time_budget (float): The maximum time (in seconds) of a search.
+        memo_size (int): The number of memoized states an intersection keeps, the memo is cleared when full.
+        states (weakref.WeakKeyDictionary): The LookaheadState of every intersection.
+    """
+    depth = 3
+    durations = (5, 10, 20)
+    lost_time = 2
+    horizon = 40
+    max_phases = 6
+    jam_quantum = 10.0
+    time_budget = 0.05
+    memo_size = 100000
+    states = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def decide_next_step(intersection: Intersection) -> Tuple[TrafficLight, List[TrafficLight], float]:
+        """
+        Decide the traffic lights to turn green and the duration for which they will remain green.
+
+        Args:
+            intersection (Intersection): The intersection where the traffic lights are located.
+
+        Returns:
+            Tuple[TrafficLight, List[TrafficLight], float]:
+                A tuple containing:
+                - The main traffic light to make green, the one with the highest jam in the planned phase.
+                - The list of traffic lights of the phase.
+                - The duration of the phase.
+        """
+        deadline = time.perf_counter() + LookaheadScheduler.time_budget
+        # In the order of the jams array
+        traffic_lights = intersection.indexed_traffic_lights
+        state = LookaheadScheduler.states.get(intersection)
+        if state is None or state.traffic_lights != traffic_lights:
+            state = LookaheadScheduler.states[intersection] = LookaheadState(traffic_lights)
+        if len(state.memo) > LookaheadScheduler.memo_size:
+            state.memo.clear()
+
+        timer = PhaseTimer()
+        jams = intersection.get_traffic_light_jams()
+        positions = {tl: i for i, tl in enumerate(traffic_lights)}
+        # The control loop makes the lights red before deciding, so the phase that was green is the planned one
+        current_phase = state.plan[0][0] if state.plan else 0
+        for tl in intersection.get_current_green_light():
+            current_phase |= 1 << positions[tl]
+        phases = LookaheadScheduler.candidate_phases(traffic_lights, jams)
+        timer.lap('candidate_phases')
+
+        try:
+            _, plan = LookaheadScheduler.plan(phases, jams, state, current_phase, deadline)
+        except TimeoutError:
+            add_count('search_timeouts')
+            # Follow the previous plan while its phases are still candidates
+            plan = state.plan[1:] if state.plan[1:] and state.plan[1][0] in phases else ()
+        timer.lap('plan')
+        if not plan:
+            state.plan = ()
+            return GreedyScheduler.decide_next_step(intersection)
+        state.plan = plan
+
+        phase, duration = plan[0]
+        next_lights = [tl for i, tl in enumerate(traffic_lights) if phase >> i & 1]
+        next_lights.sort(key=lambda tl: jams[positions[tl]], reverse=True)
+        return next_lights[0], next_lights, duration
+
+    @staticmethod
+    def candidate_phases(traffic_lights: List[TrafficLight], jams: np.ndarray) -> List[int]:
+        """
+        Find the phases the plans are made of.
+
+        The traffic lights with the highest jams seed a phase each, extended greedily by the traffic lights with
+        the highest jams that can work with the seed. The phases with the highest total jams are kept.
+
+        Args:
+            traffic_lights (List[TrafficLight]): The traffic lights of the intersection.
+            jams (np.ndarray): The jam of every traffic light.
+
+        Returns:
+            List[int]: The phases, as bitmasks of traffic light positions.
+        """
+        order = np.argsort(-jams, kind='stable').tolist()
+        sorted_lights = [traffic_lights[i] for i in order]
+        positions = {tl: i for i, tl in enumerate(traffic_lights)}
+        phases = {}
+        for tl in sorted_lights[:2 * LookaheadScheduler.max_phases]:
+            lights = GreedyScheduler.max_scheduling([tl], [other for other in sorted_lights if other is not tl])
+            phase = 0
+            for light in lights:
+                phase |= 1 << positions[light]
+            if phase not in phases:
+                phases[phase] = sum(jams[positions[light]] for light in lights)
+        return sorted(phases, key=lambda phase: phases[phase], reverse=True)[:LookaheadScheduler.max_phases]
+
+    @staticmethod
+    def plan(phases: List[int], jams: np.ndarray, state: LookaheadState, current_phase: int,
+             deadline: float) -> Tuple[float, Plan]:
+        """
+        Find the plan with the lowest cost over the horizon, with at most one more phase every round until the
+        depth or the deadline is reached.
+
+        Args:
+            phases (List[int]): The candidate phases.
+            jams (np.ndarray): The current jam of every traffic light.
+            state (LookaheadState): The planning state of the intersection.
+            current_phase (int): The phase that is green now.
+            deadline (float): The time.perf_counter() value at which the search stops.
+
+        Returns:
+            Tuple[float, Plan]: The cost of the plan and its steps, from the deepest round finished before the deadline.
+
+        Raises:
+            TimeoutError: If the deadline passed before a one phase plan was found.
+        """
+        n = len(state.traffic_lights)
+        rates = state.rates
+        lost_time = LookaheadScheduler.lost_time
+        quantum = LookaheadScheduler.jam_quantum
+        masks = {phase: np.array([phase >> i & 1 for i in range(n)], dtype=bool) for phase in phases}
+        # The best plan of a state depends on the phases it can use, and the candidates change with the jams
+        phases_key = tuple(sorted(phases))
+        # Try the rest of the previous plan first, it is the most likely to be chosen again
+        if len(state.plan) > 1 and state.plan[1][0] in masks:
+            phases = [state.plan[1][0]] + [phase for phase in phases if phase != state.plan[1][0]]
+
+        def red_cost(red_jams: np.ndarray, red_rates: np.ndarray, duration: float) -> float:
+            # The integral of the jams of red lights over a duration
+            return float(red_jams.sum() * duration + red_rates.sum() * duration * duration / 2)
+
+        hits = misses = 0
+
+        def search(jams: np.ndarray, previous: int, time_left: float, steps_left: int) -> Tuple[float, Plan]:
+            nonlocal hits, misses
+            key = (phases_key, tuple((jams // quantum).astype(np.int64).tolist()), previous, time_left, steps_left)
+            if key in state.memo:
+                hits += 1
+                return state.memo[key]
+            misses += 1
+            if time.perf_counter() > deadline:
+                raise TimeoutError
+            best: Optional[Tuple[float, Plan]] = None
+            for phase in phases:
+                green = masks[phase]
+                switch = lost_time if phase != previous else 0
+                switch = min(switch, time_left)
+                cost = red_cost(jams, rates, switch)
+                switched_jams = jams + rates * switch
+                # The last phase of a plan lasts until the horizon, a longer phase is planned as the same phase twice
+                durations = [d for d in LookaheadScheduler.durations if d < time_left - switch] \
+                    if steps_left > 1 else []
+                if not durations:
+                    durations.append(time_left - switch)
+                for duration in durations:
+                    red = ~green
+                    step_cost = cost + red_cost(switched_jams[red], rates[red], duration)
+                    next_jams = np.where(green, 0.0, switched_jams + rates * duration)
+                    if duration < time_left - switch:
+                        rest_cost, rest = search(next_jams, phase, time_left - switch - duration, steps_left - 1)
+                    else:
+                        rest_cost, rest = 0.0, ()
+                    if best is None or step_cost + rest_cost < best[0]:
+                        best = step_cost + rest_cost, ((phase, duration),) + rest
+            state.memo[key] = best
+            return best
+
+        jams = np.asarray(jams, dtype=np.float64)
+        best = None
+        try:
+            for depth in range(1, LookaheadScheduler.depth + 1):
+                best = search(jams, current_phase, LookaheadScheduler.horizon, depth)
+        except TimeoutError:
+            if best is None:
+                raise
+            add_count('search_timeouts')
+        finally:
+            add_count('cache_hits', hits)
+            add_count('cache_misses', misses)
+        return best
@@ -1,41 +1,138 @@
 from typing import Tuple, List
-from shapely.geometry import LineString
 from enums import PassageJam
-import time
+from conflict_kernel import conflict_matrix, passages_to_coordinates
+from clock import Clock, SYSTEM_CLOCK
+from passage_table import PassageTable, DEFAULT_TABLE, COUNT_WEIGHT
+from segment import Segment
+import numpy as np
+
+
+PASSAGE_JAMS = {jam.value: jam for jam in PassageJam}
 
 
 class Passage:
     """A class representing a passage between two points.
 
-    Each passage is represented by a line segment between a source and a target point."""
+    Each passage is represented by a line segment between a source and a target point.
+    The values of the passage are stored in a row of a PassageTable, the Passage object is a thin view over it.
+    Conflict checks use a lightweight Segment, the shapely geometry is only built when it is asked for."""
+    __slots__ = ('id', 'name', 'table', 'row', 'clock', 'line', 'x_min', 'x_max', 'line_string')
     counter = 1
 
-    def __init__(self, source: Tuple[float, float], target: Tuple[float, float], rate=PassageJam.MEDIUM):
+    def __init__(self, source: Tuple[float, float], target: Tuple[float, float], rate=PassageJam.MEDIUM,
+                 clock: Clock = SYSTEM_CLOCK, table: PassageTable = DEFAULT_TABLE, name: str = None):
         """Initialize a new Passage object representing a line segment between two points.
 
         Args:
             source (Tuple[float, float]): The coordinates of the source point (x, y).
             target (Tuple[float, float]): The coordinates of the target point (x, y).
             rate: the importance of this passage.
+            clock (Clock): The clock used to measure the time from the last open.
+            table (PassageTable): The table storing the passage's values.
+            name (str): A description of the passage, e.g. the roads it connects.
         """
         self.id = Passage.counter
         Passage.counter += 1
-        self.source = source
-        self.target = target
-        self.rate = rate
-        self.line = line = LineString([source, target])
-        self.x_min = min(source[0], target[0])
-        self.x_max = max(source[0], target[0])
-        self.last_open = time.time()
+        self.name = name
+        self.clock = clock
+        self.table = table
+        self.row = table.add(self.id, source, target, rate.value, clock.time())
+        # The x range is read by every scalar conflict check, so it is kept on the view too
+        self.x_min, self.x_max = min(source[0], target[0]), max(source[0], target[0])
+        self.line = Segment(source[0], source[1], target[0], target[1])
+        self.line_string = None
+
+    def __copy__(self):
+        # Every copy gets its own row, a row is freed when its Passage object is collected
+        copy = Passage.__new__(Passage)
+        copy.id, copy.name, copy.clock, copy.table, copy.line = self.id, self.name, self.clock, self.table, self.line
+        copy.x_min, copy.x_max, copy.line_string = self.x_min, self.x_max, self.line_string
+        copy.row = self.table.add(self.id, self.source, self.target, self.rate.value, self.last_open, self.count)
+        return copy
+
+    def __deepcopy__(self, memo):
+        copy = self.__copy__()
+        memo[id(self)] = copy
+        return copy
+
+    def __del__(self):
+        # A Passage built without a row (e.g. a failed __init__) has nothing to free
+        row = getattr(self, 'row', None)
+        if row is not None:
+            self.table.free(row)
+
+    @property
+    def source(self) -> Tuple[float, float]:
+        """The coordinates of the source point (x, y)."""
+        coordinates = self.table.coordinates
+        return coordinates.item(self.row, 0), coordinates.item(self.row, 1)
+
+    @property
+    def target(self) -> Tuple[float, float]:
+        """The coordinates of the target point (x, y)."""
+        coordinates = self.table.coordinates
+        return coordinates.item(self.row, 2), coordinates.item(self.row, 3)
+
+    @property
+    def geometry(self):
+        """The shapely LineString of the passage, built (and shapely imported) on the first use."""
+        if self.line_string is None:
+            self.line_string = self.line.to_line_string()
+        return self.line_string
+
+    @property
+    def rate(self) -> PassageJam:
+        """The importance of the passage."""
+        return PASSAGE_JAMS[self.table.rates.item(self.row)]
+
+    @rate.setter
+    def rate(self, rate: PassageJam):
+        table = self.table
+        # A write during grow would go to the old arrays
+        with table.lock:
+            table.rates[self.row] = rate.value
+            table.rate_version += 1
+
+    @property
+    def last_open(self) -> float:
+        """The last time the passage was opened."""
+        return self.table.last_opens.item(self.row)
+
+    @last_open.setter
+    def last_open(self, last_open: float):
+        table = self.table
+        with table.lock:
+            table.last_opens[self.row] = last_open
+
+    @property
+    def count(self) -> int:
+        """The number of vehicles waiting at the passage, as last reported by a sensor."""
+        return self.table.counts.item(self.row)
+
+    @count.setter
+    def count(self, count: int):
+        table = self.table
+        with table.lock:
+            table.counts[self.row] = count
+
+    def get_jam(self) -> float:
+        """
+        Calculate the jam of the passage.
+
+        Returns:
+            float: The rate times the time elapsed since the passage was last opened, plus COUNT_WEIGHT for every
+            waiting vehicle.
+        """
+        return self.rate.value * self.time_from_last_open() + COUNT_WEIGHT * self.count
 
     def update_time(self):
         """
         Update the last_open attribute with the current timestamp.
 
         This method is called to record the current time as the last time the passage was opened.
-        It updates the last_open attribute with the current timestamp using the time() function from the time module.
+        It updates the last_open attribute with the current timestamp of the passage's clock.
         """
-        self.last_open = time.time()
+        self.last_open = self.clock.time()
 
     def time_from_last_open(self):
         """
@@ -44,16 +141,26 @@ class Passage:
         Returns:
             float: The time elapsed (in seconds) since the passage was last opened.
         """
-        return time.time() - self.last_open
+        return self.clock.time() - self.last_open
+
+    def set_clock(self, clock: Clock):
+        """
+        Set the clock of the passage and restart its time from the last open.
+
+        Args:
+            clock (Clock): The new clock.
+        """
+        self.clock = clock
+        self.last_open = clock.time()
 
     @classmethod
-    def do_lines_intersect_in_x_range(cls, line1: LineString, line2: LineString, x_min: float, x_max: float) -> bool:
+    def do_lines_intersect_in_x_range(cls, line1: Segment, line2: Segment, x_min: float, x_max: float) -> bool:
         """
         Check if two lines intersect within a specific range of the x-axis.
 
         Args:
-            line1 (LineString): The first line.
-            line2 (LineString): The second line.
+            line1 (Segment): The first line.
+            line2 (Segment): The second line.
             x_min (float): The minimum x-coordinate value of the range.
             x_max (float): The maximum x-coordinate value of the range.
 
@@ -82,6 +189,9 @@ class Passage:
 
         for passage1 in list1:
             for passage2 in list2:
+                if passage1.x_max < passage2.x_min or passage2.x_max < passage1.x_min:
+                    # The x ranges don't overlap, the lines can't intersect
+                    continue
                 line1, line2 = passage1.line, passage2.line
                 # Calculate the start and end x-values for the intersection check
                 start_x = max(passage1.x_min, passage2.x_min)  # + epsilon
@@ -92,6 +202,22 @@ class Passage:
                     return False
         return True
 
+    @staticmethod
+    def conflict_matrix(list1: List['Passage'], list2: List['Passage']) -> np.ndarray:
+        """
+        Check every passage of the first list against every passage of the second list in one batch.
+
+        Gives the same answers as is_action_valid does for each pair, including the same source exemption.
+
+        Args:
+            list1 (List[Passage]): The first list of passages.
+            list2 (List[Passage]): The second list of passages.
+
+        Returns:
+            np.ndarray: A boolean matrix, True where the two passages can't be opened together.
+        """
+        return conflict_matrix(passages_to_coordinates(list1), passages_to_coordinates(list2))
+
     @staticmethod
     def is_action_valid(action: List['Passage']) -> bool:
         """
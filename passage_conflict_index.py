@@ -0,0 +1,160 @@
+import numpy as np
+from passage import Passage
+from conflict_kernel import conflict_pairs, passages_to_coordinates
+from spatial_index import SpatialIndex
+from typing import Dict, List, Set
+
+
+class PassageConflictIndex:
+    """
+    A class holding the pairwise conflicts between the passages of an intersection.
+
+    The geometry of a passage never changes, so whether two passages can work together is computed once,
+    when the passage is added to the index, and every later check is answered from the index.
+    A new passage is only checked against the passages whose bounding boxes overlap its own, found by
+    a SpatialIndex, so building the index of a large layout doesn't check every pair of passages.
+    """
+
+    def __init__(self, passages: List[Passage] = None, matrix: np.ndarray = None):
+        """Initialize a PassageConflictIndex object.
+
+        Args:
+            passages (List[Passage]): The passages to index.
+            matrix (np.ndarray): The precomputed conflict matrix of the passages, see add_passages.
+        """
+        self.passages: Dict[int, Passage] = {}
+        self.conflicts: Dict[int, Set[int]] = {}
+        self.ids: List[int] = []
+        # The ids and coordinates of the passages in the order they were added, with room to grow
+        self.id_buffer = np.empty(16, dtype=np.int64)
+        self.coordinate_buffer = np.empty((16, 4), dtype=np.float64)
+        self.spatial_index = SpatialIndex()
+        if passages:
+            self.add_passages(passages, matrix)
+
+    def __deepcopy__(self, memo):
+        # The index only depends on the passages geometry, so copies of traffic lights can share it
+        return self
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """The (N, 4) coordinates of the indexed passages, in the order they were added."""
+        return self.coordinate_buffer[:len(self.ids)]
+
+    @staticmethod
+    def is_conflict(passage1: Passage, passage2: Passage) -> bool:
+        """
+        Check if two passages cannot be opened together.
+
+        Args:
+            passage1 (Passage): The first passage.
+            passage2 (Passage): The second passage.
+
+        Returns:
+            bool: True if the passages don't have the same source and intersect each other, False otherwise.
+        """
+        return passage1.source != passage2.source and not Passage.can_work_together([passage1], [passage2])
+
+    def add_passages(self, passages: List[Passage], pairs: np.ndarray = None):
+        """
+        Add passages to the index and calculate their conflicts with all the indexed passages.
+
+        Passages that are already indexed are skipped.
+
+        Args:
+            passages (List[Passage]): The passages to add.
+            pairs (np.ndarray): The precomputed conflicts of the new passages, e.g. a memory-mapped cache.
+                An (M, 2) array of conflicting (new passage, passage) positions, where the passages are the indexed
+                ones followed by the new ones, like the rows and columns conflict_pairs returns. One direction of
+                a conflict is enough. Calculated when not given.
+
+        Raises:
+            ValueError: If a position of the pairs is out of range.
+        """
+        new_passages = {}
+        for passage in passages:
+            if passage.id not in self.passages:
+                new_passages[passage.id] = passage
+        if not new_passages:
+            return
+        new_ids = list(new_passages)
+        if pairs is not None:
+            if pairs.ndim != 2 or pairs.shape[1] != 2:
+                raise ValueError('The conflict pairs must be an (M, 2) array.')
+            if len(pairs) and (pairs.min() < 0 or pairs[:, 0].max() >= len(new_ids)
+                               or pairs[:, 1].max() >= len(self.ids) + len(new_ids)):
+                raise ValueError('The conflict pairs do not match the passages.')
+        new_coordinates = passages_to_coordinates(list(new_passages.values()))
+        first = len(self.ids)
+        size = first + len(new_ids)
+        while size > len(self.id_buffer):
+            self.id_buffer = np.resize(self.id_buffer, 2 * len(self.id_buffer))
+            self.coordinate_buffer = np.resize(self.coordinate_buffer, (2 * len(self.coordinate_buffer), 4))
+        self.id_buffer[first:size] = new_ids
+        self.coordinate_buffer[first:size] = new_coordinates
+        self.passages.update(new_passages)
+        self.ids += new_ids
+        self.spatial_index.insert(new_coordinates)
+        for passage_id in new_ids:
+            self.conflicts[passage_id] = set()
+
+        if pairs is None:
+            # Check the new passages against all the indexed passages (including each other) in one batch
+            rows, columns = conflict_pairs(new_coordinates, self.coordinates, self.spatial_index)
+        else:
+            rows, columns = pairs[:, 0], pairs[:, 1]
+        if not len(rows):
+            return
+
+        # Record every conflict in both directions, grouped by passage so each set is updated once
+        ids = self.id_buffer[:size]
+        new_id_array = ids[first:]
+        sources = np.concatenate((new_id_array[rows], ids[columns]))
+        targets = np.concatenate((ids[columns], new_id_array[rows]))
+        order = np.argsort(sources, kind='stable')
+        sources, targets = sources[order], targets[order]
+        starts = np.flatnonzero(np.diff(sources, prepend=sources[0] - 1))
+        ends = np.append(starts[1:], len(sources)).tolist()
+        targets = targets.tolist()
+        for passage_id, start, end in zip(sources[starts].tolist(), starts.tolist(), ends):
+            self.conflicts[passage_id].update(targets[start:end])
+
+    def contains(self, passages: List[Passage]) -> bool:
+        """
+        Check if all the passages are indexed.
+
+        Args:
+            passages (List[Passage]): The passages to check.
+
+        Returns:
+            bool: True if every passage is in the index, False otherwise.
+        """
+        return all(p.id in self.passages for p in passages)
+
+    def get_conflicts(self, passage: Passage) -> Set[int]:
+        """
+        Get the ids of the passages that conflict with a passage.
+
+        Args:
+            passage (Passage): An indexed passage.
+
+        Returns:
+            Set[int]: The ids of the indexed passages that can't be opened together with the passage.
+        """
+        return self.conflicts[passage.id]
+
+    def is_action_valid(self, action: List[Passage]) -> bool:
+        """
+        Check if a list of indexed passages can form a valid action without any overlapping.
+
+        Args:
+            action (List[Passage]): The list of passages representing the action.
+
+        Returns:
+            bool: True if the action is valid (no overlapping passages), False otherwise.
+        """
+        ids = {p.id for p in action}
+        for passage_id in ids:
+            if not self.conflicts[passage_id].isdisjoint(ids):
+                return False
+        return True
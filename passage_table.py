@@ -0,0 +1,125 @@
+import threading
+import numpy as np
+from typing import Tuple
+
+# The jam a waiting vehicle counted by a sensor adds to its passage, in PassageJam rate * seconds
+COUNT_WEIGHT = 1.0
+
+
+class PassageTable:
+    """
+    A class storing passages in contiguous arrays, one row per passage.
+
+    The coordinates, rate, last open time and vehicle count of all the passages live in NumPy arrays, Passage objects are
+    thin views holding their row, so values of many passages can be computed in one vectorized pass.
+    The row of a passage is freed when the Passage object is collected, and reused by the next added passage,
+    the arrays grow by doubling their capacity when no row is free.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """Initialize a PassageTable object.
+
+        Args:
+            capacity (int): The initial number of rows.
+        """
+        self.size = 0  # The number of rows ever used, free or not
+        self.free_rows = []
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.coordinates = np.empty((capacity, 4), dtype=np.float64)
+        self.rates = np.empty(capacity, dtype=np.int8)
+        self.last_opens = np.empty(capacity, dtype=np.float64)
+        self.counts = np.empty(capacity, dtype=np.int64)
+        # Incremented on every rate change, so indexes built on the rates know when to recompute them
+        self.rate_version = 0
+        # Reentrant, a Passage collected while add holds the lock frees its row in the same thread
+        self.lock = threading.RLock()
+
+    def __deepcopy__(self, memo):
+        # Copied passages get new rows in the same table
+        return self
+
+    def add(self, passage_id: int, source: Tuple[float, float], target: Tuple[float, float], rate: int,
+            last_open: float, count: int = 0) -> int:
+        """Add a passage to the table.
+
+        Args:
+            passage_id (int): The id of the passage.
+            source (Tuple[float, float]): The coordinates of the source point (x, y).
+            target (Tuple[float, float]): The coordinates of the target point (x, y).
+            rate (int): The PassageJam value of the passage.
+            last_open (float): The last time the passage was opened.
+            count (int): The number of vehicles waiting at the passage.
+
+        Returns:
+            int: The row of the passage.
+        """
+        with self.lock:
+            if self.free_rows:
+                row = self.free_rows.pop()
+            else:
+                if self.size == len(self.ids):
+                    self.grow()
+                row = self.size
+                self.size += 1
+            self.ids[row] = passage_id
+            self.coordinates[row] = (source[0], source[1], target[0], target[1])
+            self.rates[row] = rate
+            self.last_opens[row] = last_open
+            self.counts[row] = count
+        return row
+
+    def free(self, row: int):
+        """Free the row of a passage that is gone, for the next added passage.
+
+        Args:
+            row (int): The row.
+        """
+        with self.lock:
+            self.free_rows.append(row)
+
+    def grow(self):
+        """Double the capacity of the arrays, the writes to single rows wait until the new arrays are in place."""
+        with self.lock:
+            capacity = 2 * len(self.ids)
+            self.ids = np.resize(self.ids, capacity)
+            self.coordinates = np.resize(self.coordinates, (capacity, 4))
+            self.rates = np.resize(self.rates, capacity)
+            self.last_opens = np.resize(self.last_opens, capacity)
+            self.counts = np.resize(self.counts, capacity)
+
+    def traffic_light_jams(self, rows: np.ndarray, lights: np.ndarray, n_lights: int, now: float) -> np.ndarray:
+        """
+        Calculate the jam of many traffic lights in one pass.
+
+        The membership of the passages in the traffic lights is given in coordinate form, one entry per
+        (traffic light, passage) pair.
+
+        Args:
+            rows (np.ndarray): The row of the passage of every entry.
+            lights (np.ndarray): The index of the traffic light of every entry.
+            n_lights (int): The number of traffic lights.
+            now (float): The current time.
+
+        Returns:
+            np.ndarray: The sum of rate * (now - last_open) + COUNT_WEIGHT * count over the passages of every
+            traffic light.
+        """
+        jams = self.rates[rows] * (now - self.last_opens[rows]) + COUNT_WEIGHT * self.counts[rows]
+        return np.bincount(lights, weights=jams, minlength=n_lights)
+
+    def traffic_light_rates(self, rows: np.ndarray, lights: np.ndarray, n_lights: int) -> np.ndarray:
+        """
+        Calculate the total rate of many traffic lights in one pass.
+
+        Args:
+            rows (np.ndarray): The row of the passage of every entry.
+            lights (np.ndarray): The index of the traffic light of every entry.
+            n_lights (int): The number of traffic lights.
+
+        Returns:
+            np.ndarray: The sum of the rates of the passages of every traffic light.
+        """
+        return np.bincount(lights, weights=self.rates[rows], minlength=n_lights)
+
+
+DEFAULT_TABLE = PassageTable()
@@ -0,0 +1,231 @@
+import numpy as np
+from traffic_light import TrafficLight
+from typing import Dict, List, Optional, Tuple
+
+
+class PhaseComponent:
+    """A connected component of the conflict graph of an intersection and its maximal compatible light sets."""
+
+    def __init__(self, mask: int, phases: Optional[List[int]]):
+        """Initialize a PhaseComponent object.
+
+        Args:
+            mask (int): The bits of the traffic lights of the component.
+            phases (Optional[List[int]]): The maximal sets of traffic lights that can work together, as bitmasks,
+                None when there are too many of them to keep.
+        """
+        self.mask = mask
+        self.phases = phases
+
+
+class PhaseCatalog:
+    """
+    A class holding the phases of an intersection, the maximal sets of traffic lights that can be green together.
+
+    Traffic lights in different connected components of the conflict graph never conflict, so the phases are
+    kept per component, and a phase of the intersection is a phase of every component together. The phases
+    of a component are its maximal cliques in the compatibility graph, enumerated by a Bron-Kerbosch search
+    on bitmasks. A traffic light that conflicts with itself can only be green alone, so it is a phase by itself.
+
+    The catalog follows the traffic lights added to the intersection: a light that joins one component only
+    adds the cliques through it and drops the cliques it extends, a light connecting a few components rebuilds
+    the merged component.
+
+    Attributes:
+        max_phases (int): The maximum number of phases kept for a component, the best set of a component with
+            more phases is found greedily.
+    """
+    max_phases = 4096
+
+    def __init__(self, traffic_lights: List[TrafficLight] = None):
+        """Initialize a PhaseCatalog object.
+
+        Args:
+            traffic_lights (List[TrafficLight]): Traffic lights with their bits and conflict masks already set by
+                an intersection, in the order of their bits.
+        """
+        self.traffic_lights: Dict[int, TrafficLight] = {}  # By bit position
+        self.components: List[PhaseComponent] = []
+        self.singletons: List[TrafficLight] = []
+        self.membership = None  # The flat arrays of the phases, see get_membership
+        for tl in traffic_lights or []:
+            self.add_traffic_light(tl)
+
+    def add_traffic_light(self, traffic_light: TrafficLight):
+        """Add a traffic light to the catalog.
+
+        Args:
+            traffic_light (TrafficLight): A traffic light indexed by the intersection, after all the lights
+                it conflicts with were added.
+        """
+        self.traffic_lights[traffic_light.bit.bit_length() - 1] = traffic_light
+        self.membership = None
+        if not traffic_light.can_join(0):
+            self.singletons.append(traffic_light)
+            return
+        bit = traffic_light.bit
+        touched = [c for c in self.components if c.mask & traffic_light.conflict_mask]
+        if not touched:
+            self.components.append(PhaseComponent(bit, [bit]))
+        elif len(touched) == 1 and touched[0].phases is not None:
+            component = touched[0]
+            neighbors = component.mask & ~traffic_light.conflict_mask
+            # The cliques the new light extends are not maximal anymore
+            phases = [phase for phase in component.phases if phase & ~neighbors]
+            new_phases = []
+            self.bron_kerbosch(0, neighbors, 0, new_phases)
+            component.mask |= bit
+            component.phases = phases + [phase | bit for phase in new_phases]
+            if len(component.phases) > PhaseCatalog.max_phases:
+                component.phases = None
+        else:
+            mask = bit
+            for component in touched:
+                self.components.remove(component)
+                mask |= component.mask
+            # Adding a light never lowers the number of maximal cliques, so an overflowed component stays one
+            overflowed = any(component.phases is None for component in touched)
+            self.components.append(PhaseComponent(mask, None if overflowed else self.enumerate_phases(mask)))
+
+    def neighbors(self, position: int, mask: int) -> int:
+        """Get the traffic lights of a mask that can work with a traffic light.
+
+        Args:
+            position (int): The bit position of the traffic light.
+            mask (int): The bits of the candidate traffic lights.
+
+        Returns:
+            int: The bits of the candidates that can be green together with the traffic light.
+        """
+        traffic_light = self.traffic_lights[position]
+        return mask & ~traffic_light.conflict_mask & ~traffic_light.bit
+
+    def bron_kerbosch(self, clique: int, candidates: int, excluded: int, phases: List[int]):
+        """
+        Enumerate the maximal cliques of the compatibility graph that extend a clique.
+
+        Args:
+            clique (int): The bits of the clique.
+            candidates (int): The bits of the traffic lights that can extend the clique.
+            excluded (int): The bits of the traffic lights that could extend it but were already tried.
+            phases (List[int]): The list the maximal cliques are appended to.
+        """
+        if len(phases) > PhaseCatalog.max_phases:
+            return
+        if not candidates:
+            if not excluded:
+                phases.append(clique)
+            return
+        # Branch only on the candidates that don't work with the pivot, the pivot covers the rest
+        pivot_mask = candidates | excluded
+        pivot = max(self.iterate_bits(pivot_mask),
+                    key=lambda u: bin(candidates & self.neighbors(u, candidates)).count('1'))
+        branches = candidates & ~self.neighbors(pivot, candidates)
+        for v in self.iterate_bits(branches):
+            v_neighbors = self.neighbors(v, candidates | excluded)
+            self.bron_kerbosch(clique | 1 << v, candidates & v_neighbors, excluded & v_neighbors, phases)
+            candidates &= ~(1 << v)
+            excluded |= 1 << v
+
+    def enumerate_phases(self, mask: int) -> Optional[List[int]]:
+        """Enumerate the maximal cliques of the traffic lights of a component.
+
+        Args:
+            mask (int): The bits of the traffic lights of the component.
+
+        Returns:
+            Optional[List[int]]: The maximal cliques as bitmasks, None if there are more than max_phases.
+        """
+        phases = []
+        self.bron_kerbosch(0, mask, 0, phases)
+        return phases if len(phases) <= PhaseCatalog.max_phases else None
+
+    @staticmethod
+    def iterate_bits(mask: int):
+        """Iterate over the positions of the set bits of a mask, from the lowest."""
+        while mask:
+            low_bit = mask & -mask
+            yield low_bit.bit_length() - 1
+            mask ^= low_bit
+
+    def get_component_phases(self) -> List[Optional[List[int]]]:
+        """Get the phases of every component of the conflict graph.
+
+        Returns:
+            List[Optional[List[int]]]: The maximal compatible sets of every component as bitmasks of traffic light
+            bits, None for a component with more than max_phases sets.
+        """
+        return [component.phases for component in self.components]
+
+    def get_membership(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the phases of the components that keep them as flat arrays, built when needed.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The (phase, light position) entries of all
+            the phases, the component of every phase and the index of the first phase of every such component.
+        """
+        if self.membership is None:
+            entry_phases, entry_positions, phase_components, starts = [], [], [], []
+            phase = 0
+            for i, component in enumerate(c for c in self.components if c.phases is not None):
+                starts.append(phase)
+                for mask in component.phases:
+                    for position in self.iterate_bits(mask):
+                        entry_phases.append(phase)
+                        entry_positions.append(position)
+                    phase_components.append(i)
+                    phase += 1
+            self.membership = (np.array(entry_phases, dtype=np.intp), np.array(entry_positions, dtype=np.intp),
+                               np.array(phase_components, dtype=np.intp), np.array(starts, dtype=np.intp))
+        return self.membership
+
+    def best_phase(self, jams: np.ndarray) -> List[TrafficLight]:
+        """
+        Find the set of traffic lights that can be green together with the highest total jam.
+
+        The phases of all the components are scored by one bincount, and the best phase of every component
+        is the first one with its component's maximum score.
+
+        Args:
+            jams (np.ndarray): The jam of every traffic light, by bit position.
+
+        Returns:
+            List[TrafficLight]: The best phase of every component together, or the best traffic light that
+            can only be green alone when its jam is higher.
+        """
+        entry_phases, entry_positions, phase_components, starts = self.get_membership()
+        positions = []
+        if len(starts):
+            scores = np.bincount(entry_phases, weights=jams[entry_positions], minlength=len(phase_components))
+            best_scores = np.maximum.reduceat(scores, starts)
+            candidates = np.flatnonzero(scores == best_scores[phase_components])
+            _, first = np.unique(phase_components[candidates], return_index=True)
+            chosen = np.zeros(len(phase_components), dtype=bool)
+            chosen[candidates[first]] = True
+            positions = entry_positions[chosen[entry_phases]].tolist()
+        for component in self.components:
+            if component.phases is None:
+                positions.extend(self.iterate_bits(self.greedy_phase(component.mask, jams)))
+
+        if self.singletons:
+            singleton = max(self.singletons, key=lambda tl: jams[tl.bit.bit_length() - 1])
+            if not positions or jams[singleton.bit.bit_length() - 1] > jams[positions].sum():
+                return [singleton]
+        return [self.traffic_lights[position] for position in positions]
+
+    def greedy_phase(self, mask: int, jams: np.ndarray) -> int:
+        """Build a maximal set of the traffic lights of a mask greedily, from the highest jam.
+
+        Args:
+            mask (int): The bits of the traffic lights.
+            jams (np.ndarray): The jam of every traffic light, by bit position.
+
+        Returns:
+            int: The bits of the chosen traffic lights.
+        """
+        phase = 0
+        for position in sorted(self.iterate_bits(mask), key=lambda p: jams[p], reverse=True):
+            if self.traffic_lights[position].can_join(phase):
+                phase |= 1 << position
+        return phase
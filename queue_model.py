@@ -0,0 +1,188 @@
+import math
+import numpy as np
+from control_loop import ControlLoop
+from intersection import Intersection
+from traffic_light import TrafficLight
+from typing import List, NamedTuple
+
+# Vehicles per second arriving at a passage for every PassageJam level, EXTREME_LOW is 180 vehicles per hour
+ARRIVAL_RATE_PER_JAM_LEVEL = 0.05
+# Vehicles per second leaving a green passage with a standing queue, 1800 vehicles per hour
+SATURATION_FLOW = 0.5
+
+
+class QueueReport(NamedTuple):
+    """The results of a queue model simulation."""
+    simulated_time: float
+    arrivals: int
+    departures: int
+    throughput: float  # Departures per hour
+    mean_delay: float  # Seconds a vehicle waits on average
+    p95_delay: float  # Of the vehicles that left, the vehicles still waiting only count in the mean delay
+    mean_queue: float  # Vehicles waiting at a passage, averaged over the passages and the time
+    max_queue: float  # The longest queue at the end of the simulation
+
+
+class QueueModel:
+    """
+    A class simulating the vehicles queuing at the passages of an intersection.
+
+    Vehicles arrive at every passage as a Poisson process, and leave a green passage at its saturation flow
+    while it has a queue. All the passages are advanced together in NumPy arrays, in steps of at most
+    time_step seconds, and the green passages change with the phases a ControlLoop decides.
+
+    The mean delay is the total time vehicles spent in the queues divided by the arrivals (Little's law).
+    The delay of the vehicles leaving a queue is estimated as the queue length they found divided by the arrival
+    rate, and collected in one second bins for the p95 delay.
+    """
+
+    def __init__(self, intersection: Intersection, arrival_rates: np.ndarray = None,
+                 saturation_flows: np.ndarray = None, time_step: float = 1.0, seed: int = None,
+                 update_traffic_jam: bool = False, max_delay: int = 3600):
+        """Initialize a QueueModel object.
+
+        Args:
+            intersection (Intersection): The intersection to simulate.
+            arrival_rates (np.ndarray): The vehicles per second arriving at every passage, in the order of
+                the passages attribute. By default ARRIVAL_RATE_PER_JAM_LEVEL times the passage's PassageJam value.
+            saturation_flows (np.ndarray): The vehicles per second leaving every green passage, SATURATION_FLOW
+                by default.
+            time_step (float): The longest step (in seconds) the queues are advanced in at once.
+            seed (int): The seed of the random arrivals.
+            update_traffic_jam (bool): Whether to set the vehicle count of every passage to its queue after every
+                phase, with Intersection.update_passage_counts, so the schedulers see the simulated queues.
+            max_delay (int): The delay (in seconds) of the last bin of the delay histogram.
+        """
+        self.intersection = intersection
+        self.traffic_lights: List[TrafficLight] = list(intersection.get_all_traffic_lights())
+        self.passages = []
+        positions = {}
+        entry_passages, entry_lights = [], []
+        for light_position, tl in enumerate(self.traffic_lights):
+            for p in tl.get_passages():
+                if p.id not in positions:
+                    positions[p.id] = len(self.passages)
+                    self.passages.append(p)
+                entry_passages.append(positions[p.id])
+                entry_lights.append(light_position)
+        self.light_positions = {tl: i for i, tl in enumerate(self.traffic_lights)}
+        # The passages of every traffic light, as (passage position, traffic light position) entries
+        self.entry_passages = np.array(entry_passages, dtype=np.intp)
+        self.entry_lights = np.array(entry_lights, dtype=np.intp)
+
+        n = len(self.passages)
+        if arrival_rates is None:
+            jam_levels = np.array([p.rate.value for p in self.passages], dtype=np.float64)
+            arrival_rates = ARRIVAL_RATE_PER_JAM_LEVEL * jam_levels
+        if saturation_flows is None:
+            saturation_flows = np.full(n, SATURATION_FLOW)
+        self.arrival_rates = np.asarray(arrival_rates, dtype=np.float64)
+        self.saturation_flows = np.asarray(saturation_flows, dtype=np.float64)
+        if self.arrival_rates.shape != (n,) or self.saturation_flows.shape != (n,):
+            raise ValueError('There must be an arrival rate and a saturation flow for every passage.')
+        self.time_step = time_step
+        self.rng = np.random.default_rng(seed)
+        self.update_traffic_jam = update_traffic_jam
+
+        self.queues = np.zeros(n, dtype=np.float64)
+        self.green = np.empty(0, dtype=np.intp)  # The positions of the green passages
+        self.simulated_time = 0.0
+        self.arrivals = 0
+        self.departures = 0.0
+        self.queue_area = 0.0  # Vehicle-seconds spent in the queues
+        self.delay_histogram = np.zeros(max_delay + 1, dtype=np.float64)
+
+    def set_green_traffic_lights(self, traffic_lights: List[TrafficLight]):
+        """Set the traffic lights whose passages vehicles leave from.
+
+        Args:
+            traffic_lights (List[TrafficLight]): The green traffic lights.
+        """
+        lights = np.zeros(len(self.traffic_lights), dtype=bool)
+        lights[[self.light_positions[tl] for tl in traffic_lights]] = True
+        self.green = np.unique(self.entry_passages[lights[self.entry_lights]])
+
+    def advance(self, duration: float):
+        """Advance the queues by a period of time, with the current green passages.
+
+        Args:
+            duration (float): The time to advance (in seconds).
+        """
+        if duration <= 0:
+            return
+        steps = math.ceil(duration / self.time_step)
+        dt = duration / steps
+        expected_arrivals = self.arrival_rates * dt
+        green = self.green
+        capacity = self.saturation_flows[green] * dt
+        green_rates = self.arrival_rates[green]
+        last_bin = len(self.delay_histogram) - 1
+        for _ in range(steps):
+            arrivals = self.rng.poisson(expected_arrivals)
+            queues_before = self.queues
+            self.queues = queues_before + arrivals
+            found = queues_before[green]
+            served = np.minimum(self.queues[green], capacity)
+            self.queues[green] -= served
+            self.arrivals += int(arrivals.sum())
+            self.departures += float(served.sum())
+            self.queue_area += 0.5 * dt * float(queues_before.sum() + self.queues.sum())
+
+            delays = np.divide(found, green_rates, out=np.zeros_like(found), where=green_rates > 0)
+            bins = np.minimum(delays, last_bin).astype(np.intp)
+            self.delay_histogram += np.bincount(bins, weights=served, minlength=last_bin + 1)
+        self.simulated_time += duration
+
+        if self.update_traffic_jam:
+            # Through the intersection, so the counts reach its jam index and the next decision
+            counts = np.rint(self.queues).astype(int).tolist()
+            self.intersection.update_passage_counts({p.id: count for p, count in zip(self.passages, counts)})
+
+    def simulate(self, control_loop: ControlLoop, total_time: float) -> QueueReport:
+        """
+        Run a control loop on a virtual clock and advance the queues with the phases it decides.
+
+        Args:
+            control_loop (ControlLoop): The control loop of the model's intersection.
+            total_time (float): The time to simulate (in seconds).
+
+        Returns:
+            QueueReport: The results of the simulation so far.
+        """
+        clock = control_loop.clock
+        last_time = clock.time()
+
+        def on_step():
+            nonlocal last_time
+            # The time since the previous decision belongs to the previous phase
+            self.advance(clock.time() - last_time)
+            last_time = clock.time()
+            self.set_green_traffic_lights(self.intersection.get_current_green_light())
+
+        control_loop.simulate(total_time, on_step)
+        self.advance(clock.time() - last_time)
+        return self.report()
+
+    def report(self) -> QueueReport:
+        """Summarize the simulation so far.
+
+        Returns:
+            QueueReport: The throughput, delays and queues of the simulation.
+        """
+        served = self.delay_histogram.sum()
+        if served > 0:
+            p95_delay = float(np.searchsorted(np.cumsum(self.delay_histogram), 0.95 * served) + 1)
+        else:
+            p95_delay = 0.0
+        simulated_time = self.simulated_time
+        return QueueReport(
+            simulated_time=simulated_time,
+            arrivals=self.arrivals,
+            departures=int(self.departures),
+            throughput=3600 * self.departures / simulated_time if simulated_time else 0.0,
+            mean_delay=self.queue_area / self.arrivals if self.arrivals else 0.0,
+            p95_delay=p95_delay,
+            mean_queue=self.queue_area / (simulated_time * len(self.passages)) if simulated_time and self.passages
+            else 0.0,
+            max_queue=float(self.queues.max()) if len(self.queues) else 0.0,
+        )
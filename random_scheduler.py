@@ -38,9 +38,9 @@ class RandomScheduler:
                 that don't intersect with the main light. If no valid light is available, returns None.
         """
 
-        light_traffics = intersection.get_copy_all_traffic_lights()
-        main_traffic_light = random.choice(light_traffics)
-        light_traffics.remove(main_traffic_light)
+        snapshot = intersection.get_snapshot()
+        main_traffic_light = random.choice(snapshot.traffic_lights)
+        light_traffics = [tl for tl in snapshot.traffic_lights if tl is not main_traffic_light]
 
         return main_traffic_light, RandomScheduler.max_scheduling([main_traffic_light], light_traffics)
 
@@ -60,8 +60,20 @@ class RandomScheduler:
             List[TrafficLight]: A list of traffic lights that can work together without conflicts.
         """
 
+        if not TrafficLight.shared_conflict_index(cur_light_traffics + remaining_light_traffics):
+            for tl in remaining_light_traffics:
+                optional_addition = cur_light_traffics + [tl]
+                if TrafficLight.can_work_together(optional_addition):
+                    cur_light_traffics = optional_addition
+            return cur_light_traffics
+
+        # No traffic light can be added to a set that is not valid by itself
+        if not TrafficLight.can_work_together(cur_light_traffics):
+            return cur_light_traffics
+        cur_light_traffics = cur_light_traffics[:]
+        mask = TrafficLight.lights_mask(cur_light_traffics)
         for tl in remaining_light_traffics:
-            optional_addition = cur_light_traffics + [tl]
-            if TrafficLight.can_work_together(optional_addition):
-                cur_light_traffics = optional_addition
+            if tl.can_join(mask):
+                cur_light_traffics.append(tl)
+                mask |= tl.bit
         return cur_light_traffics
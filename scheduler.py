@@ -1,19 +1,35 @@
+import cProfile
+import pstats
+import time
 from intersection import Intersection
 from traffic_light import TrafficLight
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+from decision_stats import DecisionStats, set_active_stats
 from enums import SchedulerType
 from single_random_scheduler import SingleRandomScheduler
 from random_scheduler import RandomScheduler
 from greedy_scheduler import GreedyScheduler
+from exact_scheduler import ExactScheduler
+from lookahead_scheduler import LookaheadScheduler
+from catalog_scheduler import CatalogScheduler
+from batch_scheduler import BatchGreedyScheduler
 
 
 class Scheduler:
-    """A class for managing traffic light scheduling based on different scheduler types."""
+    """
+    A class for managing traffic light scheduling based on different scheduler types.
+
+    Every decision is timed, and the schedulers report the time of its phases and counters of their work
+    to the scheduler's DecisionStats, see get_stats. A sampling profiler can be turned on and off while running.
+    """
 
     navigate_scheduler = {
         SchedulerType.SINGLE_RANDOM_SCHEDULER: SingleRandomScheduler,
         SchedulerType.RANDOM_SCHEDULER: RandomScheduler,
-        SchedulerType.GREEDY_SCHEDULER: GreedyScheduler
+        SchedulerType.GREEDY_SCHEDULER: GreedyScheduler,
+        SchedulerType.EXACT_SCHEDULER: ExactScheduler,
+        SchedulerType.LOOKAHEAD_SCHEDULER: LookaheadScheduler,
+        SchedulerType.CATALOG_SCHEDULER: CatalogScheduler
     }
 
     def __init__(self, scheduler_type: SchedulerType):
@@ -25,6 +41,10 @@ class Scheduler:
         """
         self.step = 0
         self.scheduler_type = scheduler_type
+        self.stats = DecisionStats()
+        self.profiler: Optional[cProfile.Profile] = None
+        self.profile_every = 0
+        self.profiled = 0  # The number of decisions in the profile
 
     def decide_next_light(self, intersection: Intersection) -> Tuple[TrafficLight, List[TrafficLight], float]:
         """
@@ -38,11 +58,54 @@ class Scheduler:
             and a list of other traffic lights to make green together. If no valid light is available, returns None.
         """
         self.step += 1
-        result = Scheduler.navigate_scheduler[self.scheduler_type].decide_next_step(intersection)
+        profiler = self.profiler if self.profiler is not None and self.step % self.profile_every == 0 else None
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is running in this thread
+                profiler = None
+        # A profiled decision is much slower, so it isn't timed
+        previous = set_active_stats(self.stats if profiler is None else None)
+        start = time.perf_counter_ns()
+        try:
+            result = Scheduler.navigate_scheduler[self.scheduler_type].decide_next_step(intersection)
+        finally:
+            if profiler is None:
+                self.stats.add_time('decision', time.perf_counter_ns() - start)
+            else:
+                profiler.disable()
+                self.profiled += 1
+            set_active_stats(previous)
         if len(result) == 2:
             return result + (0,)  # the duration decided on the init of the system
         return result
 
+    def decide_next_lights(self, intersections: List[Intersection]
+                           ) -> List[Tuple[TrafficLight, List[TrafficLight], float]]:
+        """
+        Decide which traffic light(s) to switch on next at many intersections.
+
+        The greedy scheduler decides all of them in one batch, see BatchGreedyScheduler, timed as 'batch_decision'.
+        The other schedulers decide them one by one, like decide_next_light.
+
+        Args:
+            intersections (List[Intersection]): The intersections.
+
+        Returns:
+            List[Tuple[TrafficLight, List[TrafficLight], float]]: The decide_next_light result of every intersection.
+        """
+        if self.scheduler_type != SchedulerType.GREEDY_SCHEDULER:
+            return [self.decide_next_light(intersection) for intersection in intersections]
+        self.step += len(intersections)
+        previous = set_active_stats(self.stats)
+        start = time.perf_counter_ns()
+        try:
+            return BatchGreedyScheduler.decide_next_steps(intersections)
+        finally:
+            self.stats.add_time('batch_decision', time.perf_counter_ns() - start)
+            set_active_stats(previous)
+
     @staticmethod
     def time_to_swap(intersection: Intersection) -> bool:
         """
@@ -54,7 +117,8 @@ class Scheduler:
         Returns:
             bool: True if it's time to swap to the next traffic light, False otherwise.
         """
-        return not intersection.get_remaining_time() or intersection.get_remaining_time() <= 0
+        remaining_time = intersection.get_remaining_time()
+        return not remaining_time or remaining_time <= 0
 
     def get_step_number(self) -> int:
         """Get the step coutner of the scheduler.
@@ -62,3 +126,72 @@ class Scheduler:
             Returns:
                 int: The number of the steps."""
         return self.step
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get the latency of the decisions and of their phases, and the counters of the schedulers' work.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The count, mean, p50, p90, p99 and max latency (in seconds) of every phase,
+            'decision' being the whole decision, and the counters under 'counters'.
+        """
+        return self.stats.summary()
+
+    def get_latency(self, phase: str = 'decision') -> Dict[str, float]:
+        """Get the latency of a phase of the decisions.
+
+        Args:
+            phase (str): The name of the phase, the whole decision by default.
+
+        Returns:
+            Dict[str, float]: The count, mean, p50, p90, p99 and max latency (in seconds),
+            the count is 0 when the phase was never timed.
+        """
+        histogram = self.stats.histograms.get(phase)
+        return histogram.summary() if histogram is not None else {'count': 0}
+
+    def get_counter(self, counter: str) -> int:
+        """Get a counter of the schedulers' work, e.g. 'conflict_checks', 'cache_hits' or 'cache_misses'.
+
+        Args:
+            counter (str): The name of the counter.
+
+        Returns:
+            int: The value of the counter.
+        """
+        return self.stats.counters.get(counter, 0)
+
+    def reset_stats(self):
+        """Clear the latencies and the counters."""
+        self.stats.reset()
+
+    def start_profiling(self, every: int = 100):
+        """
+        Start profiling one decision in every few, the profiles of the decisions are accumulated.
+
+        Args:
+            every (int): The number of decisions between two profiled decisions.
+        """
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiled = 0
+        self.profile_every = max(1, every)
+
+    def stop_profiling(self) -> Optional[pstats.Stats]:
+        """Stop profiling the decisions.
+
+        Returns:
+            Optional[pstats.Stats]: The profile of the sampled decisions, None if no decision was profiled.
+        """
+        profile = self.get_profile()
+        self.profiler = None
+        return profile
+
+    def get_profile(self) -> Optional[pstats.Stats]:
+        """Get the profile of the decisions sampled so far, profiling continues.
+
+        Returns:
+            Optional[pstats.Stats]: The profile of the sampled decisions, None if no decision was profiled.
+        """
+        if self.profiler is None or not self.profiled:
+            return None
+        return pstats.Stats(self.profiler)
@@ -0,0 +1,76 @@
+from typing import List, NamedTuple, Tuple
+
+
+def orientation(px: float, py: float, qx: float, qy: float, rx: float, ry: float) -> int:
+    """Sign of the cross product (q - p) x (r - p), positive when p, q, r turn counter-clockwise."""
+    cross = (qx - px) * (ry - py) - (qy - py) * (rx - px)
+    return (cross > 0) - (cross < 0)
+
+
+class Segment(NamedTuple):
+    """
+    A straight line segment between two points.
+
+    A lightweight replacement for a two point shapely LineString, it answers the same bounds and intersects
+    queries in pure Python, so passages don't need GEOS. Segments are compared by their coordinates,
+    like shapely geometries.
+    """
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """The bounding box of the segment (min x, min y, max x, max y)."""
+        return min(self.x1, self.x2), min(self.y1, self.y2), max(self.x1, self.x2), max(self.y1, self.y2)
+
+    @property
+    def coords(self) -> List[Tuple[float, float]]:
+        """The two points of the segment, like the coords of a LineString."""
+        return [(self.x1, self.y1), (self.x2, self.y2)]
+
+    def is_degenerate(self) -> bool:
+        """Check if the segment has zero length.
+
+        Returns:
+            bool: True if the two points of the segment are the same point.
+        """
+        return self.x1 == self.x2 and self.y1 == self.y2
+
+    def intersects(self, other: 'Segment') -> bool:
+        """
+        Check if two segments intersect.
+
+        Segments are closed, so touching at an end point or overlapping on the same line counts as an intersection.
+        Zero length segments never intersect, like an empty shapely LineString.
+
+        Args:
+            other (Segment): The other segment.
+
+        Returns:
+            bool: True if the segments intersect, False otherwise.
+        """
+        if self.is_degenerate() or other.is_degenerate():
+            return False
+        ax, ay, bx, by = self
+        cx, cy, dx, dy = other
+        o1 = orientation(ax, ay, bx, by, cx, cy)
+        o2 = orientation(ax, ay, bx, by, dx, dy)
+        o3 = orientation(cx, cy, dx, dy, ax, ay)
+        o4 = orientation(cx, cy, dx, dy, bx, by)
+        if o1 == o2 == o3 == o4 == 0:
+            # Collinear segments intersect only when their bounding boxes overlap
+            return min(ax, bx) <= max(cx, dx) and min(cx, dx) <= max(ax, bx) \
+                and min(ay, by) <= max(cy, dy) and min(cy, dy) <= max(ay, by)
+        return o1 * o2 <= 0 and o3 * o4 <= 0
+
+    def to_line_string(self):
+        """
+        Build the shapely LineString of the segment, shapely is imported on the first call.
+
+        Returns:
+            LineString: The segment as a shapely geometry.
+        """
+        from shapely.geometry import LineString
+        return LineString(self.coords)
@@ -0,0 +1,142 @@
+import threading
+from control_loop import ControlLoop
+from intersection import Intersection
+from typing import BinaryIO, Dict, List, Tuple
+
+
+class SensorFeed:
+    """
+    A class reading per passage vehicle counts from a stream and applying them to an intersection.
+
+    The stream is a binary file, pipe or socket file holding one "<passage id> <count>" line per event.
+    A background thread reads and parses it in large chunks and coalesces the events into a pending dict,
+    where the latest count of a passage replaces the earlier ones. The control loop applies the pending
+    counts on its ticks, before every decision, so the reading never holds the loop back.
+    """
+
+    def __init__(self, stream: BinaryIO, chunk_size: int = 1 << 16):
+        """Initialize a SensorFeed object.
+
+        Args:
+            stream (BinaryIO): The stream of the events.
+            chunk_size (int): The maximum number of bytes read at once.
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.pending: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.events = 0  # The number of events parsed
+        self.malformed = 0  # The number of lines that aren't events
+        self.finished = threading.Event()
+
+    @staticmethod
+    def parse(data: bytes) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        Parse complete event lines.
+
+        Args:
+            data (bytes): Lines of "<passage id> <count>" events.
+
+        Returns:
+            Tuple[List[Tuple[int, int]], int]: The (passage id, count) events in their order,
+            and the number of malformed lines.
+        """
+        events = []
+        malformed = 0
+        for line in data.splitlines():
+            fields = line.split()
+            if not fields:
+                continue
+            try:
+                passage_id, count = fields
+                events.append((int(passage_id), int(count)))
+            except ValueError:
+                malformed += 1
+        return events, malformed
+
+    def ingest(self, data: bytes):
+        """
+        Parse complete event lines and coalesce them into the pending counts.
+
+        Args:
+            data (bytes): Lines of "<passage id> <count>" events.
+        """
+        events, malformed = SensorFeed.parse(data)
+        with self.lock:
+            self.pending.update(events)
+            self.events += len(events)
+            self.malformed += malformed
+
+    def run(self):
+        """Read the stream until its end, ingesting every complete line."""
+        read = getattr(self.stream, 'read1', self.stream.read)
+        remainder = b''
+        try:
+            while True:
+                chunk = read(self.chunk_size)
+                if not chunk:
+                    break
+                data = remainder + chunk
+                end = data.rfind(b'\n') + 1
+                remainder = data[end:]
+                if end:
+                    self.ingest(data[:end])
+            if remainder:
+                self.ingest(remainder)
+        except (OSError, ValueError):
+            # The stream was closed
+            pass
+        finally:
+            self.finished.set()
+
+    def start(self) -> 'SensorFeed':
+        """Start reading the stream in a background thread.
+
+        Returns:
+            SensorFeed: The feed itself.
+        """
+        self.thread = threading.Thread(target=self.run, name='sensor-feed', daemon=True)
+        self.thread.start()
+        return self
+
+    def take(self) -> Dict[int, int]:
+        """Take the counts received since the last call.
+
+        Returns:
+            Dict[int, int]: The latest count of every passage that was updated, by passage id.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def apply(self, intersection: Intersection) -> int:
+        """Apply the counts received since the last call to an intersection.
+
+        Args:
+            intersection (Intersection): The intersection of the passages.
+
+        Returns:
+            int: The number of passages updated.
+        """
+        pending = self.take()
+        return intersection.update_passage_counts(pending) if pending else 0
+
+    def attach(self, control_loop: ControlLoop):
+        """Apply the received counts to a control loop's intersection on each of its ticks.
+
+        Args:
+            control_loop (ControlLoop): The control loop.
+        """
+        control_loop.add_tick_handler(lambda: self.apply(control_loop.intersection))
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until the whole stream was read.
+
+        Args:
+            timeout (float): The maximum time to wait (in seconds).
+
+        Returns:
+            bool: True if the stream was read to its end.
+        """
+        return self.finished.wait(timeout)
@@ -0,0 +1,138 @@
+import math
+import numpy as np
+from typing import Dict, List, Tuple
+
+
+class SpatialIndex:
+    """
+    A uniform grid over the bounding boxes of segments, finding the pairs of segments whose boxes overlap.
+
+    Every inserted box is listed in the grid cells it covers, so a query only looks at the segments sharing
+    a cell with it instead of at all of them. The cell size follows the size of the first inserted boxes,
+    and grows when a box would cover more than max_cells cells, so every box covers a few cells.
+
+    Attributes:
+        max_cells (int): The maximum number of cells an inserted box covers before the cells are made larger.
+    """
+    max_cells = 64
+
+    def __init__(self, cell_size: float = None):
+        """Initialize a SpatialIndex object.
+
+        Args:
+            cell_size (float): The side of the grid cells, chosen by the first inserted boxes by default.
+        """
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.size = 0
+        self.boxes = np.empty((16, 4), dtype=np.float64)  # x min, y min, x max, y max
+
+    def __len__(self) -> int:
+        return self.size
+
+    @staticmethod
+    def bounding_boxes(coordinates: np.ndarray) -> np.ndarray:
+        """
+        Get the bounding boxes of segments.
+
+        Args:
+            coordinates (np.ndarray): An (N, 4) array of segments (x1, y1, x2, y2).
+
+        Returns:
+            np.ndarray: An (N, 4) array of boxes (x min, y min, x max, y max).
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 4)
+        return np.concatenate((np.minimum(coordinates[:, :2], coordinates[:, 2:]),
+                               np.maximum(coordinates[:, :2], coordinates[:, 2:])), axis=1)
+
+    def cell_range(self, box: List[float]) -> Tuple[int, int, int, int]:
+        """Get the first and last cell columns and rows a box covers."""
+        cell_size = self.cell_size
+        return (math.floor(box[0] / cell_size), math.floor(box[1] / cell_size),
+                math.floor(box[2] / cell_size), math.floor(box[3] / cell_size))
+
+    def insert(self, coordinates: np.ndarray):
+        """
+        Insert segments, they get the next indices.
+
+        Args:
+            coordinates (np.ndarray): An (N, 4) array of segments (x1, y1, x2, y2).
+        """
+        boxes = SpatialIndex.bounding_boxes(coordinates)
+        if not len(boxes):
+            return
+        if self.cell_size is None:
+            extents = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+            self.cell_size = float(np.median(extents)) or 1.0
+        while self.size + len(boxes) > len(self.boxes):
+            self.boxes = np.resize(self.boxes, (2 * len(self.boxes), 4))
+        self.boxes[self.size:self.size + len(boxes)] = boxes
+        first = self.size
+        self.size += len(boxes)
+        for index, box in enumerate(boxes.tolist(), first):
+            x0, y0, x1, y1 = self.cell_range(box)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > SpatialIndex.max_cells:
+                # Rebuilding lists the remaining new boxes too
+                self.rebuild(self.cell_size * 2)
+                return
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.cells.setdefault((x, y), []).append(index)
+
+    def rebuild(self, cell_size: float):
+        """
+        List all the boxes in new cells, larger ones until every box fits in max_cells cells.
+
+        Args:
+            cell_size (float): The smallest new cell size.
+        """
+        boxes = self.boxes[:self.size]
+        extents = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        side = math.isqrt(SpatialIndex.max_cells) - 2
+        # A box with extent e covers at most (e / cell_size + 2) ** 2 cells
+        self.cell_size = max(cell_size, float(extents.max()) / side)
+        self.cells = {}
+        for index, box in enumerate(boxes.tolist()):
+            x0, y0, x1, y1 = self.cell_range(box)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.cells.setdefault((x, y), []).append(index)
+
+    def query(self, coordinates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the inserted segments whose bounding boxes overlap the bounding boxes of segments.
+
+        Boxes that only touch overlap, like closed segments that only touch intersect.
+
+        Args:
+            coordinates (np.ndarray): An (N, 4) array of segments (x1, y1, x2, y2).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The candidate pairs, as the rows of the given segments and
+            the indices of the inserted segments, ordered by row and then by index.
+        """
+        boxes = SpatialIndex.bounding_boxes(coordinates)
+        if not self.size or not len(boxes):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        rows, columns = [], []
+        for row, box in enumerate(boxes.tolist()):
+            x0, y0, x1, y1 = self.cell_range(box)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+                lists = [indices for (x, y), indices in self.cells.items() if x0 <= x <= x1 and y0 <= y <= y1]
+            else:
+                cells = self.cells
+                lists = [cells[x, y] for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in cells]
+            if 4 * sum(map(len, lists)) > self.size:
+                # Most of the segments are near, testing all of them in NumPy is faster than collecting them
+                found = np.arange(self.size)
+            else:
+                found = np.array(sorted(set().union(*lists)), dtype=np.intp)
+            rows.append(np.full(len(found), row, dtype=np.intp))
+            columns.append(found)
+        rows = np.concatenate(rows)
+        columns = np.concatenate(columns)
+        # Sharing a cell doesn't mean the boxes overlap
+        first, second = boxes[rows], self.boxes[columns]
+        overlap = (first[:, 0] <= second[:, 2]) & (second[:, 0] <= first[:, 2]) \
+            & (first[:, 1] <= second[:, 3]) & (second[:, 1] <= first[:, 3])
+        return rows[overlap], columns[overlap]
@@ -0,0 +1,202 @@
+import os
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from intersection import Intersection
+from typing import List, NamedTuple, Optional, Tuple
+
+# The fields of the header, at the start of the block
+SEQUENCE, N_LIGHTS, N_PASSAGES, MAIN_LIGHT = range(4)
+# The names of the blocks published by this process
+published_names = set()
+
+
+class StateSnapshot(NamedTuple):
+    """A consistent copy of the state published by a StatePublisher."""
+    sequence: int  # Even, grows by 2 with every publish
+    time: float  # The clock time of the publish
+    main_light: Optional[int]  # The id of the main traffic light, None when there is none
+    light_ids: np.ndarray
+    light_states: np.ndarray  # TrafficLightState values
+    begin_times: np.ndarray
+    durations: np.ndarray
+    passage_ids: np.ndarray
+    last_opens: np.ndarray
+
+
+def state_layout(n_lights: int, n_passages: int) -> List[Tuple[str, np.dtype, int]]:
+    """
+    Get the layout of a state block.
+
+    Args:
+        n_lights (int): The number of traffic lights.
+        n_passages (int): The number of passages.
+
+    Returns:
+        List[Tuple[str, np.dtype, int]]: The name, type and length of every array, in their order in the block.
+        Every array starts on an 8 bytes boundary.
+    """
+    return [('header', np.int64, 4), ('time', np.float64, 1),
+            ('light_ids', np.int64, n_lights), ('light_states', np.int8, n_lights),
+            ('begin_times', np.float64, n_lights), ('durations', np.float64, n_lights),
+            ('passage_ids', np.int64, n_passages), ('last_opens', np.float64, n_passages)]
+
+
+def map_state(buffer: memoryview, n_lights: int, n_passages: int) -> dict:
+    """
+    Map the arrays of a state block.
+
+    Args:
+        buffer (memoryview): The block.
+        n_lights (int): The number of traffic lights.
+        n_passages (int): The number of passages.
+
+    Returns:
+        dict: The arrays by name.
+    """
+    arrays = {}
+    offset = 0
+    for field, dtype, length in state_layout(n_lights, n_passages):
+        arrays[field] = np.ndarray(length, dtype, buffer=buffer, offset=offset)
+        offset += -(-length * np.dtype(dtype).itemsize // 8) * 8
+    return arrays
+
+
+def state_size(n_lights: int, n_passages: int) -> int:
+    """Get the size (in bytes) of a state block."""
+    return sum(-(-length * np.dtype(dtype).itemsize // 8) * 8
+               for _, dtype, length in state_layout(n_lights, n_passages))
+
+
+class StatePublisher:
+    """
+    A class publishing the live state of an intersection into a fixed layout shared memory block.
+
+    The block holds the state, begin_time and duration of every traffic light, the main traffic light
+    and the last_open of every passage, so monitors in other processes can read it without any IPC.
+    The block is guarded by a seqlock: the sequence number is odd while the state is written, and a reader
+    keeps a copy only when the sequence was the same even number before and after copying it.
+    The writer never waits for readers, a publish is a few array assignments.
+
+    The stores are plain memory writes, which keep their order on x86. On weaker memory models a reader may
+    seldom see a torn state that the sequence didn't catch.
+    """
+
+    def __init__(self, intersection: Intersection, name: str = None):
+        """Initialize a StatePublisher object and publish the current state.
+
+        Args:
+            intersection (Intersection): The intersection to publish.
+            name (str): The name of the shared memory block, a unique name is chosen by default.
+        """
+        self.intersection = intersection
+        self.traffic_lights = list(intersection.get_all_traffic_lights())
+        self.passages = list(intersection.conflict_index.passages.values())
+        table = intersection.passage_table
+        # The last_open values are gathered from the passage table at once when all the passages are in one
+        self.rows = np.array([p.row for p in self.passages], dtype=np.intp) if table is not None else None
+        n_lights, n_passages = len(self.traffic_lights), len(self.passages)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=state_size(n_lights, n_passages))
+        published_names.add(self.shm.name)
+        self.arrays = map_state(self.shm.buf, n_lights, n_passages)
+        # Scalars are accessed faster through memoryviews than through NumPy
+        self.header = self.shm.buf[:32].cast('q')
+        self.time = self.shm.buf[32:40].cast('d')
+        self.header[N_LIGHTS], self.header[N_PASSAGES], self.header[MAIN_LIGHT] = n_lights, n_passages, -1
+        self.arrays['light_ids'][:] = [tl.get_id() for tl in self.traffic_lights]
+        self.arrays['passage_ids'][:] = [p.id for p in self.passages]
+        self.publish()
+
+    @property
+    def name(self) -> str:
+        """The name of the shared memory block, for StateReader."""
+        return self.shm.name
+
+    def publish(self):
+        """Write the current state of the intersection to the block.
+
+        Raises:
+            ValueError: If traffic lights or passages were added to the intersection since the block was created,
+                the layout of the block has no room for them and the readers map the old one.
+        """
+        if len(self.intersection.get_all_traffic_lights()) != len(self.traffic_lights) \
+                or len(self.intersection.conflict_index.passages) != len(self.passages):
+            raise ValueError('The intersection changed since its state block was created, publish a new one.')
+        arrays = self.arrays
+        header = self.header
+        header[SEQUENCE] += 1
+        main_light = self.intersection.currennt_main_traffic_light
+        header[MAIN_LIGHT] = main_light.get_id() if main_light else -1
+        self.time[0] = self.traffic_lights[0].clock.time() if self.traffic_lights else 0.0
+        # _value_ skips the Enum.value descriptor
+        arrays['light_states'][:] = [tl.state._value_ for tl in self.traffic_lights]
+        arrays['begin_times'][:] = [tl.begin_time for tl in self.traffic_lights]
+        arrays['durations'][:] = [tl.duration for tl in self.traffic_lights]
+        if self.rows is not None:
+            arrays['last_opens'][:] = self.intersection.passage_table.last_opens[self.rows]
+        else:
+            arrays['last_opens'][:] = [p.last_open for p in self.passages]
+        header[SEQUENCE] += 1
+
+    def close(self):
+        """Stop publishing and free the block, the readers keep their mapping until they close it."""
+        self.arrays = None
+        self.header.release()
+        self.time.release()
+        published_names.discard(self.shm.name)
+        self.shm.close()
+        self.shm.unlink()
+
+
+class StateReader:
+    """A class reading the state published by a StatePublisher, possibly in another process."""
+
+    def __init__(self, name: str):
+        """Initialize a StateReader object.
+
+        Args:
+            name (str): The name of the publisher's shared memory block.
+        """
+        self.shm = shared_memory.SharedMemory(name=name)
+        if self.shm.name not in published_names and os.name == 'posix':
+            # Every process attaching a block tracks it and unlinks it when exiting, only the publisher should.
+            # The tracker knows the block by its POSIX name, with the leading slash
+            resource_tracker.unregister('/' + self.shm.name, 'shared_memory')
+        self.header = self.shm.buf[:32].cast('q')
+        self.time = self.shm.buf[32:40].cast('d')
+        self.arrays = map_state(self.shm.buf, self.header[N_LIGHTS], self.header[N_PASSAGES])
+
+    def read(self, max_retries: int = 1000) -> StateSnapshot:
+        """
+        Copy a consistent state, without any system call unless a publish is in progress.
+
+        Args:
+            max_retries (int): The number of times to retry when the state changed while it was copied.
+
+        Returns:
+            StateSnapshot: The state of the last completed publish.
+        """
+        arrays = self.arrays
+        header = self.header
+        for attempt in range(max_retries + 1):
+            if attempt:
+                # Let a writer in this process finish, it can't while this thread holds the GIL
+                time.sleep(0)
+            sequence = header[SEQUENCE]
+            if sequence & 1:
+                continue
+            main_light = header[MAIN_LIGHT]
+            snapshot = StateSnapshot(sequence, self.time[0], main_light if main_light >= 0 else None,
+                                     arrays['light_ids'].copy(), arrays['light_states'].copy(),
+                                     arrays['begin_times'].copy(), arrays['durations'].copy(),
+                                     arrays['passage_ids'].copy(), arrays['last_opens'].copy())
+            if header[SEQUENCE] == sequence:
+                return snapshot
+        raise TimeoutError('The state kept changing while it was read.')
+
+    def close(self):
+        """Unmap the block from this process, the snapshots already read stay valid."""
+        self.arrays = None
+        self.header.release()
+        self.time.release()
+        self.shm.close()
@@ -0,0 +1,182 @@
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from clock import VirtualClock
+from control_loop import ControlLoop
+from enums import PassageJam, SchedulerType
+from event_recorder import EventRecorder, NullSink, set_recorder
+from intersection import Intersection
+from layout_file import LayoutFile
+from passage import Passage
+from scheduler import Scheduler
+from traffic_light import TrafficLight
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+# A layout is a list of traffic lights, each one a list of passages given as (source, target)
+Layout = Sequence[Sequence[Tuple[Tuple[float, float], Tuple[float, float]]]]
+
+# The junction of main.py
+MAIN_LAYOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main_layout.json')
+
+JAM_PROFILES: Dict[str, Sequence[PassageJam]] = {
+    'low': [PassageJam.LOW],
+    'medium': [PassageJam.MEDIUM],
+    'high': [PassageJam.HIGH],
+    'mixed': [PassageJam.EXTREME_LOW, PassageJam.MEDIUM, PassageJam.EXTREME_HIGH, PassageJam.LOW, PassageJam.HIGH],
+}
+
+
+class SweepCase(NamedTuple):
+    """A single run of a sweep."""
+    layout_name: str
+    layout: Layout
+    scheduler_type: SchedulerType
+    jam_profile_name: str
+    jam_profile: Sequence[PassageJam]
+    seed: int
+    simulated_time: float
+    duration: float
+
+
+class SweepResult(NamedTuple):
+    """The metrics of a single run of a sweep."""
+    layout_name: str
+    scheduler_type: SchedulerType
+    jam_profile_name: str
+    seed: int
+    decisions: int
+    average_wait: float
+    max_starvation: float
+    decisions_per_second: float
+
+
+def layout_from_file(path: str) -> Layout:
+    """
+    Read the traffic lights and passages of a layout file, see LayoutFile.
+
+    Args:
+        path (str): The path of the layout file.
+
+    Returns:
+        Layout: The traffic lights of the layout and their passages, the rates are left to the jam profiles.
+    """
+    intersection = LayoutFile.load(path, use_cache=False)
+    return [[(p.source, p.target) for p in tl.get_passages()] for tl in intersection.get_all_traffic_lights()]
+
+
+def build_intersection(layout: Layout, jam_profile: Sequence[PassageJam], clock: VirtualClock) -> Intersection:
+    """
+    Build an intersection from a layout.
+
+    Args:
+        layout (Layout): The traffic lights of the intersection and their passages.
+        jam_profile (Sequence[PassageJam]): The rates of the passages, repeated over the passages in layout order.
+        clock (VirtualClock): The clock of the intersection.
+
+    Returns:
+        Intersection: The new intersection.
+    """
+    rates = itertools.cycle(jam_profile)
+    passages: Dict[Tuple, Passage] = {}
+    traffic_lights = []
+    for light in layout:
+        light_passages = []
+        for source, target in light:
+            key = (tuple(source), tuple(target))
+            # A passage listed in a few traffic lights is the same passage
+            if key not in passages:
+                passages[key] = Passage(key[0], key[1], next(rates), clock)
+            light_passages.append(passages[key])
+        traffic_lights.append(TrafficLight(light_passages, clock))
+    return Intersection(traffic_lights)
+
+
+def run_case(case: SweepCase) -> SweepResult:
+    """
+    Simulate an intersection with a scheduler and measure how long its passages wait.
+
+    The wait of a passage is the time it was red before it was opened, the starvation of a passage also counts
+    the time it is red at the end of the simulation.
+
+    Args:
+        case (SweepCase): The run to simulate.
+
+    Returns:
+        SweepResult: The metrics of the run.
+    """
+    random.seed(case.seed)
+    clock = VirtualClock()
+    intersection = build_intersection(case.layout, case.jam_profile, clock)
+    control_loop = ControlLoop(intersection, Scheduler(case.scheduler_type), case.duration, clock)
+    waits = []
+
+    def on_step():
+        opened = set(TrafficLight.passages_from_traffic_lights(intersection.get_current_green_light()))
+        waits.extend(p.time_from_last_open() for p in opened)
+
+    previous_recorder = set_recorder(EventRecorder(NullSink()))
+    start = time.perf_counter()
+    try:
+        decisions = control_loop.simulate(case.simulated_time, on_step)
+    finally:
+        elapsed = time.perf_counter() - start
+        set_recorder(previous_recorder)
+
+    passages = TrafficLight.passages_from_traffic_lights(intersection.get_all_traffic_lights())
+    green = set(TrafficLight.passages_from_traffic_lights(intersection.get_current_green_light()))
+    starvation = max(waits + [p.time_from_last_open() for p in passages if p not in green])
+    return SweepResult(case.layout_name, case.scheduler_type, case.jam_profile_name, case.seed, decisions,
+                       sum(waits) / len(waits) if waits else 0, starvation, decisions / elapsed if elapsed else 0)
+
+
+def run_sweep(layouts: Dict[str, Layout], scheduler_types: Iterable[SchedulerType],
+              jam_profiles: Dict[str, Sequence[PassageJam]], seeds: Iterable[int], simulated_time: float = 3600,
+              duration: float = 3, processes: int = None) -> List[SweepResult]:
+    """
+    Simulate every combination of layout, scheduler type, jam profile and seed on a process pool.
+
+    Args:
+        layouts (Dict[str, Layout]): The layouts by name.
+        scheduler_types (Iterable[SchedulerType]): The scheduler types to compare.
+        jam_profiles (Dict[str, Sequence[PassageJam]]): The jam profiles by name.
+        seeds (Iterable[int]): The random seeds.
+        simulated_time (float): The simulated time of every run (in seconds).
+        duration (float): The green duration for schedulers that don't decide it.
+        processes (int): The number of worker processes, the number of CPUs by default.
+
+    Returns:
+        List[SweepResult]: The metrics of all the runs, in the order of the combinations.
+    """
+    cases = [SweepCase(layout_name, layout, scheduler_type, profile_name, profile, seed, simulated_time, duration)
+             for layout_name, layout in layouts.items()
+             for scheduler_type in scheduler_types
+             for profile_name, profile in jam_profiles.items()
+             for seed in seeds]
+    processes = processes or os.cpu_count()
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(run_case, cases, chunksize=max(1, len(cases) // (processes * 4))))
+
+
+def format_results(results: List[SweepResult]) -> str:
+    """
+    Format the results of a sweep as a table.
+
+    Args:
+        results (List[SweepResult]): The results of a sweep.
+
+    Returns:
+        str: A table with a line for every run.
+    """
+    lines = [f"{'layout':<12}{'scheduler':<26}{'jam':<10}{'seed':>6}{'decisions':>11}{'avg wait':>11}"
+             f"{'max starve':>12}{'decisions/s':>13}"]
+    for r in results:
+        lines.append(f"{r.layout_name:<12}{r.scheduler_type.name:<26}{r.jam_profile_name:<10}{r.seed:>6}"
+                     f"{r.decisions:>11}{r.average_wait:>11.2f}{r.max_starvation:>12.2f}{r.decisions_per_second:>13.0f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(format_results(run_sweep({'main': layout_from_file(MAIN_LAYOUT_PATH)}, SchedulerType, JAM_PROFILES,
+                                   range(4))))
@@ -1,9 +1,78 @@
+import asyncio
+import contextlib
+import copy
+import gc
+import io
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+import numpy as np
 from traffic_light import TrafficLight, Passage
 from intersection import Intersection
 from scheduler import Scheduler
 from control_loop import ControlLoop
-from enums import TrafficLightState, SchedulerType
+from enums import TrafficLightState, SchedulerType, PassageJam, EventType
+from event_recorder import Event, EventRecorder, FileSink, NullSink, StdoutSink, set_recorder
+from clock import VirtualClock
+from async_controller import AsyncController
+import benchmarks
+from sweep import MAIN_LAYOUT_PATH, build_intersection, layout_from_file, run_sweep
+from passage_conflict_index import PassageConflictIndex
+from passage_table import PassageTable
+from spatial_index import SpatialIndex
+from segment import Segment
+from layout_file import LayoutFile
+from queue_model import QueueModel
+from sensor_feed import SensorFeed
+from crosswalk_buttons import CrosswalkButtons
+from greedy_scheduler import GreedyScheduler
+from exact_scheduler import ExactScheduler
+from lookahead_scheduler import LookaheadScheduler, LookaheadState
+from phase_catalog import PhaseCatalog
+from decision_stats import DecisionStats, LatencyHistogram, PhaseTimer, add_count, get_active_stats, set_active_stats
+from city_grid import CityGrid
+from state_export import SEQUENCE, StateReader
+from batch_scheduler import BatchGreedyScheduler
+
+MAIN_LAYOUT = layout_from_file(MAIN_LAYOUT_PATH)
+
+
+# Tests that run on the real time, e.g. asyncio timers, they can be skipped on loaded machines with SKIP_TIMING_TESTS=1
+timing_test = unittest.skipIf(os.environ.get('SKIP_TIMING_TESTS'), 'A timing test')
+
+
+@contextlib.contextmanager
+def quiet():
+    previous = set_recorder(EventRecorder(NullSink()))
+    try:
+        yield
+    finally:
+        set_recorder(previous)
+
+
+class ScriptedClock(VirtualClock):
+    """A VirtualClock running actions at their times while a control loop waits, like events from other threads."""
+
+    def __init__(self, actions):
+        super().__init__()
+        self.actions = sorted(actions, key=lambda action: action[0])
+
+    def wait(self, event: threading.Event, timeout: float) -> bool:
+        deadline = self.now + timeout
+        while self.actions and self.actions[0][0] <= deadline and not event.is_set():
+            at, action = self.actions.pop(0)
+            self.advance(at - self.now)
+            action()
+        return super().wait(event, deadline - self.now)
 
 
 class TestTrafficLightSystem(unittest.TestCase):
@@ -170,6 +239,1206 @@ class TestTrafficLightSystem(unittest.TestCase):
         self.assertEqual(self.passage1.x_max, 5)
 
 
+class TestPassageConflictIndex(unittest.TestCase):
+    def setUp(self):
+        self.passages = [Passage((14, 8), (16, 10)), Passage((14, 8), (10, 14)), Passage((16, 13), (12, 8)),
+                         Passage((16, 14), (10, 14)), Passage((10, 10), (12, 8)), Passage((10, 10), (16, 10))]
+        p = self.passages
+        self.traffic_lights = [TrafficLight([p[0], p[1]]), TrafficLight([p[4], p[5]]), TrafficLight([p[3]]),
+                               TrafficLight([p[2]])]
+        self.intersection = Intersection(self.traffic_lights[:2])
+
+    def test_index_matches_geometry(self):
+        self.intersection.add_traffic_lights(self.traffic_lights[2:])
+        for i in range(len(self.traffic_lights)):
+            for j in range(len(self.traffic_lights)):
+                lights = [self.traffic_lights[i], self.traffic_lights[j]]
+                expected = Passage.is_action_valid(TrafficLight.passages_from_traffic_lights(lights))
+                self.assertEqual(TrafficLight.can_work_together(lights), expected)
+
+    def test_index_updated_on_add(self):
+        self.assertFalse(self.intersection.conflict_index.contains(self.traffic_lights[2].get_passages()))
+        self.intersection.add_traffic_light(self.traffic_lights[2])
+        self.assertTrue(self.intersection.conflict_index.contains(self.traffic_lights[2].get_passages()))
+        self.assertIs(self.traffic_lights[2].conflict_index, self.intersection.conflict_index)
+        # hashisha asar left and neve yaakov straight both merge into moshe dayan
+        self.assertIn(self.passages[3].id, self.intersection.conflict_index.get_conflicts(self.passages[1]))
+
+    def test_conflict_matrix_matches_shapely(self):
+        passages = self.passages + [Passage((0, 0), (5, 0)), Passage((2, 0), (8, 0)), Passage((12, 8), (12, 14)),
+                                    Passage((3, 3), (3, 3)), Passage((13, 9.5), (15.5, 12.5))]
+        matrix = Passage.conflict_matrix(passages, passages)
+        for i, p1 in enumerate(passages):
+            for j, p2 in enumerate(passages):
+                self.assertEqual(matrix[i, j], PassageConflictIndex.is_conflict(p1, p2))
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        starts = rng.uniform(-500, 500, (300, 2))
+        self.coordinates = np.concatenate((starts, starts + rng.normal(0, 20, (300, 2))), axis=1)
+        self.coordinates[:5, 2:] = self.coordinates[:5, :2]  # Points
+        self.coordinates[5:8] = [[-500, -500, 500, 500], [-500, 0, 500, 0], [0, -500, 0, 500]]  # Long segments
+
+    def brute_force(self, coordinates1, coordinates2):
+        boxes1, boxes2 = SpatialIndex.bounding_boxes(coordinates1), SpatialIndex.bounding_boxes(coordinates2)
+        return {(i, j) for i, a in enumerate(boxes1) for j, b in enumerate(boxes2)
+                if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]}
+
+    def test_query_matches_brute_force(self):
+        index = SpatialIndex()
+        index.insert(self.coordinates[8:])
+        index.insert(self.coordinates[:8])
+        self.assertLessEqual(max(len(indices) for indices in index.cells.values()), len(self.coordinates))
+        queries = np.concatenate((self.coordinates[:50], [[-1000, -1000, 1000, 1000]]))
+        rows, columns = index.query(queries)
+        ordered = np.concatenate((self.coordinates[8:], self.coordinates[:8]))
+        self.assertEqual(set(zip(rows.tolist(), columns.tolist())), self.brute_force(queries, ordered))
+
+    def test_cells_grow_for_large_boxes(self):
+        index = SpatialIndex()
+        index.insert(self.coordinates[8:20])
+        cell_size = index.cell_size
+        index.insert(self.coordinates[5:8])
+        self.assertGreater(index.cell_size, cell_size)
+        for box in SpatialIndex.bounding_boxes(self.coordinates[5:20]).tolist():
+            x0, y0, x1, y1 = index.cell_range(box)
+            self.assertLessEqual((x1 - x0 + 1) * (y1 - y0 + 1), SpatialIndex.max_cells)
+
+    def test_incremental_conflict_index(self):
+        passages = [Passage(tuple(c[:2]), tuple(c[2:])) for c in self.coordinates.tolist()]
+        index = PassageConflictIndex()
+        for i in range(0, len(passages), 7):
+            index.add_passages(passages[i:i + 7])
+        matrix = Passage.conflict_matrix(passages, passages)
+        for i, p in enumerate(passages[:60]):
+            self.assertEqual(index.get_conflicts(p), {passages[j].id for j in np.flatnonzero(matrix[i])})
+            self.assertEqual(index.get_conflicts(p), {other.id for other in passages
+                                                      if PassageConflictIndex.is_conflict(p, other)})
+
+
+class TestTrafficLightBitmask(unittest.TestCase):
+    def setUp(self):
+        random.seed(7)
+        self.traffic_lights = [TrafficLight([Passage((random.randint(0, 9), random.randint(0, 9)),
+                                                     (random.randint(0, 9), random.randint(0, 9)))
+                                             for _ in range(random.randint(1, 3))]) for _ in range(12)]
+        self.intersection = Intersection(self.traffic_lights[:6])
+        self.intersection.add_traffic_lights(self.traffic_lights[6:])
+
+    def test_bits_are_unique(self):
+        self.assertEqual(TrafficLight.lights_mask(self.traffic_lights), (1 << len(self.traffic_lights)) - 1)
+
+    def test_masks_match_geometry(self):
+        for _ in range(200):
+            lights = random.sample(self.traffic_lights, random.randint(1, 4))
+            expected = Passage.is_action_valid(TrafficLight.passages_from_traffic_lights(lights))
+            self.assertEqual(TrafficLight.can_work_together(lights), expected)
+
+    def test_max_scheduling_matches_geometry(self):
+        for main_light in self.traffic_lights:
+            remaining = [tl for tl in self.traffic_lights if tl is not main_light]
+            expected = [main_light]
+            for tl in remaining:
+                if Passage.is_action_valid(TrafficLight.passages_from_traffic_lights(expected + [tl])):
+                    expected = expected + [tl]
+            self.assertEqual(GreedyScheduler.max_scheduling([main_light], remaining), expected)
+
+
+class TestExactScheduler(unittest.TestCase):
+    def setUp(self):
+        random.seed(11)
+        self.traffic_lights = [TrafficLight([Passage((random.uniform(0, 30), random.uniform(0, 30)),
+                                                     (random.uniform(0, 30), random.uniform(0, 30)))])
+                               for _ in range(12)]
+        self.intersection = Intersection(self.traffic_lights)
+        self.weights = {tl: random.uniform(0, 10) for tl in self.traffic_lights}
+
+    def test_max_weight_clique_is_optimal(self):
+        best = 0
+        for k in range(1, len(self.traffic_lights) + 1):
+            for lights in itertools.combinations(self.traffic_lights, k):
+                if TrafficLight.can_work_together(list(lights)):
+                    best = max(best, sum(self.weights[tl] for tl in lights))
+        main_light = max(self.traffic_lights, key=lambda tl: self.weights[tl])
+        result = ExactScheduler.max_weight_clique(self.traffic_lights, self.weights, [main_light],
+                                                  time.perf_counter() + 10)
+        self.assertTrue(TrafficLight.can_work_together(result))
+        self.assertAlmostEqual(sum(self.weights[tl] for tl in result), best)
+
+    def test_light_listed_twice(self):
+        clock = VirtualClock()
+        first = TrafficLight([Passage((0, 0), (10, 10), PassageJam.LOW, clock)], clock)
+        second = TrafficLight([Passage((0, 10), (10, 0), PassageJam.HIGH, clock)], clock)
+        intersection = Intersection([first, first, second])
+        clock.advance(10)
+        for scheduler in (ExactScheduler, LookaheadScheduler):
+            main_light, next_lights, _ = scheduler.decide_next_step(intersection)
+            self.assertIs(main_light, second)
+            self.assertEqual(next_lights, [second])
+
+    def test_max_weight_clique_out_of_time(self):
+        main_light = max(self.traffic_lights, key=lambda tl: self.weights[tl])
+        result = ExactScheduler.max_weight_clique(self.traffic_lights, self.weights, [main_light], 0)
+        self.assertEqual(result, [main_light])
+
+    def test_scheduler(self):
+        scheduler = Scheduler(SchedulerType.EXACT_SCHEDULER)
+        main_light, next_lights, duration = scheduler.decide_next_light(self.intersection)
+        self.assertIn(main_light, next_lights)
+        self.assertTrue(TrafficLight.can_work_together(next_lights))
+        self.assertGreaterEqual(duration, 0)
+
+
+class TestLookaheadScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.MEDIUM], self.clock)
+        self.scheduler = Scheduler(SchedulerType.LOOKAHEAD_SCHEDULER)
+
+    def decide(self):
+        main_light, next_lights, duration = self.scheduler.decide_next_light(self.intersection)
+        with quiet():
+            self.intersection.greens_on_for(next_lights, main_light, duration)
+        self.clock.advance(duration)
+        return main_light, next_lights, duration
+
+    def test_decisions(self):
+        with mock.patch.object(LookaheadScheduler, 'time_budget', 10):
+            for _ in range(20):
+                main_light, next_lights, duration = self.decide()
+                self.assertIn(main_light, next_lights)
+                self.assertTrue(TrafficLight.can_work_together(next_lights))
+                self.assertGreater(duration, 0)
+        state = LookaheadScheduler.states[self.intersection]
+        self.assertEqual(state.plan[0][1], duration)
+        self.assertLessEqual(len(state.plan), LookaheadScheduler.depth)
+        self.assertTrue(state.memo)
+
+    def test_plan_serves_every_light(self):
+        with mock.patch.object(LookaheadScheduler, 'time_budget', 10):
+            served = set()
+            for _ in range(12):
+                served.update(self.decide()[1])
+        self.assertEqual(served, set(self.intersection.get_all_traffic_lights()))
+
+    def test_out_of_time(self):
+        with mock.patch.object(LookaheadScheduler, 'time_budget', 10):
+            self.decide()
+        plan = LookaheadScheduler.states[self.intersection].plan
+        with mock.patch.object(LookaheadScheduler, 'time_budget', -1):
+            # The rest of the previous plan is followed, then the greedy decision is taken
+            if len(plan) > 1:
+                self.assertEqual(self.decide()[2], plan[1][1])
+            for _ in range(LookaheadScheduler.depth):
+                self.decide()
+            self.assertEqual(LookaheadScheduler.states[self.intersection].plan, ())
+
+    def test_deadline_keeps_shallower_plan(self):
+        state = LookaheadState(self.intersection.indexed_traffic_lights)
+        jams = self.intersection.get_traffic_light_jams()
+        phases = LookaheadScheduler.candidate_phases(state.traffic_lights, jams)
+        # The one phase round finishes, the deadline passes in the next one
+        with mock.patch('lookahead_scheduler.time.perf_counter', side_effect=itertools.chain([0], itertools.repeat(2))):
+            _, plan = LookaheadScheduler.plan(phases, jams, state, 0, 1)
+        self.assertEqual(len(plan), 1)
+        self.assertIn(plan[0][0], phases)
+
+    def test_memo_follows_candidate_phases(self):
+        state = LookaheadState(self.intersection.indexed_traffic_lights)
+        jams = self.intersection.get_traffic_light_jams()
+        phases = LookaheadScheduler.candidate_phases(state.traffic_lights, jams)
+        _, plan = LookaheadScheduler.plan(phases, jams, state, 0, float('inf'))
+        # The same jams with other candidates can't reuse the memoized plan
+        others = [phase for phase in phases if phase != plan[0][0]]
+        _, plan = LookaheadScheduler.plan(others, jams, state, 0, float('inf'))
+        self.assertTrue(all(phase in others for phase, _ in plan))
+
+    def test_state_is_dropped_with_intersection(self):
+        self.decide()
+        self.assertIn(self.intersection, LookaheadScheduler.states)
+        count = len(LookaheadScheduler.states)
+        del self.intersection
+        gc.collect()
+        self.assertEqual(len(LookaheadScheduler.states), count - 1)
+
+
+class TestPhaseCatalog(unittest.TestCase):
+    def setUp(self):
+        random.seed(5)
+        self.traffic_lights = [TrafficLight([Passage((random.uniform(0, 30), random.uniform(0, 30)),
+                                                     (random.uniform(0, 30), random.uniform(0, 30)))])
+                               for _ in range(12)]
+        self.intersection = Intersection(self.traffic_lights)
+
+    def maximal_sets(self):
+        valid = [frozenset(lights) for k in range(1, len(self.traffic_lights) + 1)
+                 for lights in itertools.combinations(self.traffic_lights, k)
+                 if TrafficLight.can_work_together(list(lights))]
+        return {lights for lights in valid if not any(lights < other for other in valid)}
+
+    def catalog_sets(self, catalog):
+        sets = set()
+        for phases in itertools.product(*catalog.get_component_phases()):
+            mask = sum(phases)
+            sets.add(frozenset(tl for tl in self.traffic_lights if tl.bit & mask))
+        return sets | {frozenset([tl]) for tl in catalog.singletons}
+
+    def test_phases_are_maximal_sets(self):
+        catalog = self.intersection.get_phase_catalog()
+        self.assertEqual(self.catalog_sets(catalog), self.maximal_sets())
+
+    def test_incremental_build(self):
+        intersection = Intersection(self.traffic_lights[:3])
+        catalog = intersection.get_phase_catalog()
+        intersection.add_traffic_lights(self.traffic_lights[3:])
+        self.assertEqual(self.catalog_sets(catalog), self.maximal_sets())
+
+    def test_self_invalid_light_is_a_singleton(self):
+        crossing = TrafficLight([Passage((0, 0), (10, 10)), Passage((0, 10), (10, 0))])
+        self.intersection.add_traffic_light(crossing)
+        catalog = self.intersection.get_phase_catalog()
+        self.assertEqual(catalog.singletons, [crossing])
+        jams = np.zeros(len(self.intersection.indexed_traffic_lights))
+        jams[-1] = 1000
+        self.assertEqual(catalog.best_phase(jams), [crossing])
+
+    def test_best_phase_is_optimal(self):
+        weights = {tl: random.uniform(0, 10) for tl in self.traffic_lights}
+        jams = np.array([weights[tl] for tl in self.intersection.indexed_traffic_lights])
+        lights = self.intersection.get_phase_catalog().best_phase(jams)
+        best = max(sum(weights[tl] for tl in lights) for lights in self.maximal_sets())
+        self.assertTrue(TrafficLight.can_work_together(lights))
+        self.assertAlmostEqual(sum(weights[tl] for tl in lights), best)
+
+    def test_greedy_fallback(self):
+        with mock.patch.object(PhaseCatalog, 'max_phases', 1):
+            catalog = PhaseCatalog(self.intersection.indexed_traffic_lights)
+        jams = np.arange(len(self.traffic_lights), dtype=np.float64)
+        with mock.patch.object(PhaseCatalog, 'max_phases', 1):
+            lights = catalog.best_phase(jams)
+        self.assertTrue(TrafficLight.can_work_together(lights))
+        self.assertIn(self.intersection.indexed_traffic_lights[-1], lights)
+
+    def test_scheduler(self):
+        scheduler = Scheduler(SchedulerType.CATALOG_SCHEDULER)
+        main_light, next_lights, duration = scheduler.decide_next_light(self.intersection)
+        self.assertIn(main_light, next_lights)
+        self.assertTrue(TrafficLight.can_work_together(next_lights))
+        self.assertGreaterEqual(duration, 0)
+
+
+class TestDecisionStats(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.MEDIUM], self.clock)
+
+    def decide(self, scheduler, n):
+        for _ in range(n):
+            main_light, next_lights, duration = scheduler.decide_next_light(self.intersection)
+            with quiet():
+                self.intersection.greens_on_for(next_lights, main_light, duration)
+            self.clock.advance(duration)
+
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        for nanoseconds in [1000] * 90 + [1000000] * 10:
+            histogram.add(nanoseconds)
+        self.assertLess(histogram.percentile(50), 2e-6)
+        self.assertGreaterEqual(histogram.percentile(50), 1e-6)
+        self.assertEqual(histogram.percentile(99), 1e-3)
+        self.assertAlmostEqual(histogram.summary()['mean'], 100900e-9)
+
+    def test_phase_timer(self):
+        PhaseTimer().lap('ignored')
+        add_count('ignored')
+        stats = DecisionStats()
+        previous = set_active_stats(stats)
+        try:
+            timer = PhaseTimer()
+            timer.lap('first')
+            timer.lap('second')
+            add_count('work', 3)
+        finally:
+            set_active_stats(previous)
+        self.assertEqual(sorted(stats.histograms), ['first', 'second'])
+        self.assertEqual(stats.counters, {'work': 3})
+
+    def test_greedy_phases(self):
+        scheduler = Scheduler(SchedulerType.GREEDY_SCHEDULER)
+        self.decide(scheduler, 10)
+        stats = scheduler.get_stats()
+        for phase in ('decision', 'jam_scoring', 'max_scheduling', 'calculate_duration'):
+            self.assertEqual(stats[phase]['count'], 10)
+            self.assertGreater(stats[phase]['max'], 0)
+        self.assertLessEqual(stats['jam_scoring']['mean'], stats['decision']['mean'])
+        self.assertEqual(scheduler.get_counter('conflict_checks'),
+                         10 * (len(self.intersection.get_all_traffic_lights()) - 1))
+        self.assertIsNone(get_active_stats())
+        scheduler.reset_stats()
+        self.assertEqual(scheduler.get_latency(), {'count': 0})
+
+    def test_cache_counters(self):
+        scheduler = Scheduler(SchedulerType.LOOKAHEAD_SCHEDULER)
+        with mock.patch.object(LookaheadScheduler, 'time_budget', 10):
+            self.decide(scheduler, 10)
+        self.assertGreater(scheduler.get_counter('cache_misses'), 0)
+        self.assertGreater(scheduler.get_counter('cache_hits'), 0)
+        self.assertEqual(scheduler.get_latency('plan')['count'], 10)
+
+    def test_sampling_profiler(self):
+        scheduler = Scheduler(SchedulerType.GREEDY_SCHEDULER)
+        self.assertIsNone(scheduler.get_profile())
+        scheduler.start_profiling(every=3)
+        self.decide(scheduler, 9)
+        self.assertEqual(scheduler.profiled, 3)
+        # The profiled decisions aren't timed
+        self.assertEqual(scheduler.get_latency()['count'], 6)
+        profile = scheduler.stop_profiling()
+        functions = {name for _, _, name in profile.stats}
+        self.assertIn('max_scheduling', functions)
+        self.decide(scheduler, 3)
+        self.assertEqual(scheduler.get_latency()['count'], 9)
+        self.assertIsNone(scheduler.get_profile())
+
+
+class TestCityGrid(unittest.TestCase):
+    def setUp(self):
+        self.grid = CityGrid(5, 4, arrival_rate=0.2, seed=3)
+
+    def test_partitions(self):
+        self.assertEqual(self.grid.partitions(2), [(0, 2), (2, 5)])
+        self.assertEqual(self.grid.partitions(8), [(i, i + 1) for i in range(5)])
+
+    def test_vehicles_are_conserved(self):
+        report = self.grid.simulate(200, workers=2)
+        self.assertEqual(report.workers, 2)
+        self.assertGreater(report.arrivals, 0)
+        self.assertGreater(report.exits, 0)
+        self.assertAlmostEqual(report.arrivals, report.exits + report.vehicles, places=6)
+        self.assertAlmostEqual(report.vehicles, self.grid.queues.sum())
+
+    def test_results_do_not_depend_on_partitioning(self):
+        single = self.grid.simulate(100, workers=1)
+        queues = self.grid.queues.copy()
+        split = self.grid.simulate(100, workers=3)
+        np.testing.assert_allclose(self.grid.queues, queues)
+        self.assertEqual(single.arrivals, split.arrivals)
+        self.assertEqual(single.decisions, split.decisions)
+
+    def test_light_states_are_shared(self):
+        self.grid.simulate(30, workers=2)
+        green = self.grid.light_states == TrafficLightState.GREEN.value
+        self.assertTrue(green.any(axis=1).all())
+        self.assertTrue(np.isin(self.grid.light_states, [TrafficLightState.RED.value,
+                                                         TrafficLightState.GREEN.value]).all())
+
+
+class TestStateExport(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.MEDIUM], self.clock)
+        self.control_loop = ControlLoop(self.intersection, Scheduler(SchedulerType.GREEDY_SCHEDULER), 3, self.clock)
+        self.publisher = self.control_loop.publish_state()
+        self.reader = StateReader(self.publisher.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close()
+
+    def test_published_after_decisions(self):
+        self.assertIsNone(self.reader.read().main_light)
+        with quiet():
+            self.control_loop.simulate(50)
+        snapshot = self.reader.read()
+        self.assertEqual(snapshot.sequence % 2, 0)
+        # Published right after the last decision
+        self.assertEqual(snapshot.time, self.intersection.currennt_main_traffic_light.begin_time)
+        self.assertEqual(snapshot.main_light, self.intersection.currennt_main_traffic_light.get_id())
+        traffic_lights = self.intersection.get_all_traffic_lights()
+        self.assertEqual(snapshot.light_ids.tolist(), [tl.get_id() for tl in traffic_lights])
+        self.assertEqual(snapshot.light_states.tolist(), [tl.get_state().value for tl in traffic_lights])
+        self.assertEqual(snapshot.durations.tolist(), [tl.duration for tl in traffic_lights])
+        passages = {p.id: p for tl in traffic_lights for p in tl.get_passages()}
+        self.assertEqual(snapshot.last_opens.tolist(), [passages[i].last_open for i in snapshot.passage_ids])
+
+    def test_read_from_another_process(self):
+        code = (f"from state_export import StateReader; r = StateReader({self.publisher.name!r}); "
+                f"print(r.read().light_ids.tolist()); r.close()")
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        light_ids = [tl.get_id() for tl in self.intersection.get_all_traffic_lights()]
+        self.assertEqual(json.loads(output.stdout), light_ids)
+        self.assertNotIn('leaked', output.stderr)
+        # The block outlives the reader process
+        reader = StateReader(self.publisher.name)
+        self.assertEqual(reader.read().sequence, self.reader.read().sequence)
+        reader.close()
+
+    def test_added_light_is_refused(self):
+        self.intersection.add_traffic_light(TrafficLight([Passage((0, 0), (1, 1), clock=self.clock)], self.clock))
+        with self.assertRaises(ValueError):
+            self.publisher.publish()
+
+    def test_write_in_progress(self):
+        self.publisher.header[SEQUENCE] += 1
+        with self.assertRaises(TimeoutError):
+            self.reader.read(max_retries=10)
+        self.publisher.header[SEQUENCE] += 1
+        self.assertEqual(self.reader.read(max_retries=0).sequence % 2, 0)
+
+    def test_snapshots_are_consistent(self):
+        traffic_lights = self.intersection.get_all_traffic_lights()
+        stop = threading.Event()
+
+        def write():
+            value = 0
+            while not stop.is_set():
+                value += 1
+                for tl in traffic_lights:
+                    tl.begin_time = value
+                self.publisher.publish()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(2000):
+                begin_times = self.reader.read().begin_times
+                self.assertTrue((begin_times == begin_times[0]).all())
+        finally:
+            stop.set()
+            writer.join()
+
+
+class TestBatchGreedyScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersections = [benchmarks.junction_intersection(8, self.clock, seed) for seed in range(5)]
+        self.intersections.append(benchmarks.grid_intersection(30, self.clock))
+        # Passages in their own table, and passages of two tables decided one by one
+        table = PassageTable()
+        self.intersections.append(Intersection([TrafficLight([Passage((0, 0), (1, 1), jam, self.clock, table)],
+                                                             self.clock) for jam in PassageJam]))
+        self.intersections.append(Intersection([TrafficLight([Passage((0, 1), (1, 0), clock=self.clock, table=table)],
+                                                             self.clock),
+                                                TrafficLight([Passage((0, 0), (1, 1), clock=self.clock)], self.clock)]))
+
+    def assert_same_decisions(self, results):
+        expected = [GreedyScheduler.decide_next_step(intersection) for intersection in self.intersections]
+        for (main, lights, duration), (expected_main, expected_lights, expected_duration) in zip(results, expected):
+            self.assertIs(main, expected_main)
+            self.assertEqual(lights, expected_lights)
+            self.assertEqual(duration, expected_duration)
+
+    def test_same_as_greedy(self):
+        rng = random.Random(0)
+        for _ in range(10):
+            self.clock.advance(rng.uniform(1, 30))
+            for intersection in self.intersections:
+                main, lights, duration = GreedyScheduler.decide_next_step(intersection)
+                if rng.random() < 0.5:
+                    with quiet():
+                        intersection.greens_on_for(lights, main, duration)
+                        intersection.make_current_lighters_red()
+                traffic_lights = rng.sample(intersection.indexed_traffic_lights, 2)
+                intersection.update_passage_counts({p.id: rng.randrange(5) for tl in traffic_lights
+                                                    for p in tl.get_passages()})
+            self.assert_same_decisions(BatchGreedyScheduler.decide_next_steps(self.intersections))
+
+    def test_rounded_jam_ties(self):
+        # Different offsets of lights with the same rate can round to the same jam
+        intersection = Intersection([TrafficLight([Passage((0, i), (1, i), clock=self.clock)], self.clock)
+                                     for i in range(3)])
+        first, second = [tl.get_passages()[0] for tl in intersection.indexed_traffic_lights[:2]]
+        first.last_open, second.last_open = 1e-9, 0.0
+        intersection.jam_index.update_passages([first, second])
+        self.clock.advance(1e9)
+        self.intersections = [intersection]
+        results = BatchGreedyScheduler.decide_next_steps(self.intersections)
+        self.assertIs(results[0][0], intersection.indexed_traffic_lights[1])
+        self.assert_same_decisions(results)
+
+    def test_scheduler_batch(self):
+        self.clock.advance(10)
+        scheduler = Scheduler(SchedulerType.GREEDY_SCHEDULER)
+        self.assert_same_decisions(scheduler.decide_next_lights(self.intersections))
+        self.assertEqual(scheduler.get_latency('batch_decision')['count'], 1)
+        self.assertEqual(scheduler.get_counter('batched_decisions'), len(self.intersections) - 1)
+        self.assertEqual(scheduler.get_step_number(), len(self.intersections))
+        scheduler = Scheduler(SchedulerType.CATALOG_SCHEDULER)
+        self.assertEqual(len(scheduler.decide_next_lights(self.intersections)), len(self.intersections))
+        self.assertEqual(scheduler.get_latency()['count'], len(self.intersections))
+
+
+class TestIntersectionSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.traffic_lights = [TrafficLight([Passage((0, 0), (5, 0), clock=self.clock)], self.clock),
+                               TrafficLight([Passage((5, 5), (0, 5), clock=self.clock)], self.clock),
+                               TrafficLight([Passage((2, -1), (2, 6), clock=self.clock)], self.clock)]
+        self.intersection = Intersection(self.traffic_lights)
+
+    def test_snapshot(self):
+        self.intersection.greens_on_for(self.traffic_lights[:2], self.traffic_lights[0], 3)
+        snapshot = self.intersection.get_snapshot()
+        self.assertEqual(snapshot.traffic_lights, tuple(self.traffic_lights))
+        self.assertEqual(snapshot.green_traffic_lights, tuple(self.traffic_lights[:2]))
+        self.assertIs(snapshot.main_traffic_light, self.traffic_lights[0])
+        self.intersection.make_current_lighters_red()
+        self.assertEqual(snapshot.green_traffic_lights, tuple(self.traffic_lights[:2]))
+
+    def test_random_scheduler_uses_real_lights(self):
+        scheduler = Scheduler(SchedulerType.RANDOM_SCHEDULER)
+        main_light, next_lights, duration = scheduler.decide_next_light(self.intersection)
+        self.assertTrue(any(main_light is tl for tl in self.traffic_lights))
+        self.assertTrue(all(any(light is tl for tl in self.traffic_lights) for light in next_lights))
+        self.intersection.greens_on_for(next_lights, main_light, 3)
+        self.clock.advance(3)
+        self.intersection.make_current_lighters_red()
+        self.assertEqual(main_light.get_passages()[0].time_from_last_open(), 0)
+
+
+class TestControlLoop(unittest.TestCase):
+    def make_control_loop(self, duration: float, actions) -> ControlLoop:
+        self.clock = ScriptedClock(actions)
+        self.intersection = Intersection([TrafficLight([Passage((0, 0), (5, 0), clock=self.clock)], self.clock),
+                                          TrafficLight([Passage((5, 5), (0, 5), clock=self.clock)], self.clock)])
+        self.scheduler = Scheduler(SchedulerType.SINGLE_RANDOM_SCHEDULER)
+        return ControlLoop(self.intersection, self.scheduler, duration, self.clock)
+
+    def test_run_sleeps_until_deadline(self):
+        ticks = []
+        control_loop = self.make_control_loop(0.1, [(0.25, lambda: control_loop.stop())])
+        control_loop.add_tick_handler(lambda: ticks.append(self.clock.time()))
+        with quiet():
+            control_loop.run()
+        # The loop only wakes up at the deadlines, and when it is stopped
+        self.assertEqual(self.scheduler.get_step_number(), 3)
+        self.assertEqual(sorted(set(ticks)), [0, 0.1, 0.2])
+        self.assertEqual(self.clock.time(), 0.25)
+
+    def test_wake_on_crosswalk_button(self):
+        def press():
+            control_loop.crosswalk_button(self.intersection.get_current_green_light()[0].get_passages()[0].id)
+
+        # The crosswalk button takes a second off the remaining time, so the loop swaps at 0.5 instead of 1.5
+        control_loop = self.make_control_loop(1.5, [(0.1, press), (0.7, lambda: control_loop.stop())])
+        with quiet():
+            control_loop.run()
+        self.assertEqual(self.scheduler.get_step_number(), 2)
+        self.assertAlmostEqual(self.intersection.currennt_main_traffic_light.begin_time, 0.5)
+
+
+class TestSimulation(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        p1 = Passage((14, 8), (16, 10), clock=self.clock)
+        p2 = Passage((14, 8), (10, 14), clock=self.clock)
+        p3 = Passage((16, 13), (12, 8), clock=self.clock)
+        p4 = Passage((16, 14), (10, 14), clock=self.clock)
+        self.traffic_lights = [TrafficLight([p1, p2], self.clock), TrafficLight([p3], self.clock),
+                               TrafficLight([p4], self.clock)]
+        self.intersection = Intersection(self.traffic_lights)
+
+    def test_virtual_clock(self):
+        passage = self.traffic_lights[0].get_passages()[0]
+        self.clock.advance(5)
+        self.assertEqual(passage.time_from_last_open(), 5)
+        self.traffic_lights[0].green_on_for(3)
+        self.clock.sleep(1)
+        self.assertEqual(self.traffic_lights[0].get_remaining_duration(), 2)
+
+    def test_simulate_day(self):
+        control_loop = ControlLoop(self.intersection, Scheduler(SchedulerType.GREEDY_SCHEDULER), clock=self.clock)
+        start = time.time()
+        with quiet():
+            decisions = control_loop.simulate(24 * 60 * 60)
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(self.clock.time(), 24 * 60 * 60)
+        self.assertGreater(decisions, 1000)
+        for tl in self.traffic_lights:
+            self.assertLess(tl.average_jam_time(), 60)
+
+    def test_simulate_zero_duration(self):
+        control_loop = ControlLoop(self.intersection, Scheduler(SchedulerType.SINGLE_RANDOM_SCHEDULER), clock=self.clock)
+        with quiet():
+            self.assertRaises(ValueError, control_loop.simulate, 60)
+
+    def test_set_clock(self):
+        intersection = Intersection([TrafficLight([Passage((0, 0), (5, 0))])])
+        intersection.set_clock(self.clock)
+        self.clock.advance(7)
+        self.assertEqual(intersection.get_all_traffic_lights()[0].get_traffic_light_jam(), 7 * PassageJam.MEDIUM.value)
+
+
+class TestAsyncController(unittest.TestCase):
+    @staticmethod
+    def make_intersection() -> Intersection:
+        return Intersection([TrafficLight([Passage((0, 0), (5, 0))]), TrafficLight([Passage((5, 5), (0, 5))])])
+
+    @timing_test
+    def test_many_intersections(self):
+        controller = AsyncController()
+        schedulers = [Scheduler(SchedulerType.SINGLE_RANDOM_SCHEDULER) for _ in range(500)]
+        for key, scheduler in enumerate(schedulers):
+            controller.add_intersection(key, self.make_intersection(), scheduler, 0.1)
+
+        async def main():
+            asyncio.get_running_loop().call_later(0.25, controller.stop)
+            await controller.run()
+
+        start = time.monotonic()
+        with quiet():
+            asyncio.run(main())
+        elapsed = time.monotonic() - start
+        # The timers never fire early, a slow machine only makes fewer decisions, and the second deadline
+        # comes before the stop one
+        for scheduler in schedulers:
+            self.assertGreaterEqual(scheduler.get_step_number(), 2)
+            self.assertLessEqual(scheduler.get_step_number(), elapsed / 0.1 + 1)
+
+    @timing_test
+    def test_add_and_remove_while_running(self):
+        controller = AsyncController()
+        first, second = Scheduler(SchedulerType.SINGLE_RANDOM_SCHEDULER), Scheduler(SchedulerType.GREEDY_SCHEDULER)
+        # Long enough for the first intersection to be removed before its second decision, however slow the sleeps
+        controller.add_intersection('first', self.make_intersection(), first, 60)
+
+        async def script():
+            await asyncio.sleep(0.03)
+            controller.add_intersection('second', self.make_intersection(), second)
+            await asyncio.sleep(0.03)
+            intersection = controller.remove_intersection('first')
+            self.assertEqual(intersection.get_current_green_light(), [])
+            self.assertRaises(KeyError, controller.get_intersection, 'first')
+            # The second intersection's first decision is taken on the next timer
+            while not second.get_step_number():
+                await asyncio.sleep(0.01)
+            controller.stop()
+
+        async def main():
+            await asyncio.gather(controller.run(), script())
+
+        with quiet():
+            asyncio.run(asyncio.wait_for(main(), 30))
+        self.assertEqual(first.get_step_number(), 1)
+        self.assertEqual(second.get_step_number(), 1)
+
+
+class TestJamIndex(unittest.TestCase):
+    def setUp(self):
+        random.seed(5)
+        self.clock = VirtualClock(1000)
+        passages = [Passage((random.randint(0, 9), random.randint(0, 9)), (random.randint(0, 9), random.randint(0, 9)),
+                            random.choice(list(PassageJam)), self.clock) for _ in range(30)]
+        self.traffic_lights = [TrafficLight(random.sample(passages, random.randint(1, 3)), self.clock)
+                               for _ in range(15)]
+        self.intersection = Intersection(self.traffic_lights)
+
+    def assert_sorted_by_jam(self):
+        expected = sorted(self.traffic_lights, key=lambda tl: tl.get_traffic_light_jam(), reverse=True)
+        self.assertEqual(self.intersection.get_traffic_lights_by_jam(), expected)
+        self.assertIs(self.intersection.jam_index.get_max_jam_traffic_light(), expected[0])
+        for tl in self.traffic_lights:
+            self.assertAlmostEqual(self.intersection.jam_index.get_jam(tl), tl.get_traffic_light_jam())
+
+    def test_order_follows_resets(self):
+        for _ in range(20):
+            self.clock.advance(random.randint(1, 30))
+            self.assert_sorted_by_jam()
+            self.intersection.greens_on_for(random.sample(self.traffic_lights, 2), self.traffic_lights[0], 1)
+            self.clock.advance(random.randint(1, 30))
+            with quiet():
+                self.intersection.make_current_lighters_red()
+            self.assert_sorted_by_jam()
+
+    def test_set_clock(self):
+        clock = VirtualClock(50)
+        self.intersection.set_clock(clock)
+        clock.advance(3)
+        self.traffic_lights[0].green_on_for(1)
+        self.traffic_lights[0].red_on()
+        clock.advance(3)
+        self.assert_sorted_by_jam()
+
+    def test_rate_change(self):
+        self.clock.advance(20)
+        last = self.intersection.get_traffic_lights_by_jam()[-1]
+        for p in last.get_passages():
+            p.rate = PassageJam.EXTREME_HIGH
+        self.clock.advance(1000)
+        self.assert_sorted_by_jam()
+        self.assertLess(self.intersection.get_traffic_lights_by_jam().index(last), len(self.traffic_lights) - 1)
+
+    def test_light_set_clock(self):
+        clock = VirtualClock(50)
+        for tl in self.traffic_lights:
+            tl.set_clock(clock)
+        self.assertIs(self.intersection.jam_index.clock, clock)
+        clock.advance(7)
+        self.assert_sorted_by_jam()
+        with self.assertRaises(ValueError):
+            self.intersection.add_traffic_light(TrafficLight([Passage((0, 0), (1, 1), clock=self.clock)], self.clock))
+
+
+class TestEventRecorder(unittest.TestCase):
+    def test_ring_buffer_drops_oldest(self):
+        recorder = EventRecorder(StdoutSink(), capacity=4)
+        recorder.thread = threading.current_thread()  # Keep the background thread from taking the events
+        for step in range(6):
+            recorder.record(EventType.DECISION, step, None, step)
+        self.assertEqual([e.subject_id for e in recorder.take()], [2, 3, 4, 5])
+        self.assertEqual(recorder.dropped, 2)
+
+    def test_file_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.log')
+            previous = set_recorder(EventRecorder(FileSink(path), flush_interval=0.01))
+            try:
+                traffic_light = TrafficLight([Passage((0, 0), (5, 0))])
+                traffic_light.green_on_for(2.5)
+                traffic_light.red_on()
+            finally:
+                set_recorder(previous).close()
+            with open(path) as f:
+                self.assertEqual(f.read().splitlines(), [f"traffic light number: {traffic_light.id} being green for: 2.5",
+                                                         f"traffic light number: {traffic_light.id} being red"])
+
+    def test_replaced_recorder_is_stopped(self):
+        recorder = EventRecorder(StdoutSink(), flush_interval=60)
+        previous = set_recorder(recorder)
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                recorder.record(EventType.DECISION, 1, None, 0)
+                self.assertTrue(recorder.thread.is_alive())
+                thread = recorder.thread
+                set_recorder(previous)
+                self.assertFalse(thread.is_alive())
+                self.assertEqual(output.getvalue(), "*******iteration number 1 in time: 0********\n")
+                # Recording again restarts it
+                recorder.record(EventType.DECISION, 2, None, 0)
+                self.assertIsNotNone(recorder.thread)
+        finally:
+            recorder.close()
+
+    def test_fork_drops_parent_events(self):
+        recorder = EventRecorder(StdoutSink())
+        recorder.thread = threading.current_thread()  # Keep the background thread from taking the events
+        recorder.record(EventType.DECISION, 1, None, 0)
+        recorder.after_fork()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            recorder.stop()
+        self.assertEqual(output.getvalue(), '')
+
+    def test_stdout_sink(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            StdoutSink().write([Event(EventType.DECISION, 3, None, 12.7)])
+        self.assertEqual(output.getvalue(), "*******iteration number 3 in time: 12********\n")
+
+
+class TestPassageTable(unittest.TestCase):
+    def setUp(self):
+        random.seed(9)
+        self.clock = VirtualClock(100)
+        self.table = PassageTable(capacity=2)
+        self.passages = [Passage((random.randint(0, 9), random.randint(0, 9)),
+                                 (random.randint(0, 9), random.randint(0, 9)),
+                                 random.choice(list(PassageJam)), self.clock, self.table) for _ in range(20)]
+        self.traffic_lights = [TrafficLight(random.sample(self.passages, random.randint(1, 4)), self.clock)
+                               for _ in range(10)]
+        self.intersection = Intersection(self.traffic_lights)
+
+    def test_passage_view(self):
+        passage = Passage((1, 2), (3, 4), PassageJam.HIGH, self.clock, self.table)
+        self.assertEqual(self.table.size, 21)
+        self.assertEqual((passage.source, passage.target, passage.rate), ((1, 2), (3, 4), PassageJam.HIGH))
+        self.assertEqual((passage.x_min, passage.x_max), (1, 3))
+        self.clock.advance(5)
+        passage.update_time()
+        self.assertEqual(self.table.last_opens[passage.row], 105)
+        copy_passage = copy.deepcopy(passage)
+        self.clock.advance(5)
+        copy_passage.update_time()
+        self.assertEqual((passage.last_open, copy_passage.last_open), (105, 110))
+        self.assertEqual(copy_passage.id, passage.id)
+
+    def test_rows_are_reused(self):
+        passage = Passage((1, 2), (3, 4), PassageJam.HIGH, self.clock, self.table)
+        row = passage.row
+        del passage
+        for _ in range(3):
+            passage = Passage((5, 6), (7, 8), PassageJam.LOW, self.clock, self.table)
+            self.assertEqual(passage.row, row)
+            self.assertEqual((passage.source, passage.rate), ((5, 6), PassageJam.LOW))
+            copy.deepcopy(passage)
+            del passage
+        self.assertEqual(self.table.size, 22)
+
+    def test_concurrent_adds(self):
+        table = PassageTable(capacity=1)
+        kept = [[] for _ in range(4)]
+
+        def add(passages):
+            for i in range(300):
+                passage = Passage((i, len(passages)), (i, 0), clock=self.clock, table=table)
+                if i % 2:
+                    passages.append(passage)
+
+        threads = [threading.Thread(target=add, args=(passages,)) for passages in kept]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        passages = [p for passages in kept for p in passages]
+        self.assertEqual(len({p.row for p in passages}), len(passages))
+        for p in passages:
+            self.assertEqual(p.source, (p.line.x1, p.line.y1))
+
+    def test_mixed_tables(self):
+        tables = [self.table, PassageTable(), self.table]
+        intersection = Intersection([TrafficLight([Passage((0, i), (1, i), clock=self.clock, table=table)], self.clock)
+                                     for i, table in enumerate(tables)])
+        self.clock.advance(3)
+        self.assertIsNone(intersection.passage_table)
+        self.assertTrue(intersection.mixed_tables)
+        self.assertEqual(intersection.get_traffic_light_jams().tolist(),
+                         [tl.get_traffic_light_jam() for tl in intersection.indexed_traffic_lights])
+
+    def test_shallow_copy_has_its_own_row(self):
+        passage = self.passages[0]
+        values = passage.source, passage.target, passage.rate, passage.last_open, passage.count
+        copied = copy.copy(passage)
+        self.assertNotEqual(copied.row, passage.row)
+        self.assertEqual((copied.id, copied.source, copied.rate), (passage.id, passage.source, passage.rate))
+        del copied
+        Passage((9, 9), (8, 8), PassageJam.EXTREME_HIGH, self.clock, self.table).count = 7
+        self.assertEqual((passage.source, passage.target, passage.rate, passage.last_open, passage.count), values)
+
+    def test_vectorized_jams(self):
+        for _ in range(5):
+            self.clock.advance(random.randint(1, 20))
+            for tl in random.sample(self.traffic_lights, 3):
+                tl.green_on_for(1)
+                tl.red_on()
+            self.clock.advance(random.randint(1, 20))
+            np.testing.assert_allclose(self.intersection.get_traffic_light_jams(),
+                                       [tl.get_traffic_light_jam() for tl in self.traffic_lights])
+            np.testing.assert_allclose(self.intersection.get_average_jam_times(),
+                                       [tl.average_jam_time() for tl in self.traffic_lights])
+
+
+class TestSegment(unittest.TestCase):
+    # Budget (in seconds) for importing everything main.py needs in a fresh interpreter
+    COLD_START_BUDGET = 1.5
+
+    def test_matches_shapely(self):
+        from shapely.geometry import LineString
+        rnd = random.Random(4)
+        for _ in range(3000):
+            # Small coordinates make collinear, touching and zero length segments common
+            c1, c2 = [rnd.randint(0, 4) for _ in range(4)], [rnd.randint(0, 4) for _ in range(4)]
+            s1, s2 = Segment(*c1), Segment(*c2)
+            l1, l2 = LineString([c1[:2], c1[2:]]), LineString([c2[:2], c2[2:]])
+            self.assertEqual(s1.intersects(s2), l1.intersects(l2), (c1, c2))
+            self.assertEqual(s1 != s2, l1 != l2)
+            self.assertEqual(s1.bounds, l1.bounds)
+
+    def test_geometry_is_lazy(self):
+        passage = Passage((0, 0), (5, 5))
+        self.assertIsNone(passage.line_string)
+        self.assertEqual(list(passage.geometry.coords), [(0, 0), (5, 5)])
+        self.assertIs(passage.geometry, passage.line_string)
+
+    def test_cold_start(self):
+        code = "import time; start = time.perf_counter(); import main, sys; " \
+               "print(time.perf_counter() - start, 'shapely' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        self.assertLess(float(output[0]), self.COLD_START_BUDGET)
+        self.assertEqual(output[1], 'False')
+
+
+class TestLayoutFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'layout.json')
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.LOW, PassageJam.HIGH], VirtualClock())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def conflicts(self, intersection):
+        return [[TrafficLight.can_work_together([t1, t2]) for t2 in intersection.get_all_traffic_lights()]
+                for t1 in intersection.get_all_traffic_lights()]
+
+    def test_round_trip(self):
+        LayoutFile.save(self.intersection, self.path)
+        loaded = LayoutFile.load(self.path, VirtualClock())
+        def describe(intersection):
+            return [[(p.source, p.target, p.rate) for p in tl.get_passages()]
+                    for tl in intersection.get_all_traffic_lights()]
+
+        self.assertEqual(describe(loaded), describe(self.intersection))
+        self.assertEqual(self.conflicts(loaded), self.conflicts(self.intersection))
+        self.assertEqual(self.conflicts(LayoutFile.load(self.path, use_cache=False)), self.conflicts(self.intersection))
+
+    def test_cache(self):
+        LayoutFile.save(self.intersection, self.path, use_cache=False)
+        self.assertEqual([f for f in os.listdir(self.directory.name) if f.endswith('.npy')], [])
+        LayoutFile.load(self.path)
+        cache_files = [f for f in os.listdir(self.directory.name) if f.endswith('.npy')]
+        self.assertEqual(len(cache_files), 1)
+        cache_path = os.path.join(self.directory.name, cache_files[0])
+        coordinates = np.array([[0, 0, 2, 2], [0, 2, 2, 0]], dtype=np.float64)
+        self.assertNotEqual(LayoutFile.cache_path(self.path, coordinates), cache_path)
+
+        # The cache holds the conflicting pairs, as the index writes them
+        pairs = np.load(cache_path)
+        self.assertEqual(pairs.shape[1], 2)
+        LayoutFile.save(self.intersection, self.path)
+        np.testing.assert_array_equal(np.load(cache_path), pairs)
+
+        # A cached array is used as it is, even if it is wrong
+        np.save(cache_path, np.empty((0, 2), dtype=np.int64))
+        loaded = LayoutFile.load(self.path)
+        self.assertTrue(all(all(row) for row in self.conflicts(loaded)))
+
+        # A corrupted cache is recalculated
+        with open(cache_path, 'wb') as f:
+            f.write(b'broken')
+        self.assertEqual(self.conflicts(LayoutFile.load(self.path)), self.conflicts(self.intersection))
+        np.testing.assert_array_equal(np.load(cache_path), pairs)
+
+        # So is a cache of the former dense matrix format
+        n_passages = len(self.intersection.conflict_index.passages)
+        np.save(cache_path, np.ones((n_passages, n_passages), dtype=np.bool_))
+        self.assertEqual(self.conflicts(LayoutFile.load(self.path)), self.conflicts(self.intersection))
+        np.testing.assert_array_equal(np.load(cache_path), pairs)
+
+    def test_main_layout(self):
+        loaded = LayoutFile.load(MAIN_LAYOUT_PATH, VirtualClock(), use_cache=False)
+        self.assertEqual(self.conflicts(loaded), self.conflicts(self.intersection))
+
+    def test_names_round_trip(self):
+        LayoutFile.save(LayoutFile.load(MAIN_LAYOUT_PATH, use_cache=False), self.path, use_cache=False)
+        with open(MAIN_LAYOUT_PATH) as original, open(self.path) as saved:
+            names = [{p['name']: p['source'] + p['target'] for p in json.load(f)['passages']} for f in (original, saved)]
+        self.assertEqual(names[1], names[0])
+
+    def test_invalid_traffic_light(self):
+        with open(self.path, 'w') as f:
+            json.dump({'passages': [{'source': [0, 0], 'target': [1, 1]}], 'traffic_lights': [[0, 1]]}, f)
+        with self.assertRaises(ValueError):
+            LayoutFile.load(self.path)
+
+
+class TestQueueModel(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.MEDIUM], self.clock)
+
+    def test_conservation(self):
+        model = QueueModel(self.intersection, seed=3, update_traffic_jam=True)
+        control_loop = ControlLoop(self.intersection, Scheduler(SchedulerType.GREEDY_SCHEDULER), 3, self.clock)
+        with quiet():
+            report = model.simulate(control_loop, 600)
+        self.assertEqual(report.simulated_time, 600)
+        self.assertAlmostEqual(report.arrivals, report.departures + model.queues.sum(), delta=1)
+        self.assertGreater(report.throughput, 0)
+        self.assertGreaterEqual(report.max_queue, 0)
+        self.assertEqual([p.count for p in model.passages], np.rint(model.queues).astype(int).tolist())
+        self.assertEqual([tl.traffic_jam for tl in self.intersection.get_all_traffic_lights()],
+                         [sum(p.count for p in tl.get_passages()) for tl in self.intersection.get_all_traffic_lights()])
+
+    def test_queue_changes_decision(self):
+        # A long queue at a passage of a light that wouldn't be chosen first makes it the next main light
+        first, *_ = GreedyScheduler.decide_next_step(self.intersection)
+        other = next(tl for tl in self.intersection.get_all_traffic_lights()
+                     if not set(tl.get_passages()) & set(first.get_passages()))
+        model = QueueModel(self.intersection, seed=1, update_traffic_jam=True)
+        model.arrival_rates[:] = 0
+        model.arrival_rates[model.passages.index(other.get_passages()[0])] = 10
+        model.advance(60)
+        self.assertIs(GreedyScheduler.decide_next_step(self.intersection)[0], other)
+
+    def test_always_green(self):
+        # With every passage green and a large saturation flow, no vehicle waits
+        passages = TrafficLight.passages_from_traffic_lights(self.intersection.get_all_traffic_lights())
+        model = QueueModel(self.intersection, saturation_flows=np.full(len(passages), 100.0), seed=1)
+        model.set_green_traffic_lights(self.intersection.get_all_traffic_lights())
+        model.advance(1000)
+        report = model.report()
+        self.assertEqual(report.arrivals, report.departures)
+        self.assertEqual((report.mean_delay, report.p95_delay, report.max_queue), (0, 1, 0))
+        self.assertAlmostEqual(report.throughput, 3600 * sum(0.05 * p.rate.value for p in passages), delta=300)
+
+    def test_always_red(self):
+        model = QueueModel(self.intersection, arrival_rates=np.full(6, 0.1), seed=1)
+        model.advance(1000)
+        report = model.report()
+        self.assertEqual(report.departures, 0)
+        self.assertAlmostEqual(report.mean_delay, 500, delta=50)
+        self.assertAlmostEqual(report.mean_queue, 50, delta=5)
+
+    def test_seed(self):
+        reports = []
+        for _ in range(2):
+            clock = VirtualClock()
+            intersection = build_intersection(MAIN_LAYOUT, [PassageJam.HIGH], clock)
+            control_loop = ControlLoop(intersection, Scheduler(SchedulerType.GREEDY_SCHEDULER), 3, clock)
+            with quiet():
+                reports.append(QueueModel(intersection, seed=7).simulate(control_loop, 300))
+        self.assertEqual(reports[0], reports[1])
+
+
+class TestSensorFeed(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.MEDIUM], self.clock)
+        self.traffic_lights = self.intersection.get_all_traffic_lights()
+        self.passages = TrafficLight.passages_from_traffic_lights(self.traffic_lights)
+
+    def test_parse(self):
+        events, malformed = SensorFeed.parse(b'1 5\n\n2 x\n3 4 5\n 4  7 \n')
+        self.assertEqual((events, malformed), ([(1, 5), (4, 7)], 2))
+
+    def test_socket(self):
+        reader, writer = socket.socketpair()
+        feed = SensorFeed(reader.makefile('rb')).start()
+        p1, p2 = self.passages[0], self.passages[3]
+        # Split lines and repeated passages, the latest count wins
+        writer.sendall(f'{p1.id} 3\n{p2.id} 1\n{p1.id} '.encode())
+        writer.sendall(f'8\n999999 4\n'.encode())
+        writer.close()
+        self.assertTrue(feed.wait(5))
+        self.assertEqual(feed.events, 4)
+        self.assertEqual(feed.apply(self.intersection), 2)
+        self.assertEqual((p1.count, p2.count), (8, 1))
+        for tl in self.traffic_lights:
+            self.assertEqual(tl.get_traffic_jam(), sum(p.count for p in tl.get_passages()))
+        self.assertEqual(feed.apply(self.intersection), 0)
+        reader.close()
+
+    def test_jam_uses_counts(self):
+        self.clock.advance(10)
+        jams = [tl.get_traffic_light_jam() for tl in self.traffic_lights]
+        self.intersection.update_passage_counts({self.traffic_lights[-1].get_passages()[0].id: 100})
+        self.assertEqual(self.intersection.get_traffic_lights_by_jam()[0], self.traffic_lights[-1])
+        self.assertEqual(self.traffic_lights[-1].get_traffic_light_jam(), jams[-1] + 100)
+        np.testing.assert_allclose(self.intersection.get_traffic_light_jams(),
+                                   [tl.get_traffic_light_jam() for tl in self.traffic_lights])
+        for tl in self.traffic_lights:
+            self.assertAlmostEqual(self.intersection.jam_index.get_jam(tl), tl.get_traffic_light_jam())
+
+    def test_control_loop(self):
+        passage = self.traffic_lights[-1].get_passages()[0]
+        feed = SensorFeed(io.BytesIO(f'{passage.id} 1000\n'.encode())).start()
+        self.assertTrue(feed.wait(5))
+        control_loop = ControlLoop(self.intersection, Scheduler(SchedulerType.GREEDY_SCHEDULER), 3, self.clock)
+        feed.attach(control_loop)
+        control_loop.tick()
+        with quiet():
+            control_loop.step()
+        self.assertIs(self.intersection.currennt_main_traffic_light, self.traffic_lights[-1])
+
+
+class TestCrosswalkButtons(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.intersection = build_intersection(MAIN_LAYOUT, [PassageJam.MEDIUM], self.clock)
+        self.traffic_lights = self.intersection.get_all_traffic_lights()
+        self.buttons = CrosswalkButtons(self.clock, debounce_time=1)
+
+    def test_debounce(self):
+        self.assertTrue(self.buttons.press(1))
+        self.assertFalse(self.buttons.press(1))
+        self.assertTrue(self.buttons.press(2))
+        self.assertEqual(self.buttons.take(), [1, 2])
+        self.clock.advance(0.5)
+        self.assertFalse(self.buttons.press(1))
+        self.clock.advance(0.5)
+        self.assertTrue(self.buttons.press(1))
+        self.assertEqual((self.buttons.presses, self.buttons.ignored), (3, 2))
+
+    def test_apply(self):
+        with quiet():
+            self.intersection.greens_on_for([self.traffic_lights[0]], self.traffic_lights[0], 10)
+        red_passage = self.traffic_lights[2].get_passages()[0]
+        green_passage = self.traffic_lights[0].get_passages()[1]
+        self.assertEqual(self.intersection.get_passage_traffic_lights(green_passage.id), [self.traffic_lights[0]])
+        self.buttons.press(red_passage.id)
+        self.assertEqual(self.buttons.apply(self.intersection), 0)
+        self.assertEqual(self.intersection.get_remaining_time(), 10)
+        self.buttons.press(green_passage.id)
+        # Presses only apply on the next tick
+        self.assertEqual(self.intersection.get_remaining_time(), 10)
+        self.assertEqual(self.buttons.apply(self.intersection), 1)
+        self.assertEqual(self.intersection.get_remaining_time(), 9)
+
+    def test_concurrent_presses(self):
+        buttons = CrosswalkButtons(debounce_time=60)
+        passage_ids = list(range(2000))
+
+        def press_all():
+            for passage_id in passage_ids:
+                buttons.press(passage_id)
+
+        threads = [threading.Thread(target=press_all) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(buttons.take()), passage_ids)
+        self.assertEqual((buttons.presses, buttons.ignored), (2000, 7 * 2000))
+
+
+class TestSweep(unittest.TestCase):
+    def test_run_sweep(self):
+        results = run_sweep({'main': MAIN_LAYOUT}, [SchedulerType.SINGLE_RANDOM_SCHEDULER, SchedulerType.GREEDY_SCHEDULER],
+                            {'medium': [PassageJam.MEDIUM]}, range(2), simulated_time=600, processes=2)
+        self.assertEqual([(r.scheduler_type, r.seed) for r in results],
+                         [(SchedulerType.SINGLE_RANDOM_SCHEDULER, 0), (SchedulerType.SINGLE_RANDOM_SCHEDULER, 1),
+                          (SchedulerType.GREEDY_SCHEDULER, 0), (SchedulerType.GREEDY_SCHEDULER, 1)])
+        for r in results:
+            self.assertGreater(r.decisions, 0)
+            self.assertLessEqual(r.average_wait, r.max_starvation)
+        # The greedy scheduler doesn't depend on the seed
+        self.assertEqual(results[2][4:7], results[3][4:7])
+
+    def test_build_intersection_shares_passages(self):
+        intersection = build_intersection([[((0, 0), (5, 0))], [((0, 0), (5, 0)), ((5, 5), (0, 5))]],
+                                          [PassageJam.LOW, PassageJam.HIGH], VirtualClock())
+        first, second = intersection.get_all_traffic_lights()
+        self.assertIs(first.get_passages()[0], second.get_passages()[0])
+        self.assertEqual(second.get_passages()[1].rate, PassageJam.HIGH)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generators(self):
+        for layout, generator in benchmarks.GENERATORS.items():
+            self.assertEqual(len(generator(32, VirtualClock()).get_all_traffic_lights()), 32)
+
+    def test_compare(self):
+        results = benchmarks.run_benchmarks([4], ['grid'], 0.01)
+        metrics = results['grid-4']
+        self.assertIn('greedy_scheduler_decisions_per_second', metrics)
+        self.assertEqual(benchmarks.compare(results, results, 0.3), [])
+        baseline = {'grid-4': {'memory_bytes': metrics['memory_bytes'] / 2,
+                               'light_checks_per_second': metrics['light_checks_per_second'] * 2}}
+        self.assertEqual(len(benchmarks.compare(results, baseline, 0.3)), 2)
+
+    def test_baseline_covers_cases(self):
+        with open(benchmarks.BASELINE_PATH) as f:
+            baseline = json.load(f)
+        self.assertEqual(set(baseline['host']), set(benchmarks.host_info()))
+        metrics = benchmarks.run_benchmarks([4], ['grid'], 0.01)['grid-4']
+        for layout, size in itertools.product(benchmarks.LAYOUTS, benchmarks.SIZES):
+            self.assertEqual(set(baseline['results'][f'{layout}-{size}']), set(metrics))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
-from time import time
-from enums import TrafficLightState
+from enums import TrafficLightState, EventType
+from event_recorder import get_recorder
+from clock import Clock, SYSTEM_CLOCK
 from passage import Passage
 from typing import List
 from functools import reduce
@@ -16,16 +17,26 @@ class TrafficLight:
     by changing its state between red and green."""
     counter = 1
 
-    def __init__(self, passages: List[Passage]):
-        """Initialize a new TrafficLight object."""
+    def __init__(self, passages: List[Passage], clock: Clock = SYSTEM_CLOCK):
+        """Initialize a new TrafficLight object.
+
+        Args:
+            passages (List[Passage]): The passages the traffic light allows.
+            clock (Clock): The clock used to measure the green durations.
+        """
         self.id = TrafficLight.counter
         TrafficLight.counter += 1
         self.passages_allow = passages
         self.state = TrafficLightState.RED
         self.traffic_jam = 0
-        self.begin_time = time()
+        self.clock = clock
+        self.begin_time = clock.time()
         self.duration = 0
         self.last_time_green = 0
+        self.conflict_index = None
+        self.bit = 0
+        self.conflict_mask = 0
+        self.jam_index = None
 
     def set_state(self, state: TrafficLightState):
         """Set the state of the TrafficLight.
@@ -41,9 +52,9 @@ class TrafficLight:
         Args:
             duration (float): The duration for which the TrafficLight will remain green (in seconds).
         """
-        print(f"traffic light number: {self.id} being green for: {duration}")
         self.set_state(TrafficLightState.GREEN)
-        self.begin_time = time()
+        self.begin_time = self.clock.time()
+        get_recorder().record(EventType.GREEN, self.id, duration, self.begin_time)
         self.duration = duration
 
     def red_on(self):
@@ -52,11 +63,13 @@ class TrafficLight:
         This method is called when the TrafficLight changes from green to red.
         """
         if self.state == TrafficLightState.GREEN:
-            print(f"traffic light number: {self.id} being red")
             self.set_state(TrafficLightState.RED)
-            self.last_time_green = time()
+            self.last_time_green = self.clock.time()
+            get_recorder().record(EventType.RED, self.id, None, self.last_time_green)
             for p in self.passages_allow:
                 p.update_time()
+            if self.jam_index:
+                self.jam_index.update_passages(self.passages_allow)
 
     def get_traffic_jam(self) -> int:
         """Get the traffic jam status of the TrafficLight.
@@ -88,7 +101,20 @@ class TrafficLight:
         Returns:
             float: The current duration of the green light (in seconds).
         """
-        return time() - self.begin_time
+        return self.clock.time() - self.begin_time
+
+    def set_clock(self, clock: Clock):
+        """Set the clock of the TrafficLight and its passages, restarting their timers.
+
+        Args:
+            clock (Clock): The new clock.
+        """
+        self.clock = clock
+        self.begin_time = clock.time()
+        for p in self.passages_allow:
+            p.set_clock(clock)
+        if self.jam_index:
+            self.jam_index.set_clock(self)
 
     def get_passages(self) -> List[Passage]:
         return self.passages_allow
@@ -123,7 +149,7 @@ class TrafficLight:
         Calculate the traffic light jam value for the current intersection.
 
         The traffic light jam value is computed as the sum of the product of each passage's rate
-        and the time elapsed since it was last open.
+        and the time elapsed since it was last open, plus the vehicles counted at the passages (see Passage.get_jam).
 
         Returns:
             float: The traffic light jam value for the current intersection.
@@ -135,7 +161,7 @@ class TrafficLight:
             # time_from_last = p.time_from_last_open()
             # val += p.rate.value * time_from_last
             # print(f"id: {self.id}, passage {i} from last: {time_from_last} val= {val}")
-            val += p.rate.value * p.time_from_last_open()
+            val += p.get_jam()
         return val
 
     @staticmethod
@@ -166,9 +192,57 @@ class TrafficLight:
         Returns:
             bool: True if the traffic lights can work together without overlapping passages, False otherwise.
         """
+        if TrafficLight.shared_conflict_index(traffic_lights):
+            # All the traffic lights belong to the same intersection, answer from their conflict masks
+            mask = TrafficLight.lights_mask(traffic_lights)
+            return not any(tl.conflict_mask & mask for tl in traffic_lights)
         passges_allowed = TrafficLight.passages_from_traffic_lights(traffic_lights)
         return Passage.is_action_valid(passges_allowed)
 
+    @staticmethod
+    def shared_conflict_index(traffic_lights: List['TrafficLight']):
+        """
+        Get the conflict index of the intersection all the traffic lights belong to.
+
+        Args:
+            traffic_lights (List[TrafficLight]): A list of TrafficLight objects.
+
+        Returns:
+            PassageConflictIndex or None: The shared conflict index, or None if the traffic lights don't belong
+            to the same intersection.
+        """
+        conflict_index = traffic_lights[0].conflict_index if traffic_lights else None
+        if conflict_index and all(tl.conflict_index is conflict_index for tl in traffic_lights):
+            return conflict_index
+        return None
+
+    @staticmethod
+    def lights_mask(traffic_lights: List['TrafficLight']) -> int:
+        """
+        Get the bitmask of a list of traffic lights of the same intersection.
+
+        Args:
+            traffic_lights (List[TrafficLight]): A list of TrafficLight objects.
+
+        Returns:
+            int: The bitwise or of the bits of the traffic lights.
+        """
+        mask = 0
+        for tl in traffic_lights:
+            mask |= tl.bit
+        return mask
+
+    def can_join(self, mask: int) -> bool:
+        """Check if this TrafficLight can work together with a valid set of traffic lights of its intersection.
+
+        Args:
+            mask (int): The bitmask of the traffic lights set.
+
+        Returns:
+            bool: True if adding this TrafficLight to the set keeps it valid, False otherwise.
+        """
+        return not self.conflict_mask & (mask | self.bit)
+
     # def can_work_with(self, other: 'TrafficLight') -> bool:
     #     """Check if this TrafficLight can work with another TrafficLight.
     #